@@ -53,48 +53,48 @@ except Exception as e:
 # --- HISTORICAL MANAGER PAGE ---
 if selected_page == "Historical Manager":
     st.header("Historical Data Manager")
-    from masterfile_handler import batch_symbols
-    from historical_handler import update_all_from_master
+    import time
+    import pandas as pd
+    from backfill_engine import BackfillJob
 
     session_key = session.get("api_session_key")
     seg = st.selectbox("Master Segment", ["NSE_CASH", "NSE_FNO", "ALL"])
-    batch_size = st.number_input("Batch size", min_value=50, max_value=1000, value=500, step=50)
     timeframe = st.selectbox("Timeframe", ["day", "minute"])
     start_date = st.text_input("Start date (ddMMyyyy or ddMMyyyyHHMM)", "01012020")
+    workers = st.number_input("Parallel workers", min_value=1, max_value=16, value=4, step=1)
+    resume = st.checkbox("Resume from last checkpoint", value=True)
 
-    def run_historical_batch():
-        done = 0  # variable for nonlocal
+    # the job runs on its own thread; every rerun just reads its progress
+    job = st.session_state.get("backfill_job")
+    running = bool(job and job.is_running())
+    col_start, col_stop = st.columns(2)
+    if col_start.button("Start backfill (from master)", disabled=running):
+        job = BackfillJob(session_key, master_segment=seg, timeframe=timeframe, start_date=start_date,
+                          workers=int(workers), resume=resume).start()
+        st.session_state["backfill_job"] = job
+        st.session_state["backfill_log"] = []
+        running = True
+    if col_stop.button("Stop", disabled=not running):
+        job.stop()
 
-        if st.button("Run update for next batch (from master)"):
-            progress_bar = st.progress(0)
-            batch_iter = batch_symbols(seg, batch_size)
-            try:
-                first_batch = next(batch_iter)
-            except StopIteration:
-                st.info("No symbols found in master. Please download master first.")
-                first_batch = []
-
-            if first_batch:
-                total = len(first_batch)
-
-                def progress_cb(token, idx, total_local, status, rows):
-                    nonlocal done
-                    done = idx
-                    progress_bar.progress(min(1.0, done/total))
-                    st.write(f"{idx}/{total} — token={token} status={status} rows={rows}")
-
-                results = update_all_from_master(
-                    session_key,
-                    master_segment=seg,
-                    batch_size=batch_size,
-                    timeframe=timeframe,
-                    start_date=start_date,
-                    sleep_per=0.06,
-                    progress=progress_cb
-                )
-                st.success("Batch update requested (check logs above).")
-
-    run_historical_batch()
+    if job:
+        snap = job.snapshot()
+        st.progress(min(1.0, snap["done"] / snap["total"]) if snap["total"] else 0.0)
+        eta = f", ETA {snap['eta']:.0f}s" if snap["eta"] else ""
+        st.write(
+            f"{snap['state']}: {snap['done']}/{snap['total']} symbols — {snap['ok']} ok, {snap['failed']} failed, "
+            f"{snap['skipped']} already current, {snap['rows']} rows, {snap['per_sec']:.1f} symbols/s{eta}"
+        )
+        if snap["error"]:
+            st.error(snap["error"])
+        log = st.session_state.setdefault("backfill_log", [])
+        log.extend(e for e in job.drain_events() if "token" in e)
+        del log[:-200]
+        if log:
+            st.dataframe(pd.DataFrame(log[::-1]), use_container_width=True)
+        if job.is_running():
+            time.sleep(1)
+            st.rerun()
 
 # --- LOAD OTHER PAGES DYNAMICALLY ---
 else:
@@ -0,0 +1,254 @@
+# backfill_engine.py
+# Parallel, resumable historical backfill.
+# A BackfillJob runs update_incremental for every symbol of a master with a
+# pool of worker threads (paced by the shared rate limiter in http_client),
+# appends each finished symbol to a JSONL checkpoint so a killed run resumes
+# where it stopped, and publishes progress events on a queue the UI polls.
+# A run that finishes moves its checkpoint aside (finished_path), so the next
+# run, e.g. tomorrow's incremental update, starts over instead of skipping everything.
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from debug_utils import debug_log
+import historical_catalog
+from historical_utils import update_incremental
+from masterfile_handler import get_symbols_from_master
+
+CHECKPOINT_DIR = os.path.join("data", "historical", "backfill")
+DEFAULT_WORKERS = 4
+
+
+def checkpoint_path(master_segment: str, timeframe: str, start_date: Optional[str] = None) -> str:
+    name = f"{master_segment}_{timeframe}_{start_date or 'auto'}.jsonl"
+    return os.path.join(CHECKPOINT_DIR, name)
+
+
+def finished_path(path: str) -> str:
+    """
+    Where the checkpoint of the last finished run is kept (one, replaced each time).
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.finished{ext}"
+
+
+def read_checkpoint(path: str) -> Dict[str, Dict]:
+    """
+    token -> last checkpoint entry. Torn last lines (killed mid-write) are ignored.
+    """
+    done: Dict[str, Dict] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[str(entry.get("token"))] = entry
+    return done
+
+
+class BackfillJob:
+    """
+    Backfill `symbols` (default: every symbol of master_segment) for one timeframe.
+
+    run() blocks; start() runs it on a daemon thread and returns immediately.
+    Progress: poll snapshot() for counters, or drain_events() for per-symbol
+    events {"token", "symbol", "status", "rows", "seconds"}.
+    Symbols already marked OK in the checkpoint are skipped when resume=True;
+    with skip_current, so are series the catalog says are up to date.
+    """
+    def __init__(self, session_key: Optional[str], master_segment: str = "NSE_CASH", timeframe: str = "day",
+                 start_date: Optional[str] = None, workers: int = DEFAULT_WORKERS, segment: str = "NSE",
+                 symbols: Optional[Iterable[Dict]] = None, resume: bool = True, skip_current: bool = True,
+                 checkpoint: Optional[str] = None):
+        self.session_key = session_key
+        self.master_segment = master_segment
+        self.timeframe = timeframe
+        self.start_date = start_date
+        self.workers = max(1, int(workers))
+        self.segment = segment
+        self.symbols = list(symbols) if symbols is not None else None
+        self.resume = resume
+        self.skip_current = skip_current
+        self.checkpoint = checkpoint or checkpoint_path(master_segment, timeframe, start_date)
+        self.events: "queue.Queue[Dict]" = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "idle"  # idle, running, stopped, finished, failed
+        self.error: Optional[str] = None
+        self.total = 0
+        self.done = 0
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.rows = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    # --- planning -----------------------------------------------------------------
+    def _plan(self) -> List[Dict]:
+        symbols = self.symbols if self.symbols is not None else get_symbols_from_master(self.master_segment)
+        if self.resume:
+            finished = {t for t, e in read_checkpoint(self.checkpoint).items() if e.get("status") == "OK"}
+        else:
+            finished = set()
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+        todo = [s for s in symbols if str(s.get("token")) not in finished]
+        if self.skip_current:
+            todo, _ = historical_catalog.plan(todo, self.segment, self.timeframe)
+        self.skipped = len(symbols) - len(todo)
+        return todo
+
+    # --- execution ----------------------------------------------------------------
+    def _record(self, entry: Dict):
+        with self._lock:
+            with open(self.checkpoint, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.done += 1
+            if entry["status"] == "OK":
+                self.ok += 1
+                self.rows += entry["rows"]
+            else:
+                self.failed += 1
+        self.events.put(entry)
+
+    def _update_one(self, rec: Dict):
+        token = str(rec.get("token"))
+        t0 = time.monotonic()
+        try:
+            _, rows = update_incremental(self.session_key, rec.get("segment", self.segment), token,
+                                         self.timeframe, self.start_date)
+            status = "OK"
+        except Exception as e:
+            status, rows = f"ERR:{e}", 0
+            debug_log(f"backfill: token={token} failed: {e}")
+        self._record({
+            "token": token, "symbol": rec.get("tradingsymbol") or rec.get("symbol", ""),
+            "status": status, "rows": rows, "seconds": round(time.monotonic() - t0, 3),
+            "ts": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    def _worker(self, todo: "queue.Queue[Dict]"):
+        while not self._stop.is_set():
+            try:
+                rec = todo.get_nowait()
+            except queue.Empty:
+                return
+            self._update_one(rec)
+
+    def run(self):
+        """
+        Run the backfill to completion (or until stop()) in the calling thread.
+        """
+        self.state = "running"
+        self.started_at = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint), exist_ok=True)
+            symbols = self._plan()
+            self.total = len(symbols)
+            debug_log(f"backfill {self.master_segment}/{self.timeframe}: {self.total} to update, "
+                      f"{self.skipped} skipped, {self.workers} workers")
+            todo: "queue.Queue[Dict]" = queue.Queue()
+            for rec in symbols:
+                todo.put(rec)
+            threads = [threading.Thread(target=self._worker, args=(todo,), daemon=True)
+                       for _ in range(min(self.workers, max(1, self.total)))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.state = "stopped" if self._stop.is_set() else "finished"
+            if self.state == "finished" and os.path.exists(self.checkpoint):
+                # only an interrupted run is resumed; a finished one has nothing left to skip
+                os.replace(self.checkpoint, finished_path(self.checkpoint))
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            debug_log(f"backfill failed: {e}")
+        finally:
+            self.finished_at = time.time()
+            self.events.put({"status": self.state})
+        return self
+
+    def start(self) -> "BackfillJob":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Ask workers to stop after their current symbol; the checkpoint keeps
+        everything finished so far.
+        """
+        self._stop.set()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def drain_events(self, max_events: Optional[int] = None) -> List[Dict]:
+        out = []
+        while max_events is None or len(out) < max_events:
+            try:
+                out.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return out
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.done
+            return {
+                "state": self.state, "error": self.error, "total": self.total, "done": self.done,
+                "ok": self.ok, "failed": self.failed, "skipped": self.skipped, "rows": self.rows,
+                "elapsed": elapsed, "per_sec": rate,
+                "eta": remaining / rate if rate > 0 and self.state == "running" else None,
+            }
+
+
+def _check_rerun():
+    # a finished run must not make the next run skip every symbol
+    import tempfile
+    global update_incremental
+    calls = []
+    real, update_incremental = update_incremental, lambda key, seg, token, *a: (calls.append(token), ("", 1))[1]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            symbols = [{"token": str(t), "symbol": f"S{t}"} for t in range(5)]
+            path = os.path.join(tmp, "check.jsonl")
+            for run in (1, 2):
+                job = BackfillJob(None, symbols=symbols, skip_current=False, checkpoint=path).run()
+                assert job.state == "finished" and job.ok == len(symbols), job.snapshot()
+                assert not os.path.exists(path) and os.path.exists(finished_path(path))
+            assert sorted(calls) == sorted(s["token"] for s in symbols * 2), calls
+    finally:
+        update_incremental = real
+    print("second run fetched every symbol again")
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["--check"]:
+        _check_rerun()
+        sys.exit(0)
+    key = os.environ.get("INTEGRATE_SESSION_KEY")
+    job = BackfillJob(key, master_segment=sys.argv[1] if len(sys.argv) > 1 else "NSE_CASH",
+                      timeframe=sys.argv[2] if len(sys.argv) > 2 else "day", start_date="01012020").start()
+    try:
+        while job.is_running():
+            time.sleep(2)
+            print(job.snapshot())
+    except KeyboardInterrupt:
+        job.stop()
+        print("Stopping; re-run to resume from the checkpoint.")
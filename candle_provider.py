@@ -0,0 +1,166 @@
+# candle_provider.py
+# Local-first candles for scanners and charts.
+# Bars come from historical_store; the network is asked only for what the
+# store is missing: the head before the first stored bar (once) and the tail
+# after the catalog watermark. Completed bars are written back, so the next
+# call is served locally; the bar still forming in an open session is
+# returned but not stored.
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+import historical_catalog
+import historical_store
+from debug_utils import debug_log
+from history_stream import candles_frame, fetch_history_records
+from indicator_panel import Panel, build_panel
+
+STORED_TIMEFRAMES = ("day", "minute")
+MARKET_OPEN = time(9, 15)
+API_DT_FORMAT = "%d%m%Y%H%M"
+
+
+def _parse_dt(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    s = str(value).strip()
+    return datetime.strptime(s, API_DT_FORMAT if len(s) == 12 else "%d%m%Y")
+
+
+def market_open(now: Optional[datetime] = None) -> bool:
+    now = now or datetime.now()
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < historical_catalog.MARKET_CLOSE
+
+
+def _next_bar(last: pd.Timestamp, timeframe: str) -> datetime:
+    if timeframe == "day":
+        return (last + pd.Timedelta(days=1)).normalize().to_pydatetime()
+    return (last + pd.Timedelta(minutes=1)).to_pydatetime()
+
+
+def _fetch(api_key, segment, token, timeframe, start: datetime, end: datetime) -> np.ndarray:
+    return fetch_history_records(api_key, segment, token, timeframe,
+                                 start.strftime(API_DT_FORMAT), end.strftime(API_DT_FORMAT))
+
+
+def get_records(segment: str, token: str, timeframe: str, from_dt, to_dt, api_key: Optional[str] = None,
+                now: Optional[datetime] = None) -> np.ndarray:
+    """
+    Store records for from_dt..to_dt (datetimes or ddMMyyyy[HHMM] strings),
+    fetching and storing only the missing head/tail first.
+    """
+    token = str(token)
+    start, end = _parse_dt(from_dt), _parse_dt(to_dt)
+    now = now or datetime.now()
+    if timeframe not in STORED_TIMEFRAMES:
+        return _fetch(api_key, segment, token, timeframe, start, end)
+
+    mark = historical_catalog.get(segment, token, timeframe)
+    covered = historical_catalog.covered_from(mark)
+    live = []
+    fetched_to_end = False
+
+    def store(records: np.ndarray):
+        done = historical_catalog.completed(records, timeframe, now)
+        historical_store.append_records(segment, token, timeframe, records[done])
+        live.append(records[~done])
+
+    if covered is None or covered > pd.Timestamp(start):
+        # nothing stored for the start of the range: fetch up to the first stored bar (or all of it)
+        head_end = end if covered is None else min(end, (covered - pd.Timedelta(minutes=1)).to_pydatetime())
+        debug_log(f"candle_provider: head fetch {segment}/{token}/{timeframe} {start:%d-%m-%Y}..{head_end:%d-%m-%Y}")
+        store(_fetch(api_key, segment, token, timeframe, start, head_end))
+        historical_catalog.mark_covered(segment, token, timeframe, start)
+        if covered is None:
+            fetched_to_end = True
+            historical_catalog.mark_checked(segment, token, timeframe, min(end, now))
+        mark = historical_catalog.get(segment, token, timeframe)
+
+    # tail: after close, only if the watermark is behind; in an open session, once per call
+    last = pd.Timestamp(mark["last_dt"]) if mark and mark["last_dt"] else None
+    fresh = historical_catalog.is_current(last, mark.get("checked_at") if mark else None, timeframe, now)
+    wants_today = pd.Timestamp(end) >= pd.Timestamp(datetime.combine(now.date(), MARKET_OPEN))
+    beyond_last = last is None or pd.Timestamp(end) > last
+    if not fetched_to_end and beyond_last and (not fresh or (market_open(now) and wants_today)):
+        tail_start = _next_bar(last, timeframe) if last is not None else start
+        tail_end = min(end, now)
+        if tail_start <= tail_end:
+            store(_fetch(api_key, segment, token, timeframe, tail_start, tail_end))
+            historical_catalog.mark_checked(segment, token, timeframe, tail_end)
+
+    records = historical_store.read_records(segment, token, timeframe, start, end)
+    live = [r for r in live if len(r)]
+    if live:
+        extra = np.concatenate(live)
+        extra = extra[(extra["ts"] >= pd.Timestamp(start).value) & (extra["ts"] <= pd.Timestamp(end).value)]
+        records = historical_store.sorted_unique(np.concatenate([records, extra]))
+    return records
+
+
+def get_candles(segment: str, token: str, timeframe: str, from_dt, to_dt, api_key: Optional[str] = None,
+                until=None) -> pd.DataFrame:
+    """
+    Candle frame (Date, Open, High, Low, Close, Volume, OI) for the pages,
+    served from the local store with only the missing bars fetched. Falls back
+    to a plain network fetch if the store cannot be used.
+    """
+    try:
+        records = get_records(segment, token, timeframe, from_dt, to_dt, api_key)
+    except (OSError, sqlite3.Error) as e:
+        debug_log(f"candle_provider: store unavailable for {segment}/{token}: {e}; fetching directly")
+        records = _fetch(api_key, segment, str(token), timeframe, _parse_dt(from_dt), _parse_dt(to_dt))
+    return candles_frame(records, until)
+
+
+def ensure_local(symbols: Iterable[Dict], timeframe: str, from_dt, to_dt, api_key: Optional[str] = None,
+                 segment: str = "NSE", workers: int = 8) -> Dict[str, str]:
+    """
+    Bring the store up to date for many symbol dicts (segment, token, ...) so
+    they can be read as a panel. Returns token -> error for the ones that failed.
+    """
+    def one(rec):
+        try:
+            get_records(str(rec.get("segment", segment)), rec.get("token"), timeframe, from_dt, to_dt, api_key)
+            return None
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    symbols = list(symbols)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(symbols)))) as pool:
+        results = list(pool.map(one, symbols))
+    errors = {str(rec.get("token")): err for rec, err in zip(symbols, results) if err}
+    if errors:
+        debug_log(f"candle_provider.ensure_local: {len(errors)}/{len(symbols)} failed")
+    return errors
+
+
+def get_panel(symbols: Iterable[Dict], timeframe: str, from_dt, to_dt, api_key: Optional[str] = None,
+              segment: str = "NSE", workers: int = 8, until=None) -> Panel:
+    """
+    Panel (indicator_panel) of get_records() for many symbol dicts, fetched
+    concurrently. Unlike load_panel() it includes the bar still forming in an
+    open session; bars after `until` are dropped and failed symbols get empty rows.
+    """
+    def one(rec):
+        seg, token = str(rec.get("segment", segment)), rec.get("token")
+        try:
+            try:
+                records = get_records(seg, token, timeframe, from_dt, to_dt, api_key)
+            except (OSError, sqlite3.Error) as e:
+                debug_log(f"candle_provider: store unavailable for {seg}/{token}: {e}; fetching directly")
+                records = _fetch(api_key, seg, str(token), timeframe, _parse_dt(from_dt), _parse_dt(to_dt))
+        except Exception as e:
+            debug_log(f"candle_provider.get_panel: {seg}/{token} failed: {type(e).__name__}: {e}")
+            return None
+        if until is not None:
+            records = records[records["ts"] <= pd.Timestamp(until).value]
+        return records
+
+    symbols = list(symbols)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(symbols)))) as pool:
+        series = list(pool.map(one, symbols))
+    return build_panel(symbols, series)
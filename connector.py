@@ -1,6 +1,7 @@
 # connector.py
 # Minimal ConnectToIntegrate and IntegrateOrders wrapper (adjust if broker changes API structure)
-import requests
+import http_client
+from response_cache import get_cache
 from typing import Dict, Any, Optional
 
 class ConnectToIntegrate:
@@ -15,9 +16,9 @@ class ConnectToIntegrate:
         """
         Step 1: Creates OTP token (GET). Caller should show message to user (OTP sent).
         """
-        url = f"https://signin.definedgesecurities.com/auth/realms/debroking/dsbpkc/login/{api_token}"
+        url = f"{http_client.SIGNIN_BASE_URL}/login/{api_token}"
         headers = {"api_secret": api_secret}
-        resp = requests.get(url, headers=headers, timeout=20)
+        resp = http_client.get(url, headers=headers, timeout=20)
         resp.raise_for_status()
         data = resp.json()
         self.otp_token = data.get("otp_token")
@@ -29,9 +30,9 @@ class ConnectToIntegrate:
         """
         if not self.otp_token:
             raise RuntimeError("No otp_token found. Run login_step1 first.")
-        url = "https://signin.definedgesecurities.com/auth/realms/debroking/dsbpkc/token"
+        url = f"{http_client.SIGNIN_BASE_URL}/token"
         payload = {"otp_token": self.otp_token, "otp": otp}
-        resp = requests.post(url, json=payload, timeout=20)
+        resp = http_client.post(url, json=payload, timeout=20)
         resp.raise_for_status()
         data = resp.json()
         # store keys
@@ -56,7 +57,7 @@ class IntegrateOrders:
     Very small wrapper to place/cancel/modify orders.
     Replace body to use broker-specific payload layout.
     """
-    def __init__(self, conn: ConnectToIntegrate, base_url: str = "https://integrate.definedgesecurities.com/dart/v1"):
+    def __init__(self, conn: ConnectToIntegrate, base_url: str = http_client.INTEGRATE_BASE_URL):
         self.conn = conn
         self.base_url = base_url.rstrip("/")
 
@@ -67,25 +68,27 @@ class IntegrateOrders:
 
     def holdings(self):
         url = f"{self.base_url}/holdings"
-        r = requests.get(url, headers=self._headers(), timeout=20)
+        r = http_client.get(url, headers=self._headers(), timeout=20)
         r.raise_for_status()
         return r.json()
 
     def positions(self):
         url = f"{self.base_url}/positions"
-        r = requests.get(url, headers=self._headers(), timeout=20)
+        r = http_client.get(url, headers=self._headers(), timeout=20)
         r.raise_for_status()
         return r.json()
 
     def place_order(self, payload: Dict[str, Any]):
         url = f"{self.base_url}/placeorder"
-        r = requests.post(url, json=payload, headers=self._headers(), timeout=20)
+        r = http_client.post(url, json=payload, headers=self._headers(), timeout=20)
+        get_cache().invalidate(("/holdings", "/positions"))
         r.raise_for_status()
         return r.json()
 
     def cancel_order(self, order_id: str):
         url = f"{self.base_url}/cancel/{order_id}"
-        r = requests.get(url, headers=self._headers(), timeout=20)
+        r = http_client.get(url, headers=self._headers(), timeout=20)
+        get_cache().invalidate(("/holdings", "/positions"))
         r.raise_for_status()
         return r.json()
 
@@ -1,12 +1,21 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
-import io
+from candle_provider import ensure_local, get_candles
 from datetime import datetime, timedelta
+from functools import partial
+import time
 import plotly.graph_objs as go
 
+from debug_utils import debug_log
+import historical_store
+import indicator_state
+from indicator_panel import align, build_panel, load_panel
 from master_loader import load_watchlist
+from scan_engine import DEFAULT_WORKERS, ERROR, run_scan, summarize
+from rs_engine import HISTORY_DAYS as RS_HISTORY_DAYS, rank_universe, window_rs
+from scan_expr import ScanSyntaxError, parse, scan_frame
+from symbol_index import get_index
 
 WATCHLIST_FILES = [
     "master.csv",
@@ -19,23 +28,10 @@ WATCHLIST_FILES = [
 ]
 
 NIFTY500_SYMBOL = "nifty 500"
+DEFAULT_EXPRESSION = "close > ema(20) and ema(20) > ema(50) and rsi(14) > 60 and rs(nifty500, 60) > 1"
 
 def fetch_candles_definedge(segment, token, timeframe, from_dt, to_dt, api_key):
-    url = f"https://data.definedgesecurities.com/sds/history/{segment}/{token}/{timeframe}/{from_dt}/{to_dt}"
-    headers = {"Authorization": api_key}
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        raise Exception(f"API error: {resp.status_code} {resp.text}")
-    cols = ["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI"]
-    df = pd.read_csv(io.StringIO(resp.text), header=None, names=cols)
-    df = df[df["Dateandtime"].notnull()]
-    df = df[df["Dateandtime"].astype(str).str.strip() != ""]
-    df["Date"] = pd.to_datetime(df["Dateandtime"], format="%d%m%Y%H%M", errors="coerce")
-    df = df.dropna(subset=["Date"])
-    df = df[df['Date'] <= pd.Timestamp.today()]
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df
+    return get_candles(segment, token, timeframe, from_dt, to_dt, api_key, until=pd.Timestamp.today())
 
 def get_time_range(days, endtime="1530"):
     to = datetime.now()
@@ -46,117 +42,188 @@ def get_time_range(days, endtime="1530"):
     frm = to - timedelta(days=days)
     return frm.strftime("%d%m%Y%H%M"), to.strftime("%d%m%Y%H%M")
 
-def get_nifty500_row(master_df):
-    for idx, row in master_df.iterrows():
-        symbol = str(row.get('symbol', '')).strip().lower()
-        if symbol == NIFTY500_SYMBOL:
-            return row
-    return None
-
-def compute_ema(series, period):
-    return series.ewm(span=period, adjust=False).mean()
-
-def compute_rsi(series, period=14):
-    delta = series.diff()
-    up = delta.clip(lower=0)
-    down = -1 * delta.clip(upper=0)
-    ma_up = up.rolling(window=period, min_periods=period).mean()
-    ma_down = down.rolling(window=period, min_periods=period).mean()
-    rs = ma_up / (ma_down + 1e-10)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+def get_nifty500_row(master_df=None):
+    """
+    The Nifty 500 index row (segment, token, symbol, ...) from the shared
+    symbol index; master_df is only searched if the index lacks it.
+    """
+    row = get_index().lookup_symbol(NIFTY500_SYMBOL)
+    if row is None and master_df is not None and "symbol" in master_df:
+        hits = master_df[master_df["symbol"].astype(str).str.strip().str.lower() == NIFTY500_SYMBOL]
+        row = hits.iloc[0].to_dict() if len(hits) else None
+    return row
+
+def evaluate_symbol(
+    df, item, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
+    rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
+    ema_scan_enabled=False, ema_condition="Price above 20EMA"
+):
+    """
+    Apply the scan filters to one symbol's candles. Returns (row, reason):
+    the result row if it matched, else None and why it did not. RS against
+    Nifty 500 is filled in afterwards for all matches at once (see scan_symbols).
+    Module-level so scan_engine can run it in a worker process.
+    """
+    if len(df) < 50:
+        return None, f"only {len(df)} bars (need 50)"
+    segment, token = item["segment"], item["token"]
+    # stored incremental state, carried over today's live bar; full recompute if it cannot be used
+    ema20 = indicator_state.latest(df, segment, token, "day", "ema", 20)
+    ema50 = indicator_state.latest(df, segment, token, "day", "ema", 50)
+    rsi14 = indicator_state.latest(df, segment, token, "day", "rsi_sma", 14)
+    ltp = float(df["Close"].iloc[-1])
+
+    rsi_status = ""
+    if rsi_enabled and rsi_threshold is not None:
+        if rsi_direction == "Above" and rsi14 > rsi_threshold:
+            rsi_status = f"RSI {rsi14:.1f} > {rsi_threshold}"
+        elif rsi_direction == "Below" and rsi14 < rsi_threshold:
+            rsi_status = f"RSI {rsi14:.1f} < {rsi_threshold}"
+        else:
+            return None, f"RSI {rsi14:.1f} not {rsi_direction.lower()} {rsi_threshold}"
+
+    ema_status = ""
+    if ema_scan_enabled:
+        if ema_condition == "Price above 20EMA" and ltp > ema20:
+            ema_status = "LTP > 20EMA"
+        elif ema_condition == "Price below 20EMA" and ltp < ema20:
+            ema_status = "LTP < 20EMA"
+        elif ema_condition == "20EMA above 50EMA" and ema20 > ema50:
+            ema_status = "20EMA > 50EMA"
+        elif ema_condition == "20EMA below 50EMA" and ema20 < ema50:
+            ema_status = "20EMA < 50EMA"
+        else:
+            return None, f"EMA scan: not {ema_condition}"
+
+    ema20_ltp = ema20 / ltp if ltp else np.nan
+    ema50_ema20 = ema50 / ema20 if ema20 else np.nan
+    if not (ema20_ltp > ema_ltp_thr):
+        return None, f"20EMA/LTP {ema20_ltp:.3f} <= {ema_ltp_thr}"
+    if not (ema50_ema20 > ema_ratio_thr):
+        return None, f"50EMA/20EMA {ema50_ema20:.3f} <= {ema_ratio_thr}"
+    return {
+        "Symbol": item["symbol"],
+        "Company": item["company"],
+        "LTP": ltp,
+        "20EMA": round(ema20, 2),
+        "50EMA": round(ema50, 2),
+        "RSI14": round(rsi14, 2),
+        "RS_Score": "",
+        "RS_Flag": "",
+        "EMA_Scan": ema_status,
+        "RSI_Scan": rsi_status,
+        "segment": item["segment"],
+        "token": item["token"]
+    }, ""
+
+def scan_items(master_df):
+    """
+    Symbols of a watchlist to scan (Nifty 500 itself is skipped).
+    """
+    items = []
+    for row in master_df.to_dict("records"):
+        if str(row.get("symbol", "")).strip().lower() == NIFTY500_SYMBOL:
+            continue
+        items.append({
+            "segment": row["segment"], "token": row["token"],
+            "symbol": row["symbol"], "company": row.get("company", ""),
+        })
+    return items
+
+def iter_scan(
+    master_df, api_key, updown_window=15, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
+    rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
+    ema_scan_enabled=False, ema_condition="Price above 20EMA", show_rs=True,
+    closes=None, workers=DEFAULT_WORKERS, stop=None
+):
+    """
+    Scan the watchlist concurrently; yields scan_engine outcomes as symbols finish.
+    With a `closes` dict, each fetched symbol's (Date, Close) arrays are kept
+    there by token for the RS pass.
+    """
+    from_dt, to_dt = get_time_range(days)
+
+    def fetch(item):
+        df = fetch_candles_definedge(item["segment"], item["token"], "day", from_dt, to_dt, api_key)
+        if closes is not None:
+            closes[str(item["token"])] = {"ts": df["Date"].to_numpy(dtype="datetime64[ns]").view(np.int64),
+                                          "close": df["Close"].to_numpy(dtype=np.float64)}
+        return df
+
+    evaluate = partial(
+        evaluate_symbol, ema_ltp_thr=ema_ltp_thr, ema_ratio_thr=ema_ratio_thr,
+        rsi_enabled=rsi_enabled, rsi_threshold=rsi_threshold, rsi_direction=rsi_direction,
+        ema_scan_enabled=ema_scan_enabled, ema_condition=ema_condition,
+    )
+    return run_scan(scan_items(master_df), fetch, evaluate, workers=workers, stop=stop)
+
+def add_relative_strength(rows, closes, nifty_df):
+    """
+    Fill RS_Score/RS_Flag of result rows: each symbol's return over the dates
+    it shares with Nifty 500, divided by the index's return over those dates.
+    All rows are aligned on one date axis and computed in one vectorized pass.
+    """
+    if not rows:
+        return rows
+    if nifty_df is None or nifty_df.empty:
+        for row in rows:
+            row["RS_Flag"] = "Nifty 500 data unavailable"
+        return rows
+    panel = build_panel(rows, [closes.get(str(row["token"])) for row in rows], fields=("close",))
+    bench = align(panel, nifty_df["Date"].to_numpy(dtype="datetime64[ns]"), nifty_df["Close"], ffill=False)
+    scores = window_rs(panel, bench)
+    for row, score in zip(rows, scores):
+        if not np.isnan(score):
+            row["RS_Score"] = round(score, 3)
+            row["RS_Flag"] = "Outperform" if score > 1 else "Underperform"
+    return rows
 
 def scan_symbols(
     master_df, api_key, updown_window=15, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95,
     rsi_enabled=False, rsi_threshold=None, rsi_direction="Above",
     ema_scan_enabled=False, ema_condition="Price above 20EMA", show_rs=True,
-    nifty_df=None  # Pass the already-fetched Nifty 500 df for RS calc
+    nifty_df=None,  # Pass the already-fetched Nifty 500 df for RS calc
+    on_result=None  # called with every scan_engine outcome as it arrives
 ):
     result = []
-    for idx, row in master_df.iterrows():
-        segment = row['segment']
-        token = row['token']
-        symbol = row['symbol']
-        company = row['company'] if "company" in row else ""
-        if str(symbol).strip().lower() == NIFTY500_SYMBOL:
-            continue  # Skip Nifty 500 itself
-        try:
-            from_dt, to_dt = get_time_range(days)
-            df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
-            if len(df) < 50:
-                continue
-            df["EMA20"] = compute_ema(df["Close"], 20)
-            df["EMA50"] = compute_ema(df["Close"], 50)
-            df["RSI14"] = compute_rsi(df["Close"], 14)
-            ltp = df["Close"].iloc[-1]
-            ema20 = df["EMA20"].iloc[-1]
-            ema50 = df["EMA50"].iloc[-1]
-            rsi14 = df["RSI14"].iloc[-1]
-
-            rsi_status = ""
-            if rsi_enabled and rsi_threshold is not None:
-                if rsi_direction == "Above" and rsi14 > rsi_threshold:
-                    rsi_status = f"RSI {rsi14:.1f} > {rsi_threshold}"
-                elif rsi_direction == "Below" and rsi14 < rsi_threshold:
-                    rsi_status = f"RSI {rsi14:.1f} < {rsi_threshold}"
-                else:
-                    continue
-
-            ema_status = ""
-            if ema_scan_enabled:
-                if ema_condition == "Price above 20EMA" and ltp > ema20:
-                    ema_status = "LTP > 20EMA"
-                elif ema_condition == "Price below 20EMA" and ltp < ema20:
-                    ema_status = "LTP < 20EMA"
-                elif ema_condition == "20EMA above 50EMA" and ema20 > ema50:
-                    ema_status = "20EMA > 50EMA"
-                elif ema_condition == "20EMA below 50EMA" and ema20 < ema50:
-                    ema_status = "20EMA < 50EMA"
-                else:
-                    continue
-
-            # RS Calculation
-            rs_score, rs_flag = np.nan, ""
-            if show_rs and nifty_df is not None and not nifty_df.empty:
-                merged = pd.merge(
-                    df[["Date", "Close"]],
-                    nifty_df[["Date", "Close"]].rename(columns={"Close": "NiftyClose"}),
-                    on="Date",
-                    how="inner"
-                )
-                if len(merged) >= 2:
-                    stock_return = merged["Close"].iloc[-1] / merged["Close"].iloc[0]
-                    nifty_return = merged["NiftyClose"].iloc[-1] / merged["NiftyClose"].iloc[0]
-                    if nifty_return != 0:
-                        rs_score = stock_return / nifty_return
-                        rs_flag = "Outperform" if rs_score > 1 else "Underperform"
-            elif show_rs:
-                rs_flag = "Nifty 500 data unavailable"
-
-            ema20_ltp = ema20 / ltp if ltp else np.nan
-            ema50_ema20 = ema50 / ema20 if ema20 else np.nan
-            if (
-                (ema20_ltp > ema_ltp_thr) and
-                (ema50_ema20 > ema_ratio_thr)
-            ):
-                result.append({
-                    "Symbol": symbol,
-                    "Company": company,
-                    "LTP": ltp,
-                    "20EMA": round(ema20, 2),
-                    "50EMA": round(ema50, 2),
-                    "RSI14": round(rsi14, 2),
-                    "RS_Score": round(rs_score, 3) if show_rs and not np.isnan(rs_score) else "",
-                    "RS_Flag": rs_flag if show_rs else "",
-                    "EMA_Scan": ema_status,
-                    "RSI_Scan": rsi_status,
-                    "segment": segment,
-                    "token": token
-                })
-        except Exception:
-            continue
+    closes = {}
+    for outcome in iter_scan(
+        master_df, api_key, updown_window, days, ema_ltp_thr, ema_ratio_thr,
+        rsi_enabled, rsi_threshold, rsi_direction, ema_scan_enabled, ema_condition, show_rs,
+        closes=closes if show_rs else None
+    ):
+        if on_result is not None:
+            on_result(outcome)
+        if outcome["status"] == ERROR:
+            debug_log(f"scan {outcome['item']['symbol']}: {outcome['reason']}")
+        elif outcome["row"] is not None:
+            result.append(outcome["row"])
+    if show_rs:
+        add_relative_strength(result, closes, nifty_df)
     return pd.DataFrame(result)
 
+def expression_scan(master_df, api_key, expression, days=120, nifty_row=None):
+    """
+    Evaluate a scan_expr expression over the watchlist as one panel.
+    The store is brought up to date first (one small request per stale symbol).
+    Returns (matches, symbols that could not be updated).
+    """
+    parse(expression)  # a typo fails here, before any history is fetched
+    from_dt, to_dt = get_time_range(days)
+    items = scan_items(master_df)
+    refresh = items + ([{"segment": nifty_row["segment"], "token": nifty_row["token"]}] if nifty_row is not None else [])
+    errors = ensure_local(refresh, "day", from_dt, to_dt, api_key, workers=DEFAULT_WORKERS)
+    start = datetime.strptime(from_dt, "%d%m%Y%H%M")
+    end = datetime.strptime(to_dt, "%d%m%Y%H%M")
+    panel = load_panel(items, timeframe="day", start=start, end=end)
+    benchmarks = {}
+    if nifty_row is not None:
+        records = historical_store.read_records(str(nifty_row["segment"]).upper(), str(nifty_row["token"]),
+                                                "day", start, end)
+        if len(records):
+            benchmarks["nifty500"] = align(panel, records["ts"], records["close"])
+    return scan_frame({"match": expression}, panel, benchmarks), errors
+
 def plot_candlestick(df):
     df = df[df['Date'] <= pd.Timestamp.today()]
     fig = go.Figure(data=[go.Candlestick(
@@ -188,13 +255,6 @@ def show():
     st.sidebar.title("Watchlist & Scan filters")
     selected_watchlist = st.sidebar.selectbox("Select Watchlist CSV", WATCHLIST_FILES)
 
-    # Always load master.csv for Nifty 500 (for RS and chart)
-    try:
-        master_for_nifty = load_watchlist("master.csv")
-    except Exception as e:
-        st.error(f"Error loading master.csv for Nifty 500: {e}")
-        return
-
     # Load selected watchlist for scanning
     try:
         master_df = load_watchlist(selected_watchlist)
@@ -231,8 +291,22 @@ def show():
     st.sidebar.markdown("---")
     show_rs = st.sidebar.checkbox("Show Relative Strength vs Nifty 500", value=True)
 
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Expression Scan")
+    expression = st.sidebar.text_area(
+        "Scan expression", value=DEFAULT_EXPRESSION,
+        help="Fields: open, high, low, close, volume. Functions: ema(n), sma(n), rsi(n) (Wilder), "
+             "rsi_sma(n) (rolling mean, as the RSI filter), atr(n), high(n), low(n), "
+             "updays(n), downdays(n), macd(), macd_signal(), rs(nifty500, n). "
+             "Combine with + - * /, comparisons, and/or/not."
+    )
+
     # --- Fetch Nifty 500 data ONCE robustly, always from master.csv ---
-    nifty500_row = get_nifty500_row(master_for_nifty)
+    try:
+        nifty500_row = get_nifty500_row(master_df)
+    except Exception as e:
+        st.error(f"Error loading master.csv for Nifty 500: {e}")
+        return
     nifty_df = None
     nifty500_error = ""
     if nifty500_row is not None:
@@ -247,14 +321,64 @@ def show():
     else:
         nifty500_error = "'Nifty 500' symbol not found in master.csv."
 
+    if st.button("Run RS Ranking"):
+        if nifty500_row is None:
+            st.warning(f"RS ranking needs Nifty 500 data. {nifty500_error}")
+        else:
+            items = scan_items(master_df)
+            with st.spinner("Updating local history and ranking relative strength..."):
+                from_dt, to_dt = get_time_range(RS_HISTORY_DAYS)
+                errors = ensure_local(items + [nifty500_row], "day", from_dt, to_dt, api_key, workers=DEFAULT_WORKERS)
+                ranks = rank_universe(items, nifty500_row)
+            if errors:
+                st.warning(f"{len(errors)} symbols could not be updated; their local data may be stale.")
+            st.dataframe(ranks)
+
+    if st.button("Run Expression Scan"):
+        with st.spinner("Updating local history and evaluating the expression..."):
+            try:
+                matches, errors = expression_scan(master_df, api_key, expression, days, nifty500_row)
+            except ScanSyntaxError as e:
+                st.error(f"Invalid scan expression: {e}")
+                return
+        if errors:
+            st.warning(f"{len(errors)} symbols could not be updated; their local data may be stale.")
+        if matches.empty:
+            st.warning("No symbols matched the expression.")
+        else:
+            st.dataframe(matches.drop(columns=["match"]))
+
     if st.button("Run Symbol Scan"):
-        st.info("Scanning symbols, please wait...")
+        total = max(1, len(scan_items(master_df)))
+        progress = st.progress(0.0, text="Scanning symbols, please wait...")
+        table = st.empty()
+        outcomes, matches = [], []
+        last_draw = 0.0
+
+        def on_result(outcome):
+            nonlocal last_draw
+            outcomes.append(outcome)
+            if outcome["row"] is not None:
+                matches.append(outcome["row"])
+            progress.progress(min(1.0, len(outcomes) / total),
+                              text=f"Scanned {len(outcomes)}/{total}, {len(matches)} matched")
+            # redraw the partial results at most twice a second
+            if matches and time.monotonic() - last_draw > 0.5:
+                table.dataframe(pd.DataFrame(matches))
+                last_draw = time.monotonic()
+
         scan_df = scan_symbols(
             master_df, api_key, updown_window, days, ema_ltp_thr, ema_ratio_thr,
             rsi_enabled, rsi_threshold, rsi_direction,
             ema_scan_enabled, ema_condition, show_rs,
-            nifty_df=nifty_df
+            nifty_df=nifty_df, on_result=on_result
         )
+        progress.empty()
+        table.empty()
+        report = summarize(outcomes)
+        errors = int((report["Status"] == ERROR).sum())
+        with st.expander(f"Scan report: {len(report)} symbols, {len(scan_df)} matched, {errors} errors"):
+            st.dataframe(report.sort_values(["Status", "Fetch (s)"], ascending=[True, False]))
         if scan_df.empty:
             st.warning("No symbols matched the criteria.")
             return
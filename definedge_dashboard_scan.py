@@ -1,13 +1,37 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
-import io
 from datetime import datetime, timedelta
 import plotly.graph_objs as go
 
-# --- Copy your functions: load_master, fetch_candles_definedge, compute_ema, count_updays, count_downdays ---
-# (Paste those from your previous working code here)
+import indicator_cache
+import indicators
+from candle_provider import get_candles
+from symbol_index import get_index
+
+def load_master():
+    """
+    NSE equity and index rows of master.csv (segment, token, symbol, instrument, ...)
+    from the shared symbol index.
+    """
+    df = get_index().frame
+    df = df[(df["segment"] == "NSE") & df["series"].isin(["EQ", "BE", "IDX"])].copy()
+    df["instrument"] = df["series"]
+    return df.reset_index(drop=True)
+
+def fetch_candles_definedge(segment, token, timeframe, from_dt, to_dt, api_key):
+    return get_candles(segment, token, timeframe, from_dt, to_dt, api_key, until=pd.Timestamp.today())
+
+def get_time_range(days, endtime="1530"):
+    to = datetime.now().replace(hour=int(endtime[:2]), minute=int(endtime[2:]), second=0, microsecond=0)
+    frm = to - timedelta(days=days)
+    return frm.strftime("%d%m%Y%H%M"), to.strftime("%d%m%Y%H%M")
+
+def count_updays(df, window=15):
+    return int(indicators.up_days(df["High"], window)[-1]) if len(df) else 0
+
+def count_downdays(df, window=15):
+    return int(indicators.down_days(df["Low"], window)[-1]) if len(df) else 0
 
 def scan_symbols(master_df, api_key, updown_window=15, days=120, ema_ltp_thr=0.95, ema_ratio_thr=0.95):
     result = []
@@ -19,8 +43,8 @@ def scan_symbols(master_df, api_key, updown_window=15, days=120, ema_ltp_thr=0.9
             df = fetch_candles_definedge(segment, token, "day", from_dt, to_dt, api_key)
             if len(df) < 20:
                 continue  # not enough data
-            df["EMA20"] = compute_ema(df["Close"], 20)
-            df["EMA50"] = compute_ema(df["Close"], 50)
+            df["EMA20"] = indicator_cache.compute(df, segment, token, "day", "ema", 20)
+            df["EMA50"] = indicator_cache.compute(df, segment, token, "day", "ema", 50)
             ltp = df["Close"].iloc[-1]
             ema20 = df["EMA20"].iloc[-1]
             ema50 = df["EMA50"].iloc[-1]
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils import integrate_get, integrate_post
-import requests
+import http_client
 
 def gtt_modify_form(order):
     unique_id = f"gtt_{order.get('alert_id', '')}"
@@ -80,9 +80,9 @@ def show():
                 st.rerun()
             if cols[9].button("Cancel", key=f"gtt_cancel_btn_{order.get('alert_id', '')}"):
                 api_session_key = st.secrets.get("integrate_api_session_key", "")
-                url = f"https://integrate.definedgesecurities.com/dart/v1/gttcancel/{order.get('alert_id', '')}"
+                url = f"{http_client.INTEGRATE_BASE_URL}/gttcancel/{order.get('alert_id', '')}"
                 headers = {"Authorization": api_session_key}
-                resp = requests.get(url, headers=headers)
+                resp = http_client.get(url, headers=headers)
                 try:
                     result = resp.json()
                 except Exception:
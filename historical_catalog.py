@@ -0,0 +1,268 @@
+# historical_catalog.py
+# SQLite catalog of what historical_store holds: one watermark row per
+# (segment, token, timeframe) with first/last bar, row count, last update,
+# when the API was last asked for new bars and how far back it was asked.
+# historical_store keeps it current on every write, so planning an update run
+# or listing stale series never opens the data files.
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from debug_utils import debug_log
+
+CATALOG_PATH = os.path.join("data", "historical", "catalog.sqlite")
+MARKET_CLOSE = time(15, 30)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    segment TEXT NOT NULL,
+    token TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    first_dt TEXT,
+    last_dt TEXT,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    last_updated TEXT NOT NULL,
+    checked_at TEXT,
+    covered_from TEXT,
+    PRIMARY KEY (segment, token, timeframe)
+)
+"""
+# columns added after the first release of the table: name -> type
+_ADDED_COLUMNS = {"checked_at": "TEXT", "covered_from": "TEXT"}
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    # one connection per thread and catalog path; WAL lets readers run during writes
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(CATALOG_PATH)
+    if conn is None:
+        os.makedirs(os.path.dirname(CATALOG_PATH), exist_ok=True)
+        conn = sqlite3.connect(CATALOG_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        have = {row[1] for row in conn.execute("PRAGMA table_info(watermarks)")}
+        for name, kind in _ADDED_COLUMNS.items():
+            if name not in have:
+                conn.execute(f"ALTER TABLE watermarks ADD COLUMN {name} {kind}")
+        conn.commit()
+        conns[CATALOG_PATH] = conn
+    return conn
+
+
+def _iso(value) -> Optional[str]:
+    if value is None or pd.isna(value):
+        return None
+    return pd.Timestamp(value).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _key(segment: str, token, timeframe: str) -> Tuple[str, str, str]:
+    return segment.upper(), str(token), timeframe
+
+
+def record(segment: str, token, timeframe: str, first_dt, last_dt, row_count: int,
+           updated: Optional[datetime] = None):
+    """
+    Set the watermark for one series (called by historical_store after a write).
+    """
+    conn = _connect()
+    conn.execute(
+        "INSERT INTO watermarks (segment, token, timeframe, first_dt, last_dt, row_count, last_updated) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (segment, token, timeframe) DO UPDATE SET "
+        "first_dt = excluded.first_dt, last_dt = excluded.last_dt, row_count = excluded.row_count, "
+        "last_updated = excluded.last_updated",
+        (*_key(segment, token, timeframe), _iso(first_dt), _iso(last_dt), int(row_count),
+         _iso(updated or datetime.now())),
+    )
+    conn.commit()
+
+
+def mark_checked(segment: str, token, timeframe: str, checked: Optional[datetime] = None):
+    """
+    Record that the API was asked for everything up to `checked` (default now).
+    A series checked after the last session closed counts as current even if
+    that session brought no bars (exchange holiday, suspended symbol).
+    """
+    conn = _connect()
+    stamp = _iso(checked or datetime.now())
+    conn.execute(
+        "INSERT INTO watermarks (segment, token, timeframe, row_count, last_updated, checked_at) "
+        "VALUES (?, ?, ?, 0, ?, ?) ON CONFLICT (segment, token, timeframe) DO UPDATE SET checked_at = excluded.checked_at",
+        (*_key(segment, token, timeframe), stamp, stamp),
+    )
+    conn.commit()
+
+
+def mark_covered(segment: str, token, timeframe: str, from_dt):
+    """
+    Record that history was requested back to from_dt, so a series that starts
+    later (new listing) is not re-requested for the same head range.
+    """
+    conn = _connect()
+    stamp = _iso(from_dt)
+    conn.execute(
+        "INSERT INTO watermarks (segment, token, timeframe, row_count, last_updated, covered_from) "
+        "VALUES (?, ?, ?, 0, ?, ?) ON CONFLICT (segment, token, timeframe) DO UPDATE SET "
+        "covered_from = MIN(COALESCE(covered_from, excluded.covered_from), excluded.covered_from)",
+        (*_key(segment, token, timeframe), _iso(datetime.now()), stamp),
+    )
+    conn.commit()
+
+
+def covered_from(mark: Optional[Dict]) -> Optional[pd.Timestamp]:
+    """
+    Earliest datetime the series is known to be complete from: the older of
+    its first stored bar and the earliest range ever requested.
+    """
+    if not mark:
+        return None
+    stamps = [pd.Timestamp(v) for v in (mark.get("first_dt"), mark.get("covered_from")) if v]
+    return min(stamps) if stamps else None
+
+
+def remove(segment: str, token, timeframe: str):
+    conn = _connect()
+    conn.execute("DELETE FROM watermarks WHERE segment = ? AND token = ? AND timeframe = ?",
+                 _key(segment, token, timeframe))
+    conn.commit()
+
+
+def get(segment: str, token, timeframe: str) -> Optional[Dict]:
+    cur = _connect().execute(
+        "SELECT segment, token, timeframe, first_dt, last_dt, row_count, last_updated, checked_at, covered_from "
+        "FROM watermarks WHERE segment = ? AND token = ? AND timeframe = ?", _key(segment, token, timeframe))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("segment", "token", "timeframe", "first_dt", "last_dt", "row_count", "last_updated",
+                     "checked_at", "covered_from"), row))
+
+
+def watermarks(segment: Optional[str] = None, timeframe: Optional[str] = None) -> pd.DataFrame:
+    """
+    All catalog rows (optionally for one segment/timeframe) with parsed datetimes.
+    """
+    sql = "SELECT * FROM watermarks WHERE 1 = 1"
+    args: List = []
+    if segment is not None:
+        sql += " AND segment = ?"
+        args.append(segment.upper())
+    if timeframe is not None:
+        sql += " AND timeframe = ?"
+        args.append(timeframe)
+    df = pd.read_sql_query(sql, _connect(), params=args)
+    for c in ("first_dt", "last_dt", "last_updated", "checked_at", "covered_from"):
+        df[c] = pd.to_datetime(df[c])
+    return df
+
+
+def expected_session(now: Optional[datetime] = None) -> date:
+    """
+    Latest weekday whose session has closed at `now`. Exchange holidays are not
+    known here; a series checked after a holiday's close counts as current (see is_current).
+    """
+    now = now or datetime.now()
+    d = now.date() if now.time() >= MARKET_CLOSE else now.date() - timedelta(days=1)
+    while d.weekday() >= 5:
+        d -= timedelta(days=1)
+    return d
+
+
+def completed(records: np.ndarray, timeframe: str, now: Optional[datetime] = None) -> np.ndarray:
+    """
+    Mask of records that can no longer change at `now`: day bars of closed
+    sessions, minute bars whose minute is over (ticks are always final). Only
+    these may be stored; a forming bar written to the store would advance
+    last_dt and be served frozen as current.
+    """
+    now = now or datetime.now()
+    if timeframe == "day":
+        last_closed = pd.Timestamp(expected_session(now)) + pd.Timedelta(days=1)
+        return records["ts"] < last_closed.value
+    if timeframe == "minute":
+        return records["ts"] + pd.Timedelta(minutes=1).value <= pd.Timestamp(now).value
+    return np.ones(len(records), dtype=bool)
+
+
+def is_current(last_dt, checked_at, timeframe: str, now: Optional[datetime] = None) -> bool:
+    """
+    True if nothing newer than last_dt can exist yet: the series already has
+    the last closed session (its final minute for intraday), or it was checked
+    after that session closed.
+    """
+    session = expected_session(now)
+    close_dt = datetime.combine(session, MARKET_CLOSE)
+    if last_dt is not None and not pd.isna(last_dt):
+        last_dt = pd.Timestamp(last_dt)
+        if timeframe == "day" and last_dt.date() >= session:
+            return True
+        if timeframe != "day" and last_dt >= pd.Timestamp(close_dt) - pd.Timedelta(minutes=1):
+            return True
+    if checked_at is not None and not pd.isna(checked_at):
+        return pd.Timestamp(checked_at) >= pd.Timestamp(close_dt)
+    return False
+
+
+def plan(symbols: Iterable[Dict], segment: str, timeframe: str,
+         now: Optional[datetime] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split symbol dicts (as from masterfile_handler) into (to_update, current)
+    using one catalog query.
+    """
+    marks = {}
+    cur = _connect().execute(
+        "SELECT segment, token, last_dt, checked_at FROM watermarks WHERE timeframe = ?", (timeframe,))
+    for seg, tok, last_dt, checked_at in cur:
+        marks[(seg, tok)] = (last_dt, checked_at)
+    todo, current = [], []
+    for rec in symbols:
+        mark = marks.get((str(rec.get("segment", segment)).upper(), str(rec.get("token"))))
+        if mark is not None and is_current(mark[0], mark[1], timeframe, now):
+            current.append(rec)
+        else:
+            todo.append(rec)
+    return todo, current
+
+
+def stale_report(timeframe: str = "day", segment: Optional[str] = None,
+                 symbols: Optional[Iterable[Dict]] = None, now: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    One row per series with its watermark, how many days it lags the last closed
+    session, and whether it is stale. With `symbols`, series missing from the
+    catalog are included as stale with no data.
+    """
+    df = watermarks(segment, timeframe)
+    if symbols is not None:
+        wanted = pd.DataFrame(
+            [{"segment": str(s.get("segment", segment or "")).upper(), "token": str(s.get("token")),
+              "symbol": s.get("tradingsymbol") or s.get("symbol")} for s in symbols],
+            columns=["segment", "token", "symbol"])
+        df = wanted.merge(df, on=["segment", "token"], how="left")
+        df["timeframe"] = timeframe
+        df["row_count"] = df["row_count"].fillna(0).astype(int)
+    session = pd.Timestamp(expected_session(now))
+    df["lag_days"] = (session - df["last_dt"].dt.normalize()).dt.days
+    df["stale"] = [not is_current(l, c, timeframe, now) for l, c in zip(df["last_dt"], df["checked_at"])]
+    return df.sort_values(["stale", "lag_days"], ascending=[False, False]).reset_index(drop=True)
+
+
+def rebuild_from_store():
+    """
+    Recreate every watermark by scanning historical_store (e.g. after a manual
+    copy of data files or deleting the catalog). Returns the number of series.
+    """
+    import historical_store
+    count = 0
+    for segment, token, timeframe in historical_store.list_series():
+        historical_store.refresh_catalog(segment, token, timeframe)
+        count += 1
+    debug_log(f"rebuild_from_store: {count} series")
+    return count
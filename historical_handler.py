@@ -5,12 +5,15 @@ from typing import List, Dict, Optional, Callable, Iterator
 from debug_utils import debug_log
 from masterfile_handler import batch_symbols, get_symbols_from_master
 from historical_utils import update_incremental
+import historical_catalog
 
 def update_batch(session_key: Optional[str], batch: List[Dict], segment: str = "NSE", timeframe: str = "day",
-                 start_date: Optional[str] = None, sleep_per: float = 0.05,
+                 start_date: Optional[str] = None, sleep_per: float = 0.0,
                  progress_callback: Optional[Callable[[str,int,int,str,int], None]] = None) -> List[tuple]:
     """
     Update a given list of symbol dicts sequentially.
+    Pacing comes from the shared rate limiter (history family); sleep_per is an
+    optional extra pause between symbols and defaults to none.
     Each dict: {token, tradingsymbol, ...}
     progress_callback(token, idx, total, status, rows)
     Returns list[(token, path, rows_count_or_0)]
@@ -21,8 +24,7 @@ def update_batch(session_key: Optional[str], batch: List[Dict], segment: str = "
         token = rec.get("token")
         seg = rec.get("segment", segment)
         try:
-            path, df = update_incremental(session_key, seg, token, timeframe, start_date)
-            rows = len(df) if df is not None else 0
+            path, rows = update_incremental(session_key, seg, token, timeframe, start_date)
             results.append((token, path, rows))
             status = "OK"
             debug_log(f"Updated token={token} rows={rows}")
@@ -35,18 +37,28 @@ def update_batch(session_key: Optional[str], batch: List[Dict], segment: str = "
                 progress_callback(token, idx, total, status, results[-1][2])
             except Exception:
                 pass
-        time.sleep(sleep_per)
+        if sleep_per > 0:
+            time.sleep(sleep_per)
     return results
 
 
 def update_all_from_master(session_key: Optional[str], master_segment: str = "NSE_CASH", batch_size: int = 500,
-                           timeframe: str = "day", start_date: Optional[str] = None, sleep_per: float = 0.05,
-                           progress_callback: Optional[Callable[[str,int,int,str,int], None]] = None) -> Iterator[List[tuple]]:
+                           timeframe: str = "day", start_date: Optional[str] = None, sleep_per: float = 0.0,
+                           progress_callback: Optional[Callable[[str,int,int,str,int], None]] = None,
+                           skip_current: bool = True) -> Iterator[List[tuple]]:
     """
     Iterate through master file in batches and update historical data.
+    With skip_current, symbols whose catalog watermark already covers the last
+    closed session are left out (one catalog query per batch, no file reads).
     Yields results per batch (list of (token,path,rows))
     """
     for batch in batch_symbols(master_segment, batch_size):
+        if skip_current:
+            batch, current = historical_catalog.plan(batch, "NSE", timeframe)
+            if current:
+                debug_log(f"Skipping {len(current)} symbols already current for {timeframe}")
+            if not batch:
+                continue
         debug_log(f"Processing batch of {len(batch)} symbols from master {master_segment}")
         res = update_batch(session_key, batch, segment="NSE", timeframe=timeframe, start_date=start_date, sleep_per=sleep_per, progress_callback=progress_callback)
         yield res
@@ -0,0 +1,339 @@
+# historical_store.py
+# Append-only, partitioned binary store for historical bars.
+# Layout: data/historical/{SEG}/{timeframe}/{token}/{partition}.bin where the
+# partition is the year (day bars) or year+month (minute/tick). Each file is a
+# flat array of fixed-size records sorted by timestamp, so adding new bars is a
+# byte append and only a partition that overlaps incoming data is rewritten.
+# Every write refreshes the series' watermark in historical_catalog.
+import glob
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import historical_catalog
+from debug_utils import debug_log
+
+STORE_DIR = os.path.join("data", "historical")
+
+# ts is datetime64[ns] as int64 (naive exchange-local time, like the API)
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"),
+    ("close", "<f8"), ("volume", "<i8"), ("oi", "<f8"),
+])
+TICK_DTYPE = np.dtype([("ts", "<i8"), ("ltp", "<f8"), ("ltq", "<i8"), ("oi", "<f8")])
+
+PARTITION_SUFFIX = ".bin"
+# partitions smaller than this are read with one fromfile call instead of mapped
+MAP_MIN_BYTES = 256 << 10
+
+_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def dtype_for(timeframe: str) -> np.dtype:
+    return TICK_DTYPE if timeframe == "tick" else BAR_DTYPE
+
+
+def series_dir(segment: str, token: str, timeframe: str) -> str:
+    return os.path.join(STORE_DIR, segment.upper(), timeframe, str(token))
+
+
+def partition_keys(ts: np.ndarray, timeframe: str) -> np.ndarray:
+    """
+    Partition key per int64 ns timestamp: YYYY for day bars, YYYYMM otherwise.
+    """
+    months = ts.astype("datetime64[ns]").astype("datetime64[M]").astype(np.int64)
+    years = months // 12 + 1970
+    if timeframe == "day":
+        return years
+    return years * 100 + months % 12 + 1
+
+
+def _partition_path(directory: str, key: int) -> str:
+    return os.path.join(directory, f"{int(key)}{PARTITION_SUFFIX}")
+
+
+def list_partitions(segment: str, token: str, timeframe: str) -> List[Tuple[int, str]]:
+    """
+    Sorted (partition key, path) pairs for one series.
+    """
+    directory = series_dir(segment, token, timeframe)
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext == PARTITION_SUFFIX and stem.isdigit():
+            out.append((int(stem), os.path.join(directory, name)))
+    return sorted(out)
+
+
+def _series_lock(segment: str, token: str, timeframe: str) -> threading.Lock:
+    key = (segment.upper(), str(token), timeframe)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+    return lock
+
+
+def _read_partition(path: str, dtype: np.dtype) -> np.ndarray:
+    # a trailing partial record (interrupted append) is ignored
+    count = os.path.getsize(path) // dtype.itemsize
+    return np.fromfile(path, dtype=dtype, count=count)
+
+
+def _last_ts(path: str, dtype: np.dtype) -> Optional[int]:
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return None
+    with open(path, "rb") as f:
+        f.seek((count - 1) * dtype.itemsize)
+        return int(np.frombuffer(f.read(8), dtype="<i8")[0])
+
+
+def _write_atomic(path: str, records: np.ndarray):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        records.tofile(f)
+    os.replace(tmp, path)
+
+
+def to_records(df: pd.DataFrame, timeframe: str) -> np.ndarray:
+    """
+    Convert a parse_api_csv-style frame (datetime + value columns) to sorted,
+    de-duplicated records (last row wins on equal timestamps).
+    """
+    dtype = dtype_for(timeframe)
+    if df is None or df.empty:
+        return np.empty(0, dtype=dtype)
+    rec = np.empty(len(df), dtype=dtype)
+    ts = df["datetime"]
+    if not pd.api.types.is_datetime64_dtype(ts):
+        ts = pd.to_datetime(ts)
+    rec["ts"] = ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    for name in dtype.names[1:]:
+        values = pd.to_numeric(df[name], errors="coerce") if name in df else pd.Series(np.nan, index=df.index)
+        if dtype[name].kind == "i":
+            values = values.fillna(0)
+        rec[name] = values.to_numpy(dtype=dtype[name])
+    return sorted_unique(rec)
+
+
+def sorted_unique(records: np.ndarray) -> np.ndarray:
+    """
+    Records sorted by ts, keeping the last occurrence of each timestamp.
+    """
+    if len(records) > 1 and not np.all(records["ts"][1:] > records["ts"][:-1]):
+        records = records[np.argsort(records["ts"], kind="stable")]
+        records = records[np.append(records["ts"][1:] != records["ts"][:-1], True)]
+    return records
+
+
+def to_frame(records: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame({name: records[name] for name in records.dtype.names[1:]})
+    df.insert(0, "datetime", records["ts"].astype("datetime64[ns]"))
+    return df
+
+
+def append(segment: str, token: str, timeframe: str, df: pd.DataFrame) -> int:
+    """
+    Add bars to the store. Rows newer than a partition's last bar are appended
+    in place; a partition that overlaps the incoming rows is merged (incoming
+    wins) and rewritten atomically. Returns the number of records written.
+    """
+    return append_records(segment, token, timeframe, to_records(df, timeframe))
+
+
+def append_records(segment: str, token: str, timeframe: str, records: np.ndarray) -> int:
+    """
+    append() for records already in the store dtype (e.g. from history_stream).
+    """
+    records = sorted_unique(records)
+    if len(records) == 0:
+        return 0
+    dtype = records.dtype
+    directory = series_dir(segment, token, timeframe)
+    keys = partition_keys(records["ts"], timeframe)
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    with _series_lock(segment, token, timeframe):
+        os.makedirs(directory, exist_ok=True)
+        for chunk, key in zip(np.split(records, bounds), keys[np.r_[0, bounds]]):
+            path = _partition_path(directory, key)
+            if not os.path.exists(path):
+                _write_atomic(path, chunk)
+                continue
+            size = os.path.getsize(path)
+            last = _last_ts(path, dtype)
+            if last is None or chunk["ts"][0] > last:
+                with open(path, "r+b") as f:
+                    f.truncate(size - size % dtype.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    chunk.tofile(f)
+                continue
+            existing = _read_partition(path, dtype)
+            existing = existing[~np.isin(existing["ts"], chunk["ts"])]
+            merged = np.concatenate([existing, chunk])
+            _write_atomic(path, merged[np.argsort(merged["ts"], kind="stable")])
+        refresh_catalog(segment, token, timeframe)
+    debug_log(f"historical_store.append {segment}/{timeframe}/{token}: {len(records)} records")
+    return len(records)
+
+
+def _map_partition(path: str, dtype: np.dtype) -> Optional[np.ndarray]:
+    size = os.path.getsize(path)
+    count = size // dtype.itemsize
+    if count == 0:
+        return None
+    if size < MAP_MIN_BYTES:
+        # setting up a mapping costs more than reading a small partition outright
+        return np.fromfile(path, dtype=dtype, count=count)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def read_records(segment: str, token: str, timeframe: str, start=None, end=None) -> np.ndarray:
+    """
+    Records with start <= ts <= end (either bound optional). Only partitions
+    that can overlap the range are opened; each is memory-mapped (small ones
+    are read outright) and cut with a binary search on its sorted ts column.
+    """
+    dtype = dtype_for(timeframe)
+    lo = pd.Timestamp(start).value if start is not None else None
+    hi = pd.Timestamp(end).value if end is not None else None
+    lo_key = partition_keys(np.array([lo]), timeframe)[0] if lo is not None else None
+    hi_key = partition_keys(np.array([hi]), timeframe)[0] if hi is not None else None
+    parts = []
+    for key, path in list_partitions(segment, token, timeframe):
+        if (lo_key is not None and key < lo_key) or (hi_key is not None and key > hi_key):
+            continue
+        mm = _map_partition(path, dtype)
+        if mm is None:
+            continue
+        ts = mm["ts"]
+        i = int(np.searchsorted(ts, lo, side="left")) if lo is not None else 0
+        j = int(np.searchsorted(ts, hi, side="right")) if hi is not None else len(mm)
+        if j > i:
+            parts.append(np.array(mm[i:j]))
+        del mm
+    if not parts:
+        return np.empty(0, dtype=dtype)
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def read(segment: str, token: str, timeframe: str, start=None, end=None) -> pd.DataFrame:
+    """
+    Stored bars as a DataFrame with the parse_api_csv columns.
+    """
+    return to_frame(read_records(segment, token, timeframe, start, end))
+
+
+def load_history(segment: str, token: str, timeframe: str = "day", start=None, end=None,
+                 as_frame: bool = True):
+    """
+    Stored history for start..end (inclusive; datetimes, strings or None for open ends).
+    as_frame=True returns a DataFrame (datetime, open, high, low, close, volume, oi);
+    as_frame=False returns a dict of numpy arrays with the same keys, "datetime"
+    as datetime64[ns]. Nothing is fetched from the network.
+    """
+    records = read_records(segment, token, timeframe, start, end)
+    if as_frame:
+        return to_frame(records)
+    out = {"datetime": records["ts"].view("datetime64[ns]")}
+    for name in records.dtype.names[1:]:
+        out[name] = records[name]
+    return out
+
+
+def last_timestamp(segment: str, token: str, timeframe: str) -> Optional[pd.Timestamp]:
+    parts = list_partitions(segment, token, timeframe)
+    dtype = dtype_for(timeframe)
+    for _, path in reversed(parts):
+        ts = _last_ts(path, dtype)
+        if ts is not None:
+            return pd.Timestamp(ts)
+    return None
+
+
+def first_timestamp(segment: str, token: str, timeframe: str) -> Optional[pd.Timestamp]:
+    dtype = dtype_for(timeframe)
+    for _, path in list_partitions(segment, token, timeframe):
+        if os.path.getsize(path) >= dtype.itemsize:
+            with open(path, "rb") as f:
+                return pd.Timestamp(int(np.frombuffer(f.read(8), dtype="<i8")[0]))
+    return None
+
+
+def row_count(segment: str, token: str, timeframe: str) -> int:
+    itemsize = dtype_for(timeframe).itemsize
+    return sum(os.path.getsize(path) // itemsize for _, path in list_partitions(segment, token, timeframe))
+
+
+def refresh_catalog(segment: str, token: str, timeframe: str):
+    """
+    Write the series' current first/last bar and row count to the catalog
+    (only file sizes and two records are read).
+    """
+    historical_catalog.record(segment, token, timeframe, first_timestamp(segment, token, timeframe),
+                              last_timestamp(segment, token, timeframe), row_count(segment, token, timeframe))
+
+
+def list_series() -> List[Tuple[str, str, str]]:
+    """
+    (segment, token, timeframe) of every series present in the store.
+    """
+    out = []
+    for directory in glob.glob(os.path.join(STORE_DIR, "*", "*", "*")):
+        if not os.path.isdir(directory):
+            continue
+        rest, token = os.path.split(directory)
+        rest, timeframe = os.path.split(rest)
+        segment = os.path.basename(rest)
+        out.append((segment, token, timeframe))
+    return sorted(out)
+
+
+def legacy_csv_path(segment: str, token: str, timeframe: str) -> str:
+    return os.path.join(STORE_DIR, segment.upper(), f"{token}_{timeframe}.csv")
+
+
+def migrate_csv(segment: str, token: str, timeframe: str, remove: bool = False) -> int:
+    """
+    Import one legacy {token}_{timeframe}.csv into the store. Returns rows imported.
+    """
+    path = legacy_csv_path(segment, token, timeframe)
+    if not os.path.exists(path):
+        return 0
+    try:
+        df = pd.read_csv(path, parse_dates=["datetime"])
+    except Exception as e:
+        # empty placeholder files have no header
+        debug_log(f"migrate_csv: skipping unreadable {path}: {e}")
+        df = pd.DataFrame()
+    rows = append(segment, token, timeframe, df)
+    if remove:
+        os.remove(path)
+    return rows
+
+
+def migrate_csv_store(remove: bool = False) -> Dict[str, int]:
+    """
+    One-time migration of every data/historical/{SEG}/{token}_{tf}.csv into the
+    store. Returns {csv path: rows imported}.
+    """
+    out = {}
+    for path in sorted(glob.glob(os.path.join(STORE_DIR, "*", "*_*.csv"))):
+        segment = os.path.basename(os.path.dirname(path))
+        token, _, timeframe = os.path.splitext(os.path.basename(path))[0].rpartition("_")
+        out[path] = migrate_csv(segment, token, timeframe, remove=remove)
+    debug_log(f"migrate_csv_store: {len(out)} files, {sum(out.values())} rows")
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+    if "--migrate" in sys.argv:
+        res = migrate_csv_store(remove="--remove" in sys.argv)
+        print(f"Migrated {len(res)} files, {sum(res.values())} rows")
@@ -1,21 +1,31 @@
 # historical_utils.py
+import io
 import os
 import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 
+import numpy as np
 import pandas as pd
-import requests
+import http_client
 from dateutil import parser
 
 from debug_utils import debug_log
+import historical_catalog
+import historical_store
 import session_utils  # to get active session automatically
 
 HIST_DIR = os.path.join("data", "historical")
 os.makedirs(HIST_DIR, exist_ok=True)
 
+# broker timestamp formats, keyed by length of the all-digit string
+FIXED_DT_FORMATS = {12: "%d%m%Y%H%M", 8: "%d%m%Y"}
+
 
 def get_data_path(segment: str, token: str, timeframe: str) -> str:
+    """
+    Legacy per-token CSV location; new data lives in historical_store.
+    """
     seg_dir = os.path.join(HIST_DIR, segment.upper())
     os.makedirs(seg_dir, exist_ok=True)
     fname = f"{token}_{timeframe}.csv"
@@ -26,6 +36,13 @@ def _try_parse_datetime(s: str) -> Optional[datetime]:
     if s is None:
         return None
     s = str(s).strip().strip('"')
+    # broker format ddMMyyyyHHMM / ddMMyyyy (dateutil misreads these as epochs)
+    fmt = FIXED_DT_FORMATS.get(len(s)) if s.isdigit() else None
+    if fmt:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            pass
     # try flexible parser
     try:
         return parser.parse(s)
@@ -43,11 +60,124 @@ def _try_parse_datetime(s: str) -> Optional[datetime]:
     return None
 
 
+def _ns_or_nat(parsed: pd.Series) -> pd.Series:
+    # datetime64[ns] only spans 1677-2262: anything outside (a stray "0915" read as
+    # year 915, a far-future epoch) becomes NaT and its row is dropped, not the response
+    ok = parsed.notna() & (parsed >= pd.Timestamp.min) & (parsed <= pd.Timestamp.max)
+    return parsed.where(ok).astype("datetime64[ns]")
+
+
+def _fixed_format_datetimes(digits: pd.Series, length: int) -> pd.Series:
+    # ddMMyyyyHHMM / ddMMyyyy digit strings -> datetimes via integer arithmetic
+    v = digits.astype(np.int64)
+    if length == 12:
+        hour, minute = (v // 100) % 100, v % 100
+        v = v // 10000
+    else:
+        hour = minute = 0
+    parts = pd.DataFrame({"year": v % 10000, "month": (v // 10000) % 100, "day": v // 1000000,
+                          "hour": hour, "minute": minute}, index=digits.index)
+    return _ns_or_nat(pd.to_datetime(parts, errors="coerce"))
+
+
+def _parse_datetimes(col: pd.Series) -> pd.Series:
+    """
+    Vectorized timestamp parsing: ddMMyyyyHHMM / ddMMyyyy and 10/13-digit epochs
+    are converted column-wise; only rows that fail those go through
+    _try_parse_datetime one at a time.
+    """
+    s = col.fillna("").astype(str).str.strip().str.strip('"')
+    digits = s.str.isdigit()
+    lengths = s.str.len()
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    for length in FIXED_DT_FORMATS:
+        m = digits & (lengths == length)
+        if m.any():
+            out[m] = _fixed_format_datetimes(s[m], length)
+    for length in (10, 13):
+        m = digits & (lengths == length)
+        if m.any():
+            secs = s[m].astype(np.int64)
+            if length == 13:
+                secs = secs // 1000
+            out[m] = _ns_or_nat(pd.to_datetime(secs, unit="s", errors="coerce"))
+    failed = out.isna()
+    if failed.any():
+        parsed = [_try_parse_datetime(v) for v in s[failed]]
+        parsed = [d.replace(tzinfo=None) if d is not None and d.tzinfo else d for d in parsed]
+        out[failed] = _ns_or_nat(pd.to_datetime(pd.Series(parsed, index=s[failed].index, dtype=object),
+                                                errors="coerce"))
+    return out
+
+
+def _to_float(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    # (values, bad): blanks are NaN, bad flags non-blank text that does not parse
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(np.float64), pd.Series(False, index=col.index)
+    text = col.fillna("").astype(str).str.strip()
+    values = pd.to_numeric(text.where(text != ""), errors="coerce").astype(np.float64)
+    return values, values.isna() & (text != "")
+
+
+def _read_api_frame(text: str, width: int) -> pd.DataFrame:
+    # index_col=False: lines wider than `width` must not turn their leading fields into an index
+    try:
+        return pd.read_csv(io.StringIO(text), header=None, names=range(width), dtype={0: str},
+                           index_col=False, usecols=range(width))
+    except pd.errors.ParserError:
+        # rows with more fields than we use
+        widest = max(l.count(",") for l in text.splitlines()) + 1
+        return pd.read_csv(io.StringIO(text), header=None, names=range(widest), usecols=range(width),
+                           dtype={0: str})
+
+
 def parse_api_csv(text: str, timeframe: str) -> pd.DataFrame:
     """
     Parse CSV returned by historical API (no headers).
     day/minute -> datetime, open, high, low, close, volume, [oi]
     tick -> utc(epoch) , ltp, ltq, [oi]
+    Whole columns are converted at once; rows with too few fields, an unparseable
+    timestamp or bad prices are dropped, as in _parse_api_csv_rowwise.
+    """
+    if not (text or "").strip():
+        return pd.DataFrame()
+    candles = timeframe in ("day", "minute")
+    names = ["datetime", "open", "high", "low", "close", "volume", "oi"] if candles else ["datetime", "ltp", "ltq", "oi"]
+    raw = _read_api_frame(text, len(names))
+
+    qty_col = len(names) - 2
+    if raw[qty_col].isna().any():
+        # blank vs missing volume/ltq only differs in field count: check those lines
+        lines = [l.strip() for l in text.splitlines() if l.strip()]
+        if len(lines) != len(raw):
+            return _parse_api_csv_rowwise(text, timeframe)
+        nfields = pd.Series([lines[i].count(",") + 1 for i in np.flatnonzero(raw[qty_col].isna())],
+                            index=raw.index[raw[qty_col].isna()])
+        raw = raw.drop(nfields.index[nfields < qty_col + 1])
+
+    keep = pd.Series(True, index=raw.index)
+    data = {"datetime": _parse_datetimes(raw[0])}
+    keep &= data["datetime"].notna()
+    for i, name in enumerate(names[1:qty_col], start=1):
+        data[name], bad = _to_float(raw[i])
+        keep &= ~bad
+    qty, bad = _to_float(raw[qty_col])
+    keep &= ~bad
+    data[names[qty_col]] = qty.fillna(0)
+    data["oi"], _ = _to_float(raw[len(names) - 1])  # bad oi becomes NaN, the row is kept
+
+    df = pd.DataFrame(data)[keep]
+    df[names[qty_col]] = np.trunc(df[names[qty_col]]).astype(np.int64)
+    if df.empty:
+        return df.reset_index(drop=True)
+    df = df.drop_duplicates(subset=["datetime"]).sort_values("datetime").reset_index(drop=True)
+    return df
+
+
+def _parse_api_csv_rowwise(text: str, timeframe: str) -> pd.DataFrame:
+    """
+    Row-by-row reference implementation of parse_api_csv, kept for
+    equivalence checks and the benchmark below.
     """
     lines = [l.strip() for l in (text or "").splitlines() if l.strip()]
     if not lines:
@@ -110,11 +240,13 @@ def parse_api_csv(text: str, timeframe: str) -> pd.DataFrame:
     return df
 
 
-def fetch_historical_raw(session_key: Optional[str], segment: str, token: str, timeframe: str, from_dt: str, to_dt: str, timeout: int = 60) -> str:
+def history_response(session_key: Optional[str], segment: str, token: str, timeframe: str, from_dt: str, to_dt: str,
+                     timeout: int = 60, stream: bool = False):
     """
-    Return raw CSV text from Definedge historical endpoint. If session_key is None,
-    attempt to fetch from session_utils.get_active_session().
-    from_dt and to_dt should be in ddMMyyyyHHmm
+    GET the Definedge historical endpoint and return the checked response.
+    If session_key is None, attempt to fetch from session_utils.get_active_session().
+    from_dt and to_dt should be in ddMMyyyyHHmm. With stream=True the body is
+    left unread (see history_stream); compressed transfer is requested either way.
     """
     if not session_key:
         s = session_utils.get_active_session()
@@ -122,44 +254,58 @@ def fetch_historical_raw(session_key: Optional[str], segment: str, token: str, t
             raise RuntimeError("No active session. Please login through Streamlit.")
         session_key = s.get("api_session_key")
 
-    url = f"https://data.definedgesecurities.com/sds/history/{segment}/{token}/{timeframe}/{from_dt}/{to_dt}"
-    headers = {"Authorization": session_key}
-    debug_log(f"fetch_historical_raw: GET {url}")
-    resp = requests.get(url, headers=headers, timeout=timeout)
+    url = f"{http_client.DATA_BASE_URL}/history/{segment}/{token}/{timeframe}/{from_dt}/{to_dt}"
+    headers = {"Authorization": session_key, "Accept-Encoding": "gzip, deflate"}
+    debug_log(f"history_response: GET {url}")
+    resp = http_client.get(url, headers=headers, timeout=timeout, stream=stream)
     if resp.status_code == 401:
+        resp.close()
         # session invalid -> remove local session to force re-login
         try:
             session_utils.logout_session()
         except Exception:
             pass
         raise RuntimeError("Session expired/unauthorized (401). Please login again.")
-    resp.raise_for_status()
-    return resp.text
+    if resp.status_code != 200:
+        raise RuntimeError(f"API error: {resp.status_code} {resp.text[:500]}")
+    return resp
+
+
+def fetch_historical_raw(session_key: Optional[str], segment: str, token: str, timeframe: str, from_dt: str, to_dt: str, timeout: int = 60) -> str:
+    """
+    Return raw CSV text from Definedge historical endpoint. If session_key is None,
+    attempt to fetch from session_utils.get_active_session().
+    from_dt and to_dt should be in ddMMyyyyHHmm
+    Prefer history_stream.fetch_history_records for large ranges.
+    """
+    return history_response(session_key, segment, token, timeframe, from_dt, to_dt, timeout).text
 
 
 def update_incremental(session_key: Optional[str], segment: str, token: str, timeframe: str = "day",
-                       start_date: Optional[str] = None, max_retry: int = 2, delay_sec: float = 0.05) -> Tuple[str, pd.DataFrame]:
+                       start_date: Optional[str] = None, max_retry: int = 2, delay_sec: float = 0.05,
+                       workers: int = 4) -> Tuple[str, int]:
     """
-    Update local cached CSV for (segment, token, timeframe).
+    Fetch bars newer than the last stored one for (segment, token, timeframe) and
+    append them to historical_store; existing history is not re-read or rewritten.
+    Long spans are fetched as parallel calendar windows (see range_fetcher) and
+    stored window by window; if a window keeps failing, everything before it is
+    kept and RuntimeError is raised.
+    A legacy CSV for the series is migrated into the store on first use.
     If session_key is None this function will use session_utils.get_active_session().
-    Returns (path, dataframe)
+    Returns (series directory, number of rows added)
     """
+    from range_fetcher import fetch_range
     debug_log(f"update_incremental(segment={segment}, token={token}, timeframe={timeframe}, start_date={start_date})")
-    path = get_data_path(segment, token, timeframe)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    path = historical_store.series_dir(segment, token, timeframe)
 
-    # load existing if present
-    existing = pd.DataFrame()
-    last_dt = None
-    if os.path.exists(path):
-        try:
-            existing = pd.read_csv(path, parse_dates=["datetime"])
-            if not existing.empty:
-                last_dt = existing["datetime"].max().to_pydatetime()
-        except Exception as e:
-            debug_log(f"Failed to read existing historical file {path}: {e}")
-            existing = pd.DataFrame()
-            last_dt = None
+    # watermark from the catalog; fall back to the store for series written before it existed
+    mark = historical_catalog.get(segment, token, timeframe)
+    last_ts = pd.Timestamp(mark["last_dt"]) if mark and mark["last_dt"] else None
+    if mark is None:
+        if historical_store.last_timestamp(segment, token, timeframe) is None and os.path.exists(get_data_path(segment, token, timeframe)):
+            historical_store.migrate_csv(segment, token, timeframe)
+        last_ts = historical_store.last_timestamp(segment, token, timeframe)
+    last_dt = last_ts.to_pydatetime() if last_ts is not None else None
 
     # determine next_dt
     if last_dt is not None:
@@ -180,47 +326,54 @@ def update_incremental(session_key: Optional[str], segment: str, token: str, tim
     now = datetime.now()
     if next_dt >= now:
         debug_log(f"No new data to fetch for token={token}. next_dt >= now")
-        return path, existing
+        return path, 0
 
-    from_str = next_dt.strftime("%d%m%Y%H%M")
-    to_str = now.strftime("%d%m%Y%H%M")
+    # bars still forming at `now` are not stored (fetch_range drops them), so a run
+    # during market hours leaves today for the next one
+    result = fetch_range(session_key, segment, token, timeframe, next_dt, now,
+                         workers=workers, rounds=max_retry, retry_delay=delay_sec, now=now)
+    if result["failed"]:
+        window, error = result["failed"][0]
+        raise RuntimeError(
+            f"{len(result['failed'])} of {result['windows']} windows failed for token={token} "
+            f"(first from {window[0]:%d-%m-%Y %H:%M}: {error}); {result['rows']} rows stored before it"
+        )
+    historical_catalog.mark_checked(segment, token, timeframe, now)
+    if last_dt is None:
+        historical_catalog.mark_covered(segment, token, timeframe, next_dt)
+    debug_log(f"Appended {result['rows']} rows to {path} in {result['windows']} windows")
+    return path, result["rows"]
 
-    # attempt fetch with retries
-    df_new = pd.DataFrame()
-    last_exception = None
-    for attempt in range(max_retry):
-        try:
-            raw = fetch_historical_raw(session_key, segment, token, timeframe, from_str, to_str)
-            df_new = parse_api_csv(raw, timeframe)
-            break
-        except Exception as e:
-            last_exception = e
-            debug_log(f"Attempt {attempt+1} fetch failed for token={token}: {e}")
-            time.sleep(delay_sec * (attempt + 1))
-    if df_new is None or df_new.empty:
-        # nothing new
-        if existing is None or existing.empty:
-            # ensure existence of an empty file
-            existing.to_csv(path, index=False)
-        debug_log(f"No new rows fetched for token={token}")
-        return path, existing
-
-    # unify and save
-    try:
-        df_new["datetime"] = pd.to_datetime(df_new["datetime"])
-    except Exception:
-        pass
-    if not existing.empty:
-        try:
-            existing["datetime"] = pd.to_datetime(existing["datetime"])
-        except Exception:
-            pass
-        final = pd.concat([existing, df_new], ignore_index=True)
-        final = final.drop_duplicates(subset=["datetime"], keep="last")
-    else:
-        final = df_new
 
-    final = final.sort_values("datetime").reset_index(drop=True)
-    final.to_csv(path, index=False)
-    debug_log(f"Wrote {len(final)} rows to {path} (added {len(df_new)} new rows)")
-    return path, final
+if __name__ == "__main__":
+    # parse_api_csv benchmark: rows/sec of the row-wise reference vs the vectorized parser
+    n = 200_000
+    start = datetime(2020, 1, 1, 9, 15)
+    text = "\n".join(
+        f"{(start + timedelta(minutes=i)).strftime('%d%m%Y%H%M')},{100 + i % 7}.5,{101 + i % 5},{99 + i % 3},100.25,{1000 + i},"
+        for i in range(n)
+    )
+    t0 = time.perf_counter()
+    before = _parse_api_csv_rowwise(text, "minute")
+    t1 = time.perf_counter()
+    after = parse_api_csv(text, "minute")
+    t2 = time.perf_counter()
+    print(f"row-wise:   {n / (t1 - t0):12,.0f} rows/sec ({t1 - t0:.2f}s)")
+    print(f"vectorized: {n / (t2 - t1):12,.0f} rows/sec ({t2 - t1:.2f}s)")
+    cols = ["datetime", "open", "high", "low", "close", "volume"]
+    same = len(before) == len(after) and all(before[c].astype(after[c].dtype).equals(after[c]) for c in cols)
+    print("identical output:", same)
+
+    # one unparseable or out-of-range timestamp drops its row, not the whole response
+    good = "16102026,1,2,0.5,1.5,100,"
+    for bad in ("100.5", "0915", "9999999999999", "99999999999", "01019999"):
+        parsed = parse_api_csv(f"{good}\n{bad},1,2,0.5,1.5,100,", "day")
+        assert parsed["datetime"].tolist() == [pd.Timestamp(2026, 10, 16)], bad
+    print("bad timestamps: rows dropped")
+
+    # every line wider than the columns we use (a new trailing field) parses the same
+    wider = "\n".join(line + ",X" for line in text.splitlines()[:1000])
+    assert parse_api_csv(wider, "minute").equals(after.head(1000))
+    ticks = "1760000000,101.5,10,0,extra\n1760000001,101.6,5,0,extra"
+    assert parse_api_csv(ticks, "tick")["ltp"].tolist() == [101.5, 101.6]
+    print("wider responses: columns unchanged")
@@ -0,0 +1,129 @@
+# history_stream.py
+# Streaming parser for Definedge history responses.
+# The body is read in chunks (gzip-decoded on the fly); each run of complete
+# lines is parsed vectorized and copied into a preallocated record array that
+# grows geometrically, so peak memory is about the final arrays plus one chunk
+# instead of the whole response text plus its parsed copy.
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+import historical_store
+from historical_utils import history_response, parse_api_csv
+
+CHUNK_SIZE = 1 << 20
+# parse once at least this many bytes are buffered (small network chunks are batched)
+MIN_BLOCK = 1 << 18
+# rough bytes per CSV line, used to size the buffer from Content-Length
+BYTES_PER_LINE = 40
+MIN_CAPACITY = 1024
+
+
+class RecordBuffer:
+    """
+    Append-only structured array with amortised O(1) growth.
+    """
+    def __init__(self, dtype: np.dtype, capacity: int = MIN_CAPACITY):
+        self._data = np.empty(max(MIN_CAPACITY, int(capacity)), dtype=dtype)
+        self.size = 0
+
+    def extend(self, records: np.ndarray):
+        need = self.size + len(records)
+        if need > len(self._data):
+            grown = np.empty(max(need, len(self._data) * 2), dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:need] = records
+        self.size = need
+
+    def finish(self) -> np.ndarray:
+        """
+        The filled records; trimmed to a compact copy when much of the buffer is unused.
+        """
+        out = self._data[:self.size]
+        if self.size < len(self._data) * 3 // 4:
+            out = out.copy()
+        self._data = out
+        return out
+
+
+def _keep_first(records: np.ndarray) -> np.ndarray:
+    # sort by ts and drop later duplicates, like parse_api_csv's drop_duplicates
+    if len(records) > 1 and not np.all(records["ts"][1:] > records["ts"][:-1]):
+        records = records[np.argsort(records["ts"], kind="stable")]
+        records = records[np.append(True, records["ts"][1:] != records["ts"][:-1])]
+    return records
+
+
+def parse_stream(chunks: Iterable[bytes], timeframe: str, capacity: int = MIN_CAPACITY) -> np.ndarray:
+    """
+    Parse an iterable of response byte chunks into historical_store records
+    (ts as int64 ns). Rows are validated exactly as parse_api_csv does.
+    """
+    buf = RecordBuffer(historical_store.dtype_for(timeframe), capacity)
+    pending = []
+    pending_size = 0
+
+    def consume(block: bytes):
+        if block.strip():
+            df = parse_api_csv(block.decode("utf-8", errors="replace"), timeframe)
+            buf.extend(historical_store.to_records(df, timeframe))
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size < MIN_BLOCK:
+            continue
+        # parse the complete lines, carry the partial last line over
+        block = b"".join(pending)
+        cut = block.rfind(b"\n")
+        if cut < 0:
+            pending = [block]
+            continue
+        consume(block[:cut + 1])
+        pending = [block[cut + 1:]]
+        pending_size = len(pending[0])
+    consume(b"".join(pending))
+    return _keep_first(buf.finish())
+
+
+def fetch_history_records(session_key: Optional[str], segment: str, token: str, timeframe: str,
+                          from_dt: str, to_dt: str, timeout: int = 60, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    """
+    Stream /history/{segment}/{token}/{timeframe}/{from}/{to} into records
+    without holding the response text.
+    """
+    resp = history_response(session_key, segment, token, timeframe, from_dt, to_dt, timeout, stream=True)
+    try:
+        capacity = MIN_CAPACITY
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and not resp.headers.get("Content-Encoding"):
+            capacity = int(length) // BYTES_PER_LINE + 1
+        return parse_stream(resp.iter_content(chunk_size=chunk_size), timeframe, capacity)
+    finally:
+        resp.close()
+
+
+def candles_frame(records: np.ndarray, until=None) -> pd.DataFrame:
+    """
+    Records as the candle frame the pages use: Date, Open, High, Low, Close,
+    Volume, OI. Bars after `until` (e.g. pd.Timestamp.now()) are dropped.
+    """
+    if until is not None:
+        records = records[records["ts"] <= pd.Timestamp(until).value]
+    return pd.DataFrame({
+        "Date": records["ts"].astype("datetime64[ns]"),
+        "Open": records["open"], "High": records["high"], "Low": records["low"],
+        "Close": records["close"], "Volume": records["volume"], "OI": records["oi"],
+    })
+
+
+def fetch_candles(segment: str, token: str, timeframe: str, from_dt: str, to_dt: str, api_key: str,
+                  until=None) -> pd.DataFrame:
+    """
+    Shared candle fetcher for the pages (replaces their read_csv(resp.text) copies).
+    """
+    return candles_frame(fetch_history_records(api_key, segment, token, timeframe, from_dt, to_dt), until)
@@ -1,13 +1,15 @@
 import streamlit as st
 import pandas as pd
-import requests
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-import io
-from utils import integrate_get
+from candle_provider import get_candles, get_panel
+import indicator_cache
+from portfolio_snapshot import get_snapshot
+from symbol_index import get_index
+from sell_signals import SIGNALS, sell_signals, signal_arrays, warnings_for
 
 def is_number(val):
     try:
@@ -15,105 +17,8 @@ def is_number(val):
     except Exception:
         return False
 
-@st.cache_data
-def load_master():
-    df = pd.read_csv("master.csv", sep="\t", header=None)
-    if df.shape[1] == 15:
-        df.columns = [
-            "segment", "token", "symbol", "symbol_series", "series", "unknown1",
-            "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
-            "isin", "unknown7", "company"
-        ]
-        return df[["segment", "token", "symbol", "symbol_series", "series"]]
-    else:
-        df.columns = [
-            "segment", "token", "symbol", "instrument", "series", "isin1",
-            "facevalue", "lot", "something", "zero1", "two1", "one1", "isin", "one2"
-        ]
-        return df[["segment", "token", "symbol", "instrument", "series"]]
-
-def get_token(symbol, segment, master_df):
-    symbol = str(symbol).strip().upper()
-    segment = str(segment).strip().upper()
-    row = master_df[(master_df['symbol'].str.upper() == symbol) & (master_df['segment'].str.upper() == segment)]
-    if not row.empty:
-        return row.iloc[0]['token']
-    if "symbol_series" in master_df.columns:
-        row2 = master_df[(master_df['symbol_series'].str.upper() == symbol) & (master_df['segment'].str.upper() == segment)]
-        if not row2.empty:
-            return row2.iloc[0]['token']
-    if "instrument" in master_df.columns:
-        row3 = master_df[(master_df['instrument'].str.upper() == symbol) & (master_df['segment'].str.upper() == segment)]
-        if not row3.empty:
-            return row3.iloc[0]['token']
-    return None
-
-def get_ltp(exchange, token, api_session_key):
-    if not exchange or not token:
-        return None
-    url = f"https://integrate.definedgesecurities.com/dart/v1/quotes/{exchange}/{token}"
-    headers = {"Authorization": api_session_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            ltp = resp.json().get("ltp", None)
-            try:
-                return float(ltp) if ltp is not None else None
-            except Exception:
-                return None
-    except Exception:
-        pass
-    return None
-
-def get_prev_close(exchange, token, api_session_key):
-    today = datetime.now()
-    for i in range(1, 5):
-        prev_day = today - timedelta(days=i)
-        if prev_day.weekday() < 5:
-            break
-    else:
-        prev_day = today - timedelta(days=1)
-    from_str = prev_day.strftime("%d%m%Y0000")
-    to_str = today.strftime("%d%m%Y%H%M")
-    url = f"https://data.definedgesecurities.com/sds/history/{exchange}/{token}/day/{from_str}/{to_str}"
-    headers = {"Authorization": api_session_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=5)
-        if resp.status_code == 200:
-            rows = resp.text.strip().split("\n")
-            if len(rows) >= 2:
-                prev_row = rows[-2]
-                try:
-                    prev_close = float(prev_row.split(",")[4])
-                    return prev_close
-                except Exception:
-                    return None
-            elif len(rows) == 1:
-                try:
-                    prev_close = float(rows[0].split(",")[4])
-                    return prev_close
-                except Exception:
-                    return None
-    except Exception:
-        pass
-    return None
-
 def fetch_candles_definedge(segment, token, from_dt, to_dt, api_key):
-    url = f"https://data.definedgesecurities.com/sds/history/{segment}/{token}/day/{from_dt}/{to_dt}"
-    headers = {"Authorization": api_key}
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        raise Exception(f"API error: {resp.status_code} {resp.text}")
-    cols = ["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI"]
-    df = pd.read_csv(io.StringIO(resp.text), header=None, names=cols)
-    df = df[df["Dateandtime"].notnull()]
-    df = df[df["Dateandtime"].astype(str).str.strip() != ""]
-    df["Date"] = pd.to_datetime(df["Dateandtime"], format="%d%m%Y%H%M", errors="coerce")
-    df = df.dropna(subset=["Date"])
-    df = df[df["Date"] <= pd.Timestamp.now()]
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df
+    return get_candles(segment, token, "day", from_dt, to_dt, api_key, until=pd.Timestamp.now())
 
 def get_time_range(days, endtime="1530"):
     now = datetime.now()
@@ -123,30 +28,6 @@ def get_time_range(days, endtime="1530"):
     frm = to - timedelta(days=days)
     return frm.strftime("%d%m%Y%H%M"), to.strftime("%d%m%Y%H%M")
 
-def compute_rsi(data, window=14):
-    delta = data['Close'].diff()
-    gain = delta.where(delta > 0, 0)
-    loss = -delta.where(delta < 0, 0)
-    avg_gain = gain.rolling(window=window).mean()
-    avg_loss = loss.rolling(window=window).mean()
-    avg_loss = avg_loss.replace(0, 1e-10)
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
-def compute_macd(data, slow=26, fast=12, signal=9):
-    ema_slow = data['Close'].ewm(span=slow, adjust=False).mean()
-    ema_fast = data['Close'].ewm(span=fast, adjust=False).mean()
-    macd = ema_fast - ema_slow
-    signal_line = macd.ewm(span=signal, adjust=False).mean()
-    return macd, signal_line
-
-def safe_float(val):
-    try:
-        return float(val)
-    except Exception:
-        return 0.0
-
 def highlight_pnl(val):
     try:
         val = float(val)
@@ -161,69 +42,10 @@ def highlight_pnl(val):
 def minervini_sell_signals(df, lookback_days=15):
     if len(df) < lookback_days:
         return {"error": "Insufficient data for analysis"}
-    recent = df.tail(lookback_days).copy()
-    recent['change'] = recent['Close'].pct_change() * 100
-    recent['spread'] = recent['High'] - recent['Low']
-    signals = {
-        'up_days': 0,
-        'down_days': 0,
-        'up_day_percent': 0,
-        'largest_up_day': 0,
-        'largest_spread': 0,
-        'exhaustion_gap': False,
-        'high_volume_reversal': False,
-        'churning': False,
-        'heavy_volume_down': False,
-        'warnings': []
-    }
-    for i in range(1, len(recent)):
-        if recent['Close'].iloc[i] > recent['Close'].iloc[i-1]:
-            signals['up_days'] += 1
-        elif recent['Close'].iloc[i] < recent['Close'].iloc[i-1]:
-            signals['down_days'] += 1
-    signals['up_day_percent'] = (signals['up_days'] / lookback_days) * 100
-    signals['largest_up_day'] = recent['change'].max()
-    signals['largest_spread'] = recent['spread'].max()
-    recent['gap_up'] = recent['Open'] > recent['High'].shift(1)
-    recent['gap_down'] = recent['Open'] < recent['Low'].shift(1)
-    recent['gap_filled'] = False
-    for i in range(1, len(recent)):
-        if recent['gap_up'].iloc[i]:
-            if recent['Low'].iloc[i] <= recent['High'].shift(1).iloc[i]:
-                recent.at[recent.index[i], 'gap_filled'] = True
-                signals['exhaustion_gap'] = True
-    avg_volume = recent['Volume'].mean()
-    for i in range(1, len(recent)):
-        if recent['Volume'].iloc[i] > avg_volume * 1.5:
-            range_ = recent['High'].iloc[i] - recent['Low'].iloc[i]
-            if (recent['High'].iloc[i] > recent['High'].iloc[i-1] and
-                (recent['Close'].iloc[i] - recent['Low'].iloc[i]) < range_ * 0.25):
-                signals['high_volume_reversal'] = True
-                break
-    if recent['Volume'].iloc[-1] > avg_volume * 1.8:
-        price_change = abs(recent['Close'].iloc[-1] - recent['Open'].iloc[-1])
-        if price_change < recent['spread'].iloc[-1] * 0.15:
-            signals['churning'] = True
-    if recent['Volume'].iloc[-1] > avg_volume * 1.5 and recent['change'].iloc[-1] < -3:
-        signals['heavy_volume_down'] = True
-    if signals['up_day_percent'] >= 70:
-        signals['warnings'].append(
-            f"⚠️ {signals['up_day_percent']:.0f}% up days ({signals['up_days']}/{lookback_days}) - "
-            "Consider selling into strength"
-        )
-    if signals['largest_up_day'] > 5:
-        signals['warnings'].append(
-            f"⚠️ Largest up day: {signals['largest_up_day']:.2f}% - "
-            "Potential climax run"
-        )
-    if signals['exhaustion_gap']:
-        signals['warnings'].append("⚠️ Exhaustion gap detected - Potential reversal signal")
-    if signals['high_volume_reversal']:
-        signals['warnings'].append("⚠️ High-volume reversal - Institutional selling")
-    if signals['churning']:
-        signals['warnings'].append("⚠️ Churning detected (high volume, low progress) - Distribution likely")
-    if signals['heavy_volume_down']:
-        signals['warnings'].append("⚠️ Heavy volume down day - Consider exiting position")
+    recent = df.tail(lookback_days)
+    arrays = [recent[col].to_numpy(dtype=np.float64)[None, :] for col in ("Open", "High", "Low", "Close", "Volume")]
+    signals = {name: value[0].item() for name, value in signal_arrays(*arrays, lookback_days).items()}
+    signals['warnings'] = warnings_for(signals, lookback_days)
     return signals
 
 def open_risk_status(open_risk):
@@ -251,55 +73,24 @@ def app():
     st.title("Holdings Details Dashboard")
 
     api_session_key = st.secrets.get("integrate_api_session_key", "")
-    master_df = load_master()
-    data = integrate_get("/holdings")
-    holdings = data.get("data", [])
-    if not holdings:
+    symbols = get_index()
+    snap = get_snapshot(api_session_key)
+    holdings = snap.holdings
+    if holdings.empty:
         st.warning("No holdings found.")
         return
 
     rows = []
-    for h in holdings:
-        ts = h.get("tradingsymbol")
-        if isinstance(ts, list):
-            if ts:
-                if isinstance(ts[0], dict):
-                    tsym = ts[0].get("tradingsymbol", "N/A")
-                    exch = ts[0].get("exchange", h.get("exchange", "NSE"))
-                    segment = ts[0].get("segment", exch)
-                else:
-                    tsym = str(ts[0])
-                    exch = h.get("exchange", "NSE")
-                    segment = exch
-            else:
-                tsym = "N/A"
-                exch = h.get("exchange", "NSE")
-                segment = exch
-        elif isinstance(ts, dict):
-            tsym = ts.get("tradingsymbol", "N/A")
-            exch = ts.get("exchange", h.get("exchange", "NSE"))
-            segment = ts.get("segment", exch)
-        else:
-            tsym = str(ts) if ts is not None else "N/A"
-            exch = h.get("exchange", "NSE")
-            segment = exch
-
-        isin = h.get("isin", "")
-        product = h.get("product", "")
-        try:
-            qty = float(h.get("dp_qty", 0) or 0)
-        except Exception:
-            qty = 0.0
-        try:
-            entry = float(h.get("avg_buy_price", 0) or 0)
-        except Exception:
-            entry = 0.0
+    for h, hold in zip(snap.raw_holdings, holdings.itertuples(index=False)):
+        tsym, exch = hold.symbol, hold.exchange
+        isin = hold.isin
+        product = hold.product
+        qty = 0.0 if np.isnan(hold.dp_qty) else hold.dp_qty
+        entry = 0.0 if np.isnan(hold.avg_price) else hold.avg_price
         invested = entry * qty
 
-        token = get_token(tsym, segment, master_df)
-        ltp = get_ltp(exch, token, api_session_key) if token else None
-        if not (is_number(ltp) and ltp > 0):
-            ltp = get_prev_close(exch, token, api_session_key) if token else None
+        # no quote: fall back to the previous close
+        ltp = hold.ltp if hold.ltp > 0 else hold.prev_close
 
         if is_number(ltp) and ltp > 0:
             current_value = ltp * qty
@@ -437,12 +228,51 @@ def app():
         "If gain >30%, SL = Entry +20% (Excellent Profit)."
     )
 
+    st.subheader("🔥 Portfolio Sell-Signal Heatmap")
+    heatmap_lookback = st.slider("Heatmap Lookback (days)", 7, 30, 15, key="heatmap_lookback")
+    holdings_list = [
+        {"symbol": hold.symbol, "segment": hold.segment, "token": hold.token}
+        for hold in holdings.itertuples(index=False) if hold.token and hold.symbol != "N/A"
+    ]
+    if holdings_list:
+        from_dt, to_dt = get_time_range(max(60, heatmap_lookback * 3))
+        panel = get_panel(holdings_list, "day", from_dt, to_dt, api_key=api_session_key, until=pd.Timestamp.now())
+        signal_df = sell_signals(panel, heatmap_lookback).sort_values(
+            ["signal_count", "up_day_percent"], ascending=False
+        ).reset_index(drop=True)
+        flagged = signal_df[signal_df["enough_data"]]
+        if not flagged.empty:
+            fig_heat = px.imshow(
+                flagged[list(SIGNALS)].astype(int).to_numpy(),
+                x=list(SIGNALS.values()),
+                y=flagged["symbol"],
+                color_continuous_scale=[[0, "#e8f5e9"], [1, "#d32f2f"]],
+                zmin=0, zmax=1,
+                aspect="auto",
+                title=f"Minervini Sell Signals, last {heatmap_lookback} sessions"
+            )
+            fig_heat.update_coloraxes(showscale=False)
+            fig_heat.update_layout(height=max(300, 28 * len(flagged) + 120))
+            st.plotly_chart(fig_heat, use_container_width=True)
+            st.dataframe(
+                flagged[["symbol", "signal_count", "up_days", "up_day_percent", "largest_up_day",
+                         "largest_spread"] + list(SIGNALS)].rename(columns={
+                    "symbol": "Symbol", "signal_count": "Signals", "up_days": "Up Days",
+                    "up_day_percent": "Up Day %", "largest_up_day": "Largest Up Day %",
+                    "largest_spread": "Largest Spread", **SIGNALS
+                }).round(2),
+                use_container_width=True
+            )
+        missing = signal_df.loc[~signal_df["enough_data"], "symbol"].tolist()
+        if missing:
+            st.caption(f"Not enough history for: {', '.join(missing)}")
+
     st.subheader("📈 Technical Analysis & Minervini Sell Signals")
     holding_symbols = df["Symbol"].unique()
     if len(holding_symbols):
         selected_symbol = st.selectbox("Select Holding for Chart", sorted(holding_symbols))
         segment = df[df["Symbol"] == selected_symbol]["Exchange"].values[0] if not df[df["Symbol"] == selected_symbol].empty else "NSE"
-        token = get_token(selected_symbol, segment, master_df)
+        token = symbols.token_for(selected_symbol, segment)
         show_ema = st.checkbox("Show EMAs", value=True)
         show_rsi = st.checkbox("Show RSI", value=True)
         show_macd = st.checkbox("Show MACD", value=True)
@@ -453,13 +283,13 @@ def app():
                 chart_df = fetch_candles_definedge(segment, token, from_dt, to_dt, api_key=api_session_key)
                 chart_df = chart_df.sort_values("Date")
                 chart_df = chart_df[chart_df["Date"] <= pd.Timestamp.now()]
-                chart_df['EMA20'] = chart_df['Close'].ewm(span=20, adjust=False).mean()
+                chart_df['EMA20'] = indicator_cache.compute(chart_df, segment, token, "day", "ema", 20)
                 if show_ema:
-                    chart_df['EMA50'] = chart_df['Close'].ewm(span=50, adjust=False).mean()
+                    chart_df['EMA50'] = indicator_cache.compute(chart_df, segment, token, "day", "ema", 50)
                 if show_rsi:
-                    chart_df['RSI'] = compute_rsi(chart_df)
+                    chart_df['RSI'] = indicator_cache.compute(chart_df, segment, token, "day", "rsi_sma", 14)
                 if show_macd:
-                    macd, signal = compute_macd(chart_df)
+                    macd, signal, _ = indicator_cache.compute(chart_df, segment, token, "day", "macd")
                     chart_df['MACD'] = macd
                     chart_df['Signal'] = signal
 
@@ -1,33 +1,26 @@
 import streamlit as st
 import pandas as pd
-from utils import integrate_get
-from utils import integrate_post
+from portfolio_snapshot import get_snapshot
 
 def app():
     st.header("Positions & Holdings")
+    snap = get_snapshot(st.secrets.get("integrate_api_session_key", ""))
 
     st.subheader("Positions")
-    try:
-        data = integrate_get("/positions")
-        positions = data.get("positions", [])
-        if positions:
-            st.dataframe(pd.DataFrame(positions))
-        else:
-            st.info("No positions found.")
-    except Exception as e:
-        st.error(f"Error fetching positions: {e}")
+    if "/positions" in snap.errors:
+        st.error(f"Error fetching positions: {snap.errors['/positions']}")
+    elif snap.raw_positions:
+        st.dataframe(pd.DataFrame(snap.raw_positions))
+    else:
+        st.info("No positions found.")
 
     st.subheader("Holdings")
-    try:
-        data = integrate_get("/holdings")
-        headers = {"Authorization": api_session_key}
-        holdings = data.get("holdings", [])
-        if holdings:
-            st.dataframe(pd.DataFrame(holdings))
-        else:
-            st.info("No holdings found.")
-    except Exception as e:
-        st.error(f"Error fetching holdings: {e}")
+    if "/holdings" in snap.errors:
+        st.error(f"Error fetching holdings: {snap.errors['/holdings']}")
+    elif not snap.holdings.empty:
+        st.dataframe(snap.holdings)
+    else:
+        st.info("No holdings found.")
 
 if __name__ == "__main__":
-    show()
+    app()
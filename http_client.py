@@ -0,0 +1,165 @@
+# http_client.py
+# Process-wide pooled HTTP client shared by every Definedge REST call.
+# One requests.Session per host keeps TCP+TLS connections alive between calls,
+# so a page that fetches 40 quotes pays for the handshake once, not 40 times.
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import rate_limiter
+
+INTEGRATE_BASE_URL = "https://integrate.definedgesecurities.com/dart/v1"
+DATA_BASE_URL = "https://data.definedgesecurities.com/sds"
+SIGNIN_BASE_URL = "https://signin.definedgesecurities.com/auth/realms/debroking/dsbpkc"
+
+# host key -> hostname; anything else goes through the "default" session
+HOSTS = {
+    "integrate": "integrate.definedgesecurities.com",
+    "data": "data.definedgesecurities.com",
+    "signin": "signin.definedgesecurities.com",
+    "app": "app.definedgesecurities.com",
+}
+
+# Per-host pool sizes. pool_maxsize bounds concurrent connections per host,
+# so keep it >= the number of worker threads that hit that host.
+POOL_CONFIG: Dict[str, Dict[str, int]] = {
+    "integrate": {"pool_connections": 2, "pool_maxsize": 16},
+    "data": {"pool_connections": 2, "pool_maxsize": 16},
+    "signin": {"pool_connections": 1, "pool_maxsize": 2},
+    "app": {"pool_connections": 1, "pool_maxsize": 2},
+    "default": {"pool_connections": 1, "pool_maxsize": 4},
+}
+
+DEFAULT_TIMEOUT = 30
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.3
+# 5xx are re-sent by the adapter. 429 is retried in request() instead, after
+# taking a fresh rate-limiter token, so retries never exceed the configured rate.
+RETRY_STATUS = (500, 502, 503, 504)
+RETRY_AFTER_MAX = 30  # seconds; cap on a server-requested Retry-After
+# Only idempotent calls are re-sent after a read error or bad status.
+# POSTs (placeorder etc.) are retried only when the connection itself failed.
+RETRY_METHODS = frozenset({"GET", "HEAD"})
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _build_session(host_key: str) -> requests.Session:
+    cfg = POOL_CONFIG.get(host_key, POOL_CONFIG["default"])
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=cfg["pool_connections"],
+        pool_maxsize=cfg["pool_maxsize"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def host_key_for(url: str) -> str:
+    hostname = urlsplit(url).hostname or ""
+    for key, host in HOSTS.items():
+        if hostname == host:
+            return key
+    return "default"
+
+
+def get_session(host_key: str = "default") -> requests.Session:
+    """
+    Return the shared Session for `host_key`, creating it on first use.
+    """
+    session = _sessions.get(host_key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(host_key)
+        if session is None:
+            session = _build_session(host_key)
+            _sessions[host_key] = session
+    return session
+
+
+def configure(host_key: str, pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None):
+    """
+    Change pool sizes for a host. The existing session (if any) is closed and
+    rebuilt lazily on the next request.
+    """
+    with _lock:
+        cfg = dict(POOL_CONFIG.get(host_key, POOL_CONFIG["default"]))
+        if pool_connections is not None:
+            cfg["pool_connections"] = int(pool_connections)
+        if pool_maxsize is not None:
+            cfg["pool_maxsize"] = int(pool_maxsize)
+        POOL_CONFIG[host_key] = cfg
+        old = _sessions.pop(host_key, None)
+    if old is not None:
+        old.close()
+
+
+def close_all():
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for s in sessions:
+        s.close()
+
+
+def _retry_after(resp: requests.Response, attempt: int) -> float:
+    # Retry-After in seconds or as an HTTP date; exponential backoff without one
+    value = resp.headers.get("Retry-After")
+    delay = RETRY_BACKOFF * (2 ** attempt)
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0.0), RETRY_AFTER_MAX)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request on the pooled session for the URL's host, after taking a
+    token from the rate limiter for the URL's endpoint family. A 429 on an
+    idempotent call is retried (up to RETRY_TOTAL times, after Retry-After),
+    each attempt taking its own token.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    family = rate_limiter.family_for(url)
+    session = get_session(host_key_for(url))
+    retry = method.upper() in RETRY_METHODS
+    attempt = 0
+    while True:
+        rate_limiter.acquire(family)
+        resp = session.request(method, url, **kwargs)
+        if resp.status_code != 429 or not retry or attempt >= RETRY_TOTAL:
+            return resp
+        delay = _retry_after(resp, attempt)
+        resp.close()
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -0,0 +1,217 @@
+# indicator_cache.py
+# Process-wide memo of indicator results shared by every page.
+# A result is keyed by the series (segment, token, timeframe), the indicator
+# and its params, and a watermark of the bars it was computed on: first and
+# last bar timestamp, bar count and the last bar's values (which still move
+# while a session is open). Holdings Details, Symbol Technical Details, the
+# chart demo and the scanner asking for the same EMA/RSI/MACD on the same data
+# get one computation between them. Memory is bounded by bytes (LRU); evicted
+# results can optionally be spilled to disk and are read back on a later miss.
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from debug_utils import debug_log
+from indicator_panel import INDICATORS
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+SPILL_DIR = os.path.join("data", "indicator_cache")
+SPILL_MAX_BYTES = 256 * 1024 * 1024
+
+# candle frame column for each panel field
+_COLUMNS = {"open": "Open", "high": "High", "low": "Low", "close": "Close", "volume": "Volume"}
+
+
+def _nbytes(value) -> int:
+    return sum(v.nbytes for v in value) if isinstance(value, tuple) else value.nbytes
+
+
+def _readonly(value):
+    # results are shared between callers, so nobody may modify them in place
+    for v in (value if isinstance(value, tuple) else (value,)):
+        v.setflags(write=False)
+    return value
+
+
+class IndicatorCache:
+    """
+    LRU of indicator results bounded by max_bytes. With spill_dir set, results
+    pushed out of memory are written there (up to SPILL_MAX_BYTES, oldest
+    files removed first) instead of being dropped.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, spill_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _spill_path(self, key: Hashable) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npz")
+
+    def _spill(self, evicted):
+        if not self.spill_dir or not evicted:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for key, value in evicted:
+                arrays = value if isinstance(value, tuple) else (value,)
+                np.savez(self._spill_path(key), *arrays, is_tuple=isinstance(value, tuple))
+            files = sorted(glob.glob(os.path.join(self.spill_dir, "*.npz")), key=os.path.getmtime)
+            total = sum(os.path.getsize(f) for f in files)
+            while files and total > SPILL_MAX_BYTES:
+                oldest = files.pop(0)
+                total -= os.path.getsize(oldest)
+                os.remove(oldest)
+        except OSError as e:
+            debug_log(f"indicator_cache: spill to {self.spill_dir} failed: {e}")
+
+    def _unspill(self, key: Hashable):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with np.load(path) as f:
+                arrays = tuple(f[f"arr_{i}"] for i in range(len(f.files) - 1))
+                value = arrays if bool(f["is_tuple"]) else arrays[0]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(path)
+        return value
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._unspill(key)
+        if value is not None:
+            self.disk_hits += 1
+            self.put(key, _readonly(value))
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value):
+        size = _nbytes(value)
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._bytes -= _nbytes(self._data.pop(key))
+            self._data[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._data) > 1:
+                old_key, old = self._data.popitem(last=False)
+                self._bytes -= _nbytes(old)
+                evicted.append((old_key, old))
+        self._spill(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes, "hits": self.hits,
+                    "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+_cache: Optional[IndicatorCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> IndicatorCache:
+    """
+    Process-wide cache shared by every page and worker thread.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = IndicatorCache()
+    return _cache
+
+
+def enable_spill(path: str = SPILL_DIR):
+    """
+    Spill results evicted from memory to `path` instead of dropping them.
+    """
+    get_cache().spill_dir = path
+
+
+def _watermark(frame: pd.DataFrame) -> Tuple:
+    if frame.empty:
+        return (0,)
+    dates = frame["Date"]
+    return (len(frame), pd.Timestamp(dates.iat[0]).value, pd.Timestamp(dates.iat[-1]).value,
+            tuple(float(frame[c].iat[-1]) for c in _COLUMNS.values() if c in frame.columns))
+
+
+def compute(frame: pd.DataFrame, segment: str, token, timeframe: str, indicator: str, *params):
+    """
+    INDICATORS[indicator](*params) over a candle frame (Date, Open, High, Low,
+    Close, Volume) of one series, from the cache when any page has already
+    computed it on the same bars. The result (an array, or a tuple for macd)
+    is read-only.
+    """
+    key = (str(segment).upper(), str(token), timeframe, indicator, params, _watermark(frame))
+    cache = get_cache()
+    value = cache.get(key)
+    if value is None:
+        fields, fn = INDICATORS[indicator]
+        inputs = [frame[_COLUMNS[f]].to_numpy(dtype=np.float64)
+                  for f in ((fields,) if isinstance(fields, str) else fields)]
+        value = _readonly(fn(*inputs, *params))
+        cache.put(key, value)
+    return value
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    import indicators
+
+    rng = np.random.default_rng(5)
+    frames = []
+    for i in range(200):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 400)))
+        frames.append(pd.DataFrame({"Date": pd.bdate_range("2024-06-03", periods=400), "Open": close,
+                                    "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                                    "Volume": 1000.0}))
+    t0 = time.perf_counter()
+    for i, df in enumerate(frames):
+        indicators.ema(df["Close"].to_numpy(), 20), indicators.rsi(df["Close"].to_numpy(), 14)
+        indicators.macd(df["Close"].to_numpy())
+    direct = time.perf_counter() - t0
+    for i, df in enumerate(frames):
+        compute(df, "NSE", i, "day", "ema", 20), compute(df, "NSE", i, "day", "rsi", 14), compute(df, "NSE", i, "day", "macd")
+    t0 = time.perf_counter()
+    for i, df in enumerate(frames):
+        compute(df, "NSE", i, "day", "ema", 20), compute(df, "NSE", i, "day", "rsi", 14), compute(df, "NSE", i, "day", "macd")
+    cached = time.perf_counter() - t0
+    assert np.array_equal(compute(frames[3], "NSE", 3, "day", "ema", 20), indicators.ema(frames[3]["Close"], 20))
+    # a new bar (or a moving live bar) is a different watermark
+    moved = frames[3].copy()
+    moved.loc[moved.index[-1], "Close"] *= 1.01
+    assert not np.array_equal(compute(moved, "NSE", 3, "day", "ema", 20), compute(frames[3], "NSE", 3, "day", "ema", 20))
+    print(f"200 series x (ema, rsi, macd): computed {direct:.3f}s, cached {cached:.3f}s, {get_cache().stats()}")
+
+    with tempfile.TemporaryDirectory() as spill:
+        small = IndicatorCache(max_bytes=4000 * 8, spill_dir=spill)
+        for i in range(20):
+            small.put(("k", i), _readonly(np.full(1000, float(i))))
+        assert small.get(("k", 0))[0] == 0.0 and small.disk_hits == 1
+        print(f"spill: {small.stats()}, {len(os.listdir(spill))} files on disk")
@@ -0,0 +1,179 @@
+# indicator_panel.py
+# Symbols x dates panels over historical_store.
+# load_panel() reads every symbol of a watchlist from the local store and
+# aligns them on one date axis (2-D float arrays, NaN before a symbol's first
+# bar, gaps forward-filled), so indicators are computed for the whole
+# universe in one vectorized pass and scan criteria are boolean masks over
+# the last column.
+import time
+from functools import partial
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import historical_store
+import indicators
+from debug_utils import debug_log
+
+DEFAULT_FIELDS = ("open", "high", "low", "close", "volume")
+
+# indicator name -> (input field(s), function); results are cached per panel
+INDICATORS = {
+    "ema": ("close", indicators.ema),
+    "sma": ("close", indicators.sma),
+    "rsi": ("close", indicators.rsi),
+    # the rolling-mean RSI the pages have always shown (rsi above is Wilder's)
+    "rsi_sma": ("close", partial(indicators.rsi, method="sma")),
+    "macd": ("close", indicators.macd),
+    "high": ("high", indicators.rolling_high),
+    "low": ("low", indicators.rolling_low),
+    "updays": ("high", indicators.up_days),
+    "downdays": ("low", indicators.down_days),
+    "atr": (("high", "low", "close"), indicators.atr),
+}
+
+
+def _ffill(values: np.ndarray, present: np.ndarray) -> np.ndarray:
+    # carry the last present value forward along axis 1; leading gaps stay NaN
+    idx = np.where(present, np.arange(values.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return values[np.arange(values.shape[0])[:, None], idx]
+
+
+class Panel:
+    """
+    Aligned bars for many symbols. fields[name] is a float64 array of shape
+    (len(symbols), len(dates)); present[i, j] says whether symbol i had its own
+    bar on dates[j] (False where the value was forward-filled or is missing).
+    """
+    def __init__(self, symbols: List[Dict], dates: np.ndarray, fields: Dict[str, np.ndarray],
+                 present: np.ndarray):
+        self.symbols = symbols
+        self.dates = dates
+        self.fields = fields
+        self.present = present
+        self._cache: Dict = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.fields[name]
+
+    def indicator(self, name: str, *params):
+        """
+        INDICATORS[name] over the whole panel, computed once per (name, params).
+        """
+        key = (name,) + params
+        if key not in self._cache:
+            fields, fn = INDICATORS[name]
+            inputs = [self.fields[f] for f in ((fields,) if isinstance(fields, str) else fields)]
+            self._cache[key] = fn(*inputs, *params)
+        return self._cache[key]
+
+    def last(self, values: np.ndarray) -> np.ndarray:
+        """
+        Last column of a panel-shaped array (the value every scan is evaluated on).
+        """
+        return values[:, -1]
+
+    def is_current(self) -> np.ndarray:
+        """
+        Mask of symbols that have a bar on the last date of the panel.
+        """
+        return self.present[:, -1] if self.present.size else np.zeros(len(self), dtype=bool)
+
+    def select(self, mask: np.ndarray, columns: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        """
+        One row per symbol where mask is True: its symbol fields plus the
+        given per-symbol values (e.g. {"RSI14": panel.last(panel.indicator("rsi", 14))}).
+        """
+        rows = np.flatnonzero(mask)
+        out = pd.DataFrame([self.symbols[i] for i in rows])
+        for name, values in (columns or {}).items():
+            out[name] = np.asarray(values)[rows]
+        return out
+
+
+def build_panel(symbols: List[Dict], series: List, fields=DEFAULT_FIELDS) -> Panel:
+    """
+    Panel from per-symbol bars already in memory: series[i] holds symbols[i]'s
+    bars as anything indexable by "ts" (int64 ns, sorted) and each field name,
+    e.g. historical_store records or a dict of arrays; None for no data.
+    """
+    stamps = [np.asarray(b["ts"], dtype=np.int64) for b in series if b is not None and len(b["ts"])]
+    dates = np.unique(np.concatenate(stamps)) if stamps else np.empty(0, dtype=np.int64)
+    n, t = len(symbols), len(dates)
+    present = np.zeros((n, t), dtype=bool)
+    raw = {name: np.full((n, t), np.nan) for name in fields}
+    for i, bars in enumerate(series):
+        if bars is None or not len(bars["ts"]):
+            continue
+        cols = np.searchsorted(dates, np.asarray(bars["ts"], dtype=np.int64))
+        present[i, cols] = True
+        for name in fields:
+            raw[name][i, cols] = bars[name]
+    return Panel(symbols, dates.view("datetime64[ns]"),
+                 {name: _ffill(values, present) for name, values in raw.items()}, present)
+
+
+def load_panel(symbols: Iterable[Dict], segment: str = "NSE", timeframe: str = "day",
+               start=None, end=None, fields=DEFAULT_FIELDS) -> Panel:
+    """
+    Panel of stored bars for symbol dicts (segment, token, symbol, ...) between
+    start and end. Nothing is fetched: symbols without local data get all-NaN rows.
+    """
+    t0 = time.monotonic()
+    symbols = list(symbols)
+    records = [historical_store.read_records(str(s.get("segment", segment)).upper(), str(s.get("token")),
+                                             timeframe, start, end) for s in symbols]
+    panel = build_panel(symbols, records, fields)
+    debug_log(f"load_panel: {len(symbols)} symbols x {len(panel.dates)} dates in {time.monotonic() - t0:.2f}s")
+    return panel
+
+
+def align(panel: Panel, ts, values, ffill: bool = True) -> np.ndarray:
+    """
+    A single series (e.g. an index's closes; ts as int64 ns or datetime64)
+    placed on panel.dates. Dates the series lacks are NaN, or carry the
+    previous value with ffill.
+    """
+    ts = np.asarray(ts).astype("datetime64[ns]").view(np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    dates = panel.dates.view(np.int64)
+    out = np.full(len(dates), np.nan)
+    pos = np.searchsorted(dates, ts)
+    hit = pos < len(dates)
+    hit[hit] = dates[pos[hit]] == ts[hit]
+    out[pos[hit]] = values[hit]
+    if ffill:
+        present = ~np.isnan(out)
+        out = _ffill(out[None, :], present[None, :])[0]
+    return out
+
+
+if __name__ == "__main__":
+    # synthetic universe: compute every indicator and a scan mask over the panel
+    n, t = 2400, 250
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, (n, t)), axis=1))
+    close[rng.random(n) < 0.05, :60] = np.nan  # recent listings
+    present = ~np.isnan(close)
+    spread = np.abs(rng.normal(0, 0.01, (n, t)))
+    panel = Panel([{"symbol": f"SYM{i}", "token": str(i)} for i in range(n)],
+                  pd.bdate_range("2025-01-01", periods=t).values,
+                  {"close": close, "high": close * (1 + spread), "low": close * (1 - spread)}, present)
+    t0 = time.perf_counter()
+    ltp = panel.last(panel["close"])
+    ema20 = panel.last(panel.indicator("ema", 20))
+    ema50 = panel.last(panel.indicator("ema", 50))
+    rsi14 = panel.last(panel.indicator("rsi", 14))
+    macd_line, signal, _ = panel.indicator("macd")
+    high52 = panel.last(panel.indicator("high", 200))
+    updays = panel.last(panel.indicator("updays", 15))
+    downdays = panel.last(panel.indicator("downdays", 15))
+    mask = ((ema20 / ltp > 0.95) & (ema50 / ema20 > 0.95) & (rsi14 > 60) & (updays > downdays)
+            & (panel.last(macd_line) > panel.last(signal)) & (ltp >= 0.9 * high52))
+    hits = panel.select(mask, {"LTP": ltp, "RSI14": rsi14})
+    print(f"{n} symbols x {t} dates: {len(hits)} matches in {time.perf_counter() - t0:.3f}s")
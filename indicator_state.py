@@ -0,0 +1,306 @@
+# indicator_state.py
+# Incremental indicator state next to historical_store.
+# Recursive indicators (EMA, Wilder RSI) only need a few numbers to continue:
+# the last EMA, the average gain/loss and the last close (the rolling-mean RSI
+# keeps its last period + 1 closes). One row per (segment, token, timeframe,
+# indicator, params) keeps them with the timestamp and values of the last bar
+# consumed, so a daily update reads only the bars after it instead of
+# recomputing over the whole lookback. latest() is what the scanner calls: the
+# stored state carried over a candle frame's unstored bars (the live one).
+# check() compares the state with a full recompute from the store.
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import historical_catalog
+import historical_store
+import indicator_cache
+import indicators
+from debug_utils import debug_log
+
+STATE_PATH = os.path.join("data", "historical", "indicator_state.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indicator_state (
+    segment TEXT NOT NULL,
+    token TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    indicator TEXT NOT NULL,
+    params TEXT NOT NULL,
+    last_ts INTEGER NOT NULL,
+    bars INTEGER NOT NULL,
+    last_bar TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (segment, token, timeframe, indicator, params)
+)
+"""
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    # one connection per thread and path, as in historical_catalog
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(STATE_PATH)
+    if conn is None:
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        conn = sqlite3.connect(STATE_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(indicator_state)")}
+        if "last_bar" not in columns:
+            # states saved before last_bar existed are rebuilt on their next update
+            conn.execute("ALTER TABLE indicator_state ADD COLUMN last_bar TEXT NOT NULL DEFAULT ''")
+        conn.commit()
+        conns[STATE_PATH] = conn
+    return conn
+
+
+# --- per-indicator state machines -------------------------------------------------
+# start(params) -> state; advance(state, closes, params) -> state; value(state, params) -> float
+
+def _ema_start(params: Tuple) -> Dict:
+    return {"ema": None}
+
+
+def _ema_advance(state: Dict, closes: np.ndarray, params: Tuple) -> Dict:
+    alpha = 2.0 / (params[0] + 1)
+    prev = state["ema"]
+    for c in closes:
+        if np.isnan(c):
+            continue
+        prev = float(c) if prev is None else prev + alpha * (float(c) - prev)
+    return {"ema": prev}
+
+
+def _ema_value(state: Dict, params: Tuple) -> float:
+    return np.nan if state["ema"] is None else state["ema"]
+
+
+def _rsi_start(params: Tuple) -> Dict:
+    return {"prev": None, "seen": 0, "sum_gain": 0.0, "sum_loss": 0.0, "avg_gain": None, "avg_loss": None}
+
+
+def _rsi_advance(state: Dict, closes: np.ndarray, params: Tuple) -> Dict:
+    # same recursion as indicators.rsi(method="wilder")
+    period = params[0]
+    s = dict(state)
+    for c in closes:
+        if np.isnan(c):
+            continue
+        c = float(c)
+        if s["prev"] is not None:
+            delta = c - s["prev"]
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if s["avg_gain"] is None:
+                s["seen"] += 1
+                s["sum_gain"] += gain
+                s["sum_loss"] += loss
+                if s["seen"] == period:
+                    s["avg_gain"], s["avg_loss"] = s["sum_gain"] / period, s["sum_loss"] / period
+            else:
+                s["avg_gain"] = (s["avg_gain"] * (period - 1) + gain) / period
+                s["avg_loss"] = (s["avg_loss"] * (period - 1) + loss) / period
+        s["prev"] = c
+    return s
+
+
+def _rsi_value(state: Dict, params: Tuple) -> float:
+    if state["avg_gain"] is None:
+        return np.nan
+    if state["avg_loss"] == 0:
+        return 100.0
+    return 100.0 - 100.0 / (1.0 + state["avg_gain"] / state["avg_loss"])
+
+
+def _rsi_sma_start(params: Tuple) -> Dict:
+    return {"closes": []}
+
+
+def _rsi_sma_advance(state: Dict, closes: np.ndarray, params: Tuple) -> Dict:
+    # a rolling mean has no recursion: keep the closes of the last `period` changes
+    kept = state["closes"] + [float(c) for c in closes[-(params[0] + 1):] if not np.isnan(c)]
+    return {"closes": kept[-(params[0] + 1):]}
+
+
+def _rsi_sma_value(state: Dict, params: Tuple) -> float:
+    if len(state["closes"]) <= params[0]:
+        return np.nan
+    delta = np.diff(state["closes"])
+    avg_gain, avg_loss = np.where(delta > 0, delta, 0.0).mean(), np.where(delta < 0, -delta, 0.0).mean()
+    if avg_loss == 0:
+        return 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+# indicator -> (start, advance, value, full recompute over closes)
+STATEFUL = {
+    "ema": (_ema_start, _ema_advance, _ema_value, lambda closes, params: indicators.ema(closes, *params)),
+    "rsi": (_rsi_start, _rsi_advance, _rsi_value, lambda closes, params: indicators.rsi(closes, *params)),
+    "rsi_sma": (_rsi_sma_start, _rsi_sma_advance, _rsi_sma_value,
+                lambda closes, params: indicators.rsi(closes, *params, method="sma")),
+}
+
+
+def _params_key(params: Tuple) -> str:
+    return ",".join(str(p) for p in params)
+
+
+def _bar_key(record) -> str:
+    # the values of a stored bar, to notice one corrected in place (same ts, same row count)
+    return json.dumps([float(record[f]) for f in ("open", "high", "low", "close", "volume")])
+
+
+def _load(segment: str, token: str, timeframe: str, indicator: str, params: Tuple) -> Optional[Dict]:
+    row = _connect().execute(
+        "SELECT last_ts, bars, last_bar, state FROM indicator_state WHERE segment = ? AND token = ? "
+        "AND timeframe = ? AND indicator = ? AND params = ?",
+        (segment, token, timeframe, indicator, _params_key(params))).fetchone()
+    if row is None:
+        return None
+    return {"last_ts": row[0], "bars": row[1], "last_bar": row[2], "state": json.loads(row[3])}
+
+
+def _save(segment: str, token: str, timeframe: str, indicator: str, params: Tuple, saved: Dict):
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO indicator_state (segment, token, timeframe, indicator, params, last_ts, bars, "
+        "last_bar, state, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (segment, token, timeframe, indicator, _params_key(params), int(saved["last_ts"]), int(saved["bars"]),
+         saved["last_bar"], json.dumps(saved["state"]), datetime.now().isoformat(timespec="seconds")))
+    conn.commit()
+
+
+def reset(segment: Optional[str] = None, token=None):
+    """
+    Drop stored state (all of it, one segment, or one series); it is rebuilt on the next update.
+    """
+    sql, args = "DELETE FROM indicator_state WHERE 1 = 1", []
+    if segment is not None:
+        sql += " AND segment = ?"
+        args.append(segment.upper())
+    if token is not None:
+        sql += " AND token = ?"
+        args.append(str(token))
+    conn = _connect()
+    conn.execute(sql, args)
+    conn.commit()
+
+
+def _advance(segment: str, token: str, timeframe: str, indicator: str, params: Tuple) -> Dict:
+    start, advance, _, _ = STATEFUL[indicator]
+    saved = _load(segment, token, timeframe, indicator, params)
+    mark = historical_catalog.get(segment, token, timeframe)
+    stored_rows = mark["row_count"] if mark else 0
+    if saved is not None:
+        # from the last consumed bar on: it must still be there, unchanged
+        new = historical_store.read_records(segment, token, timeframe, pd.Timestamp(saved["last_ts"]))
+        if (not len(new) or int(new["ts"][0]) != saved["last_ts"] or _bar_key(new[0]) != saved["last_bar"]
+                or saved["bars"] + len(new) - 1 != stored_rows):
+            debug_log(f"indicator_state: {segment}/{token}/{timeframe} {indicator}{params} out of step, rebuilding")
+            saved = None
+        else:
+            new = new[1:]
+    if saved is None:
+        new = historical_store.read_records(segment, token, timeframe)
+        saved = {"last_ts": -1, "bars": 0, "last_bar": "", "state": start(params)}
+    if len(new):
+        saved["state"] = advance(saved["state"], new["close"], params)
+        saved["last_ts"] = int(new["ts"][-1])
+        saved["last_bar"] = _bar_key(new[-1])
+        saved["bars"] += len(new)
+        _save(segment, token, timeframe, indicator, params, saved)
+    return saved
+
+
+def update(segment: str, token, timeframe: str, indicator: str, *params) -> float:
+    """
+    Advance the stored state over bars added since its last update and return
+    the indicator value at the last stored bar. Only bars newer than the state
+    are read; if the series was rewritten underneath it (bar count no longer
+    adds up, or the last consumed bar is gone or changed), the state is
+    rebuilt from the full history.
+    """
+    saved = _advance(segment.upper(), str(token), timeframe, indicator, params)
+    return STATEFUL[indicator][2](saved["state"], params)
+
+
+def latest(frame: pd.DataFrame, segment: str, token, timeframe: str, indicator: str, *params) -> float:
+    """
+    Indicator value at the last bar of a candle frame (Date, Close, ...) of a
+    stored series: the stored state (over the whole stored history) carried
+    over the frame's bars after it, e.g. today's live bar, without saving
+    those. Falls back to indicator_cache over the frame when the state cannot
+    be used (nothing stored, the frame ends earlier or disagrees with the store).
+    """
+    segment, token = str(segment).upper(), str(token)
+    _, advance, value, _ = STATEFUL[indicator]
+    try:
+        saved = _advance(segment, token, timeframe, indicator, params)
+    except (OSError, sqlite3.Error, ValueError) as e:
+        debug_log(f"indicator_state: {segment}/{token}/{timeframe} unavailable, recomputing: {e}")
+        saved = None
+    if saved is not None and saved["bars"] and len(frame):
+        ts = frame["Date"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        at = np.flatnonzero(ts == saved["last_ts"])
+        if len(at) and float(frame["Close"].iat[at[0]]) == json.loads(saved["last_bar"])[3]:
+            closes = frame["Close"].to_numpy(dtype=np.float64)[at[0] + 1:]
+            state = advance(saved["state"], closes, params) if len(closes) else saved["state"]
+            return float(value(state, params))
+    return float(indicator_cache.compute(frame, segment, token, timeframe, indicator, *params)[-1])
+
+
+def update_many(symbols: Iterable[Dict], timeframe: str, indicator: str, *params,
+                segment: str = "NSE") -> Dict[str, float]:
+    """
+    token -> current value for symbol dicts (segment, token, ...).
+    """
+    return {str(s.get("token")): update(str(s.get("segment", segment)), s.get("token"), timeframe, indicator, *params)
+            for s in symbols}
+
+
+def check(segment: str, token, timeframe: str, indicator: str, *params, rtol: float = 1e-9) -> Dict:
+    """
+    Compare the stored state with a full recompute over the stored history.
+    """
+    segment, token = segment.upper(), str(token)
+    _, _, value, full = STATEFUL[indicator]
+    saved = _load(segment, token, timeframe, indicator, params)
+    records = historical_store.read_records(segment, token, timeframe)
+    recomputed = full(records["close"], params)[-1] if len(records) else np.nan
+    incremental = value(saved["state"], params) if saved else np.nan
+    behind = saved is None or not len(records) or saved["last_ts"] != int(records["ts"][-1])
+    same = (np.isnan(recomputed) and np.isnan(incremental)) or bool(np.isclose(incremental, recomputed, rtol=rtol))
+    return {"segment": segment, "token": token, "timeframe": timeframe, "indicator": indicator,
+            "params": _params_key(params), "incremental": incremental, "full": recomputed,
+            "behind": behind, "ok": same and not behind}
+
+
+def check_all(rtol: float = 1e-9) -> pd.DataFrame:
+    """
+    check() every stored state; rows with ok == False need reset() or a fresh update().
+    """
+    rows: List[Dict] = []
+    cur = _connect().execute("SELECT segment, token, timeframe, indicator, params FROM indicator_state")
+    for segment, token, timeframe, indicator, params in cur.fetchall():
+        parsed = tuple(int(p) for p in params.split(",") if p)
+        rows.append(check(segment, token, timeframe, indicator, *parsed, rtol=rtol))
+    df = pd.DataFrame(rows)
+    bad = int((~df["ok"]).sum()) if len(df) else 0
+    debug_log(f"indicator_state.check_all: {len(df)} states, {bad} inconsistent")
+    return df
+
+
+if __name__ == "__main__":
+    report = check_all()
+    print(report[~report["ok"]] if len(report) else "no stored indicator state")
+    print(f"{len(report)} states checked")
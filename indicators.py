@@ -0,0 +1,282 @@
+# indicators.py
+# The one indicator library every page and scanner uses: EMA, SMA, RSI
+# (Wilder, or rolling-mean as the pages used to compute it), MACD, ATR,
+# rolling highs/lows and up/down-day counts, over 1-D series (numpy arrays or
+# pandas Series) or 2-D panels (symbols x dates, time along the last axis).
+# Recursive indicators (EMA, Wilder RSI) loop over dates with numpy ops across
+# all symbols at once (a single series goes through pandas' compiled ewm
+# instead, where the per-date numpy overhead would dominate); windowed ones use
+# cumulative sums or block prefix/suffix maxima, so cost is O(symbols x dates)
+# whatever the window.
+# NaN marks a missing bar: leading NaNs (not listed yet) stay NaN; in EMA and
+# RSI a NaN after the first value carries the previous value forward.
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _as_2d(values) -> Tuple[np.ndarray, bool]:
+    x = np.asarray(values, dtype=np.float64)
+    return (x, True) if x.ndim == 2 else (x.reshape(1, -1), False)
+
+
+def _shape_like(out: np.ndarray, two_d: bool) -> np.ndarray:
+    return out if two_d else out[0]
+
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    # sum of the last `window` values along axis 1 (partial windows at the start)
+    c = np.cumsum(x, axis=1)
+    out = c.copy()
+    out[:, window:] = c[:, window:] - c[:, :-window]
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, window: int, fn) -> np.ndarray:
+    # van Herk / Gil-Werman: block prefix and suffix extremes, O(n) for any window
+    n_rows, n = x.shape
+    pad = (-n) % window
+    xp = np.concatenate([x, np.full((n_rows, pad), np.nan)], axis=1) if pad else x
+    blocks = xp.reshape(n_rows, -1, window)
+    prefix = fn.accumulate(blocks, axis=2).reshape(n_rows, -1)
+    suffix = fn.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_rows, -1)
+    out = np.full((n_rows, n), np.nan)
+    if n >= window:
+        # window ending at t covers [t - window + 1, t]
+        out[:, window - 1:] = fn(suffix[:, :n - window + 1], prefix[:, window - 1:n])
+    out[_rolling_sum((~np.isnan(x)).astype(np.float64), window) < window] = np.nan
+    return out
+
+
+def _ewm_row(x: np.ndarray, alpha: float) -> np.ndarray:
+    # prev + alpha * (x - prev) along one row, NaNs carrying the previous value
+    return pd.Series(x).ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+
+
+def ema(values, period: int) -> np.ndarray:
+    """
+    Exponential moving average, alpha = 2 / (period + 1), seeded with the
+    first value (same as pandas ewm(span=period, adjust=False)).
+    """
+    x, two_d = _as_2d(values)
+    alpha = 2.0 / (period + 1)
+    if x.shape[0] == 1:
+        return _shape_like(_ewm_row(x[0], alpha)[None, :], two_d)
+    out = np.empty_like(x)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(x.shape[1]):
+        cur = x[:, t]
+        step = prev + alpha * (cur - prev)
+        prev = np.where(np.isnan(cur), prev, np.where(np.isnan(prev), cur, step))
+        out[:, t] = prev
+    return _shape_like(out, two_d)
+
+
+def sma(values, period: int) -> np.ndarray:
+    """
+    Simple moving average of the last `period` bars (NaN unless all of them exist).
+    """
+    x, two_d = _as_2d(values)
+    valid = _rolling_sum((~np.isnan(x)).astype(np.float64), period)
+    total = _rolling_sum(np.nan_to_num(x), period)
+    return _shape_like(np.where(valid >= period, total / period, np.nan), two_d)
+
+
+def wilder(values, period: int) -> np.ndarray:
+    """
+    Wilder smoothing: the mean of the first `period` values, then
+    avg = (avg * (period - 1) + x) / period. NaN inputs are skipped.
+    """
+    x, two_d = _as_2d(values)
+    n_rows, n = x.shape
+    out = np.full((n_rows, n), np.nan)
+    if n_rows == 1:
+        valid = np.flatnonzero(~np.isnan(x[0]))
+        if len(valid) >= period:
+            seed_at = valid[period - 1]
+            row = x[0, seed_at:].copy()
+            row[0] = np.cumsum(x[0, valid[:period]])[-1] / period
+            out[0, seed_at:] = _ewm_row(row, 1.0 / period)
+        return _shape_like(out, two_d)
+    seen = np.zeros(n_rows)
+    total = np.zeros(n_rows)
+    prev = np.full(n_rows, np.nan)
+    for t in range(n):
+        cur = x[:, t]
+        ok = ~np.isnan(cur)
+        seeding = ok & np.isnan(prev)
+        seen += seeding
+        total += np.where(seeding, cur, 0.0)
+        smooth = ok & ~np.isnan(prev)
+        prev = np.where(seeding & (seen == period), total / period,
+                        np.where(smooth, (prev * (period - 1) + cur) / period, prev))
+        out[:, t] = prev
+    return _shape_like(out, two_d)
+
+
+def _gains_losses(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    delta = np.full_like(x, np.nan)
+    delta[:, 1:] = x[:, 1:] - x[:, :-1]
+    return np.where(delta > 0, delta, 0.0), np.where(delta < 0, -delta, 0.0), np.isnan(delta)
+
+
+def _rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # no losses in the window: 100 (or NaN while the averages are undefined)
+    return np.where(avg_loss == 0, np.where(np.isnan(avg_gain), np.nan, 100.0), rsi)
+
+
+def rsi(values, period: int = 14, method: str = "wilder") -> np.ndarray:
+    """
+    Relative strength index. method="wilder" seeds the average gain/loss with
+    the mean of the first `period` changes and smooths them as
+    avg = (avg * (period - 1) + x) / period; method="sma" uses plain rolling
+    means of the last `period` changes.
+    """
+    x, two_d = _as_2d(values)
+    gain, loss, missing = _gains_losses(x)
+    if method not in ("wilder", "sma"):
+        raise ValueError(f"unknown RSI method: {method}")
+    smooth = wilder if method == "wilder" else sma
+    avg_gain = smooth(np.where(missing, np.nan, gain), period)
+    avg_loss = smooth(np.where(missing, np.nan, loss), period)
+    return _shape_like(_rsi_from_averages(avg_gain, avg_loss), two_d)
+
+
+def macd(values, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (macd line, signal line, histogram).
+    """
+    line = ema(values, fast) - ema(values, slow)
+    sig = ema(line, signal)
+    return line, sig, line - sig
+
+
+def true_range(high, low, close) -> np.ndarray:
+    """
+    max(high - low, |high - previous close|, |low - previous close|); high - low on the first bar.
+    """
+    h, two_d = _as_2d(high)
+    l, _ = _as_2d(low)
+    c, _ = _as_2d(close)
+    prev = np.full_like(c, np.nan)
+    prev[:, 1:] = c[:, :-1]
+    tr = np.fmax(h - l, np.fmax(np.abs(h - prev), np.abs(l - prev)))
+    return _shape_like(tr, two_d)
+
+
+def atr(high, low, close, period: int = 14) -> np.ndarray:
+    """
+    Average true range with Wilder smoothing.
+    """
+    return wilder(true_range(high, low, close), period)
+
+
+def rolling_high(values, window: int) -> np.ndarray:
+    """
+    Highest value of the last `window` bars (NaN unless all of them exist).
+    """
+    x, two_d = _as_2d(values)
+    return _shape_like(_rolling_extreme(x, window, np.fmax), two_d)
+
+
+def rolling_low(values, window: int) -> np.ndarray:
+    """
+    Lowest value of the last `window` bars (NaN unless all of them exist).
+    """
+    x, two_d = _as_2d(values)
+    return _shape_like(_rolling_extreme(x, window, np.fmin), two_d)
+
+
+def up_days(values, window: int = 15) -> np.ndarray:
+    """
+    How many of the last `window` bars closed above the previous bar's value
+    (pass highs for the scanners' "updays").
+    """
+    x, two_d = _as_2d(values)
+    up = np.zeros_like(x)
+    up[:, 1:] = x[:, 1:] > x[:, :-1]
+    return _shape_like(_rolling_sum(up, window), two_d)
+
+
+def down_days(values, window: int = 15) -> np.ndarray:
+    """
+    How many of the last `window` bars were below the previous bar's value
+    (pass lows for the scanners' "downdays").
+    """
+    x, two_d = _as_2d(values)
+    down = np.zeros_like(x)
+    down[:, 1:] = x[:, 1:] < x[:, :-1]
+    return _shape_like(_rolling_sum(down, window), two_d)
+
+
+if __name__ == "__main__":
+    # equivalence checks against the per-page pandas implementations these replace
+    rng = np.random.default_rng(7)
+    close = pd.Series(100 * np.exp(np.cumsum(rng.normal(0, 0.02, 500))))
+    high = close * (1 + np.abs(rng.normal(0, 0.01, 500)))
+    low = close * (1 - np.abs(rng.normal(0, 0.01, 500)))
+
+    def check(name, ours, reference, start=0, rtol=1e-9):
+        ours, reference = np.asarray(ours, dtype=float)[start:], np.asarray(reference, dtype=float)[start:]
+        ok = np.allclose(ours, reference, rtol=rtol, equal_nan=True)
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        assert ok, name
+
+    check("ema vs ewm(span, adjust=False)", ema(close, 20), close.ewm(span=20, adjust=False).mean())
+    check("sma vs rolling(n).mean()", sma(close, 50), close.rolling(50).mean())
+
+    # definedge_batch_scan.compute_rsi: rolling means of the changes (+1e-10 in the denominator)
+    delta = close.diff()
+    up, down = delta.clip(lower=0), -delta.clip(upper=0)
+    legacy = 100 - 100 / (1 + up.rolling(14, min_periods=14).mean() / (down.rolling(14, min_periods=14).mean() + 1e-10))
+    check("rsi(method='sma') vs batch scan RSI", rsi(close, 14, method="sma"), legacy, rtol=1e-6)
+    # symbol_technical_details / holdings_details counted the undefined first change as 0,
+    # so they had a value one bar earlier; from bar 15 on they agree
+    gain, loss = np.where(delta > 0, delta, 0), np.where(delta < 0, -delta, 0)
+    legacy = 100 - 100 / (1 + pd.Series(gain).rolling(14).mean() / pd.Series(loss).rolling(14).mean())
+    check("rsi(method='sma') vs symbol details RSI", rsi(close, 14, method="sma"), legacy, start=15)
+
+    g, l = pd.Series(gain[1:]), pd.Series(loss[1:])
+    avg_g, avg_l = [g[:14].mean()], [l[:14].mean()]
+    for i in range(14, len(g)):
+        avg_g.append((avg_g[-1] * 13 + g[i]) / 14)
+        avg_l.append((avg_l[-1] * 13 + l[i]) / 14)
+    wilder_ref = np.concatenate([np.full(14, np.nan), 100 - 100 / (1 + np.array(avg_g) / np.array(avg_l))])
+    check("rsi (Wilder) vs textbook recursion", rsi(close, 14), wilder_ref)
+
+    line, signal, hist = macd(close)
+    ref_line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    check("macd vs holdings_details.compute_macd", line, ref_line)
+    check("macd signal", signal, ref_line.ewm(span=9, adjust=False).mean())
+
+    prev = close.shift()
+    tr = pd.concat([high - low, (high - prev).abs(), (low - prev).abs()], axis=1).max(axis=1)
+    atr_ref = [np.nan] * 13 + [tr[:14].mean()]
+    for i in range(14, len(tr)):
+        atr_ref.append((atr_ref[-1] * 13 + tr[i]) / 14)
+    check("atr vs Wilder true range", atr(high, low, close), atr_ref)
+
+    def count_updays(highs, window=15):
+        # symbol_technical_details.count_updays
+        count = 0
+        for i in range(-window, 0):
+            if i - 1 < -len(highs):
+                continue
+            if highs[i] > highs[i - 1]:
+                count += 1
+        return count
+    check("up_days vs count_updays", [up_days(high[:k], 15)[-1] for k in range(2, 80)],
+          [count_updays(high.values[:k]) for k in range(2, 80)])
+    check("rolling_high vs rolling(n).max()", rolling_high(high, 20), high.rolling(20).max())
+
+    panel = np.vstack([close.values, close.values[::-1]])
+    panel[1, :40] = np.nan
+    check("2-D rows match 1-D", rsi(panel, 14)[1, 40:], rsi(panel[1, 40:], 14))
+    # single series (pandas ewm) vs the panel loop, with leading and interior gaps
+    panel[1, [60, 61, 200]] = np.nan
+    for name, fn in (("ema", lambda v: ema(v, 20)), ("wilder", lambda v: wilder(v, 14)),
+                     ("rsi", lambda v: rsi(v, 14)), ("atr", lambda v: atr(v * 1.01, v * 0.99, v, 14))):
+        check(f"1-D {name} matches panel rows", [fn(row) for row in panel], fn(panel), rtol=1e-12)
@@ -1,4 +1,4 @@
-import requests
+import http_client
 
 class ConnectToIntegrate:
     def __init__(self):
@@ -9,18 +9,18 @@ class ConnectToIntegrate:
         self.otp_token = None
 
     def login_step1(self, api_token, api_secret):
-        url = f"https://signin.definedgesecurities.com/auth/realms/debroking/dsbpkc/login/{api_token}"
+        url = f"{http_client.SIGNIN_BASE_URL}/login/{api_token}"
         headers = {"api_secret": api_secret}
-        resp = requests.get(url, headers=headers)
+        resp = http_client.get(url, headers=headers)
         resp.raise_for_status()
         data = resp.json()
         self.otp_token = data.get("otp_token")
         return data
 
     def login_step2(self, otp):
-        url = "https://signin.definedgesecurities.com/auth/realms/debroking/dsbpkc/token"
+        url = f"{http_client.SIGNIN_BASE_URL}/token"
         json_data = {"otp_token": self.otp_token, "otp": otp}
-        resp = requests.post(url, json=json_data)
+        resp = http_client.post(url, json=json_data)
         resp.raise_for_status()
         data = resp.json()
         # Save session keys
@@ -2,10 +2,13 @@
 import os
 import zipfile
 import io
+import json
+import shutil
 import datetime
-from typing import List, Dict, Iterator, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 
-import requests
+import http_client
+import numpy as np
 import pandas as pd
 
 from debug_utils import debug_log
@@ -29,6 +32,20 @@ COLUMN_NAMES = [
     "ISIN", "PRICEMULT", "COMPANY"
 ]
 
+# Storage kind of each column in the binary columnar cache. Columns that do not
+# convert cleanly fall back to "float" (blank cells) or "str" (text). "id"
+# columns are stored as int only when every cell is a whole number, else as
+# str, never as float: a token must not come back as "2885.0".
+COLUMN_KINDS = {
+    "SEGMENT": "category", "TOKEN": "id", "SYMBOL": "str", "TRADINGSYM": "str",
+    "INSTRUMENT_TYPE": "category", "EXPIRY": "str", "TICKSIZE": "float", "LOTSIZE": "int",
+    "OPTIONTYPE": "category", "STRIKE": "float", "PRICEPREC": "int", "MULTIPLIER": "int",
+    "ISIN": "str", "PRICEMULT": "float", "COMPANY": "str",
+}
+CACHE_SUFFIX = ".cols"
+CACHE_META = "meta.json"
+CACHE_FORMAT = 2
+
 
 def _today_tag() -> str:
     return datetime.datetime.now().strftime("%Y%m%d")
@@ -49,7 +66,7 @@ def download_master(segment: str = "NSE_CASH", force: bool = False) -> str:
         return out_path
 
     url = MASTER_FILE_URLS[segment]
-    resp = requests.get(url, timeout=60)
+    resp = http_client.get(url, timeout=60)
     resp.raise_for_status()
 
     with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
@@ -61,6 +78,7 @@ def download_master(segment: str = "NSE_CASH", force: bool = False) -> str:
         with open(out_path, "wb") as f:
             f.write(extracted)
     debug_log(f"Saved master to {out_path}")
+    build_master_cache(out_path)
     return out_path
 
 
@@ -75,65 +93,246 @@ def _find_latest_master(segment: str) -> Optional[str]:
     return files[0]
 
 
-def load_master(segment: str = "NSE_CASH", auto_download: bool = True) -> pd.DataFrame:
+def _read_master_csv(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path, header=None, dtype=str, encoding="utf-8", low_memory=False)
+    if df.shape[1] >= len(COLUMN_NAMES):
+        df = df.iloc[:, : len(COLUMN_NAMES)]
+        df.columns = COLUMN_NAMES
+    else:
+        df.columns = [f"COL{i}" for i in range(df.shape[1])]
+    return df
+
+
+def _cache_dir(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + CACHE_SUFFIX
+
+
+def _source_stamp(csv_path: str) -> Dict:
+    st_ = os.stat(csv_path)
+    return {"size": st_.st_size, "mtime_ns": st_.st_mtime_ns}
+
+
+def _encode_column(values: pd.Series, kind: str) -> Tuple[str, np.ndarray, Optional[List[str]]]:
+    raw = values.fillna("").astype(str).str.strip()
+    if kind == "category":
+        cat = pd.Categorical(raw)
+        codes = cat.codes.astype(np.int16 if len(cat.categories) < 32767 else np.int32)
+        return "category", codes, [str(c) for c in cat.categories]
+    if kind == "id":
+        # only plain digit strings, so "2885.0" or " " keep their text rather than being reformatted
+        if len(raw) and raw.str.fullmatch(r"-?\d{1,18}").all():
+            return "int", raw.astype(np.int64).to_numpy(), None
+    elif kind in ("int", "float"):
+        num = pd.to_numeric(raw.replace("", np.nan), errors="coerce")
+        bad = num.isna() & (raw != "")
+        if not bad.any():
+            if kind == "int" and not num.isna().any() and (num % 1 == 0).all():
+                return "int", num.to_numpy(dtype=np.int64), None
+            return "float", num.to_numpy(dtype=np.float64), None
+    width = max(1, int(raw.str.len().max() or 1))
+    return "str", raw.to_numpy(dtype=f"U{width}"), None
+
+
+def build_master_cache(csv_path: str) -> str:
     """
-    Load master file as DataFrame. If today's master not present and auto_download True,
-    it will attempt to download.
+    Convert a downloaded master CSV into a binary columnar cache next to it:
+    {csv}.cols/{COLUMN}.npy per column plus meta.json. Categorical columns are
+    stored as integer codes, numbers as int64/float64, text as fixed-width
+    unicode, so every column can be memory-mapped by load_master_columns().
     """
+    df = _read_master_csv(csv_path)
+    out_dir = _cache_dir(csv_path)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    meta = {"format": CACHE_FORMAT, "source": _source_stamp(csv_path), "rows": len(df), "columns": {}}
+    for col in df.columns:
+        kind, arr, categories = _encode_column(df[col], COLUMN_KINDS.get(col, "str"))
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), arr, allow_pickle=False)
+        meta["columns"][col] = {"kind": kind, "categories": categories}
+    with open(os.path.join(tmp_dir, CACHE_META), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    debug_log(f"Built master cache {out_dir} ({len(df)} rows)")
+    return out_dir
+
+
+def _cache_is_current(csv_path: str) -> bool:
+    meta_path = os.path.join(_cache_dir(csv_path), CACHE_META)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == CACHE_FORMAT and meta.get("source") == _source_stamp(csv_path)
+
+
+def _resolve_master_path(segment: str, auto_download: bool) -> str:
     path = _find_latest_master(segment)
     if not path and auto_download:
         path = download_master(segment)
     if not path:
         raise FileNotFoundError(f"No master file found for segment {segment} in {DATA_DIR}")
+    return path
 
-    df = pd.read_csv(path, header=None, dtype=str, encoding="utf-8", low_memory=False)
-    if df.shape[1] >= len(COLUMN_NAMES):
-        df = df.iloc[:, : len(COLUMN_NAMES)]
-        df.columns = COLUMN_NAMES
-    else:
-        df.columns = [f"COL{i}" for i in range(df.shape[1])]
-    debug_log(f"Loaded master {path} with shape {df.shape}")
+
+def load_master_columns(segment: str = "NSE_CASH", auto_download: bool = True) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """
+    Memory-map the columnar cache of the latest master for `segment` (building it
+    from the CSV first if missing or stale). Returns (arrays, meta); arrays are
+    read-only, category columns hold integer codes (see meta["columns"][c]["categories"]).
+    """
+    path = _resolve_master_path(segment, auto_download)
+    if not _cache_is_current(path):
+        build_master_cache(path)
+    cache_dir = _cache_dir(path)
+    with open(os.path.join(cache_dir, CACHE_META)) as f:
+        meta = json.load(f)
+    arrays = {col: np.load(os.path.join(cache_dir, f"{col}.npy"), mmap_mode="r", allow_pickle=False)
+              for col in meta["columns"]}
+    return arrays, meta
+
+
+def load_master(segment: str = "NSE_CASH", auto_download: bool = True) -> pd.DataFrame:
+    """
+    Load master file as DataFrame. If today's master not present and auto_download True,
+    it will attempt to download.
+    Served from the columnar cache: SEGMENT/INSTRUMENT_TYPE/OPTIONTYPE are categoricals,
+    TOKEN/LOTSIZE ints and TICKSIZE/STRIKE floats where the data allows (a
+    TOKEN column with any non-digit cell stays str).
+    """
+    arrays, meta = load_master_columns(segment, auto_download)
+    data = {}
+    for col, info in meta["columns"].items():
+        arr = arrays[col]
+        if info["kind"] == "category":
+            data[col] = pd.Categorical.from_codes(np.asarray(arr), categories=info["categories"])
+        elif info["kind"] == "str":
+            data[col] = arr.astype(object)
+        else:
+            data[col] = np.asarray(arr)
+    df = pd.DataFrame(data)
+    debug_log(f"Loaded master {segment} with shape {df.shape}")
     return df
 
 
-def get_symbols_from_master(segment: str = "NSE_CASH", limit: Optional[int] = None) -> List[Dict]:
+# record field -> master column
+SYMBOL_FIELDS = {
+    "segment": "SEGMENT", "token": "TOKEN", "symbol": "SYMBOL",
+    "tradingsymbol": "TRADINGSYM", "isin": "ISIN", "lotsize": "LOTSIZE",
+}
+
+
+def _as_set(value) -> Optional[set]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [value]
+    return {str(v).strip().upper() for v in value}
+
+
+def _column(arrays: Dict[str, np.ndarray], meta: Dict, col: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    arr = arrays[col] if rows is None else arrays[col][rows]
+    info = meta["columns"][col]
+    if info["kind"] == "category":
+        return np.asarray(info["categories"], dtype=object)[np.asarray(arr)]
+    return np.asarray(arr)
+
+
+def _lotsizes(values: np.ndarray) -> np.ndarray:
+    # whole non-negative numbers are kept, anything else (blank, text) becomes 1
+    num = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+    ok = ~np.isnan(num) & (num >= 0) & (num % 1 == 0)
+    return np.where(ok, np.nan_to_num(num), 1).astype(np.int64)
+
+
+def _filter_rows(arrays: Dict[str, np.ndarray], meta: Dict, exchange=None, instrument_type=None,
+                 series=None) -> np.ndarray:
+    n = meta["rows"]
+    mask = np.ones(n, dtype=bool)
+    for col, wanted in (("SEGMENT", _as_set(exchange)), ("INSTRUMENT_TYPE", _as_set(instrument_type))):
+        if wanted is None:
+            continue
+        if col not in arrays:
+            return np.empty(0, dtype=np.int64)
+        info = meta["columns"][col]
+        if info["kind"] == "category":
+            hit = [i for i, c in enumerate(info["categories"]) if c.upper() in wanted]
+            mask &= np.isin(np.asarray(arrays[col]), hit)
+        else:
+            mask &= pd.Series(np.asarray(arrays[col])).astype(str).str.upper().isin(wanted).to_numpy()
+    wanted = _as_set(series)
+    if wanted is not None:
+        if "TRADINGSYM" not in arrays:
+            return np.empty(0, dtype=np.int64)
+        parts = pd.Series(np.asarray(arrays["TRADINGSYM"])).str.rpartition("-")
+        suffix = parts[2].where(parts[1] == "-", "").str.upper()
+        mask &= suffix.isin(wanted).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def _symbol_columns(arrays: Dict[str, np.ndarray], meta: Dict, rows: np.ndarray,
+                    segment: str) -> Dict[str, np.ndarray]:
+    out = {}
+    for field, col in SYMBOL_FIELDS.items():
+        if col not in arrays:
+            default = segment if field == "segment" else ("1" if field == "lotsize" else "")
+            values = np.full(len(rows), default, dtype=object)
+        else:
+            values = _column(arrays, meta, col, rows)
+        if field == "lotsize":
+            out[field] = _lotsizes(values)
+        else:
+            out[field] = values.astype(str).astype(object)
+    return out
+
+
+def get_symbol_arrays(segment: str = "NSE_CASH", limit: Optional[int] = None, exchange=None,
+                      instrument_type=None, series=None) -> Dict[str, np.ndarray]:
+    """
+    Column-wise variant of get_symbols_from_master: one array per field
+    (segment, token, symbol, tradingsymbol, isin as str; lotsize as int64).
+    Filters take a value or a list of values (case-insensitive):
+      exchange        - SEGMENT column of the master (e.g. "NSE")
+      instrument_type - INSTRUMENT_TYPE column
+      series          - tradingsymbol suffix after the last "-" (e.g. "EQ" for "INFY-EQ")
+    """
+    arrays, meta = load_master_columns(segment)
+    rows = _filter_rows(arrays, meta, exchange, instrument_type, series)
+    if limit:
+        rows = rows[:limit]
+    return _symbol_columns(arrays, meta, rows, segment)
+
+
+def _records(columns: Dict[str, np.ndarray]) -> List[Dict]:
+    fields = list(columns)
+    values = [columns[f].tolist() for f in fields]
+    return [dict(zip(fields, row)) for row in zip(*values)]
+
+
+def get_symbols_from_master(segment: str = "NSE_CASH", limit: Optional[int] = None, exchange=None,
+                            instrument_type=None, series=None) -> List[Dict]:
     """
     Return list of dicts with keys: segment, token, symbol, tradingsymbol, isin, lotsize
+    Filters as in get_symbol_arrays().
     """
-    df = load_master(segment)
-    out = []
-    for _, row in df.iterrows():
-        token = str(row.get("TOKEN", "")).strip()
-        lotsize = 1
-        try:
-            lotsize_raw = row.get("LOTSIZE", None)
-            if pd.notna(lotsize_raw) and str(lotsize_raw).strip().isdigit():
-                lotsize = int(str(lotsize_raw).strip())
-        except Exception:
-            lotsize = 1
-
-        rec = {
-            "segment": str(row.get("SEGMENT", segment)).strip(),
-            "token": token,
-            "symbol": str(row.get("SYMBOL", "")).strip(),
-            "tradingsymbol": str(row.get("TRADINGSYM", "")).strip(),
-            "isin": str(row.get("ISIN", "")).strip(),
-            "lotsize": lotsize
-        }
-        out.append(rec)
-        if limit and len(out) >= limit:
-            break
+    out = _records(get_symbol_arrays(segment, limit, exchange, instrument_type, series))
     debug_log(f"get_symbols_from_master(segment={segment}, limit={limit}) -> {len(out)} symbols")
     return out
 
 
-def batch_symbols(segment: str = "NSE_CASH", batch_size: int = 500) -> Iterator[List[Dict]]:
+def batch_symbols(segment: str = "NSE_CASH", batch_size: int = 500, exchange=None,
+                  instrument_type=None, series=None) -> Iterator[List[Dict]]:
     """
-    Yield lists of symbol dicts of size batch_size based on master file.
+    Lazily yield lists of symbol dicts of size batch_size based on master file.
+    Only the row filter is computed up front; each batch's records are built
+    from the memory-mapped columns when it is requested.
     """
-    symbols = get_symbols_from_master(segment)
-    for i in range(0, len(symbols), batch_size):
-        yield symbols[i: i + batch_size]
+    arrays, meta = load_master_columns(segment)
+    rows = _filter_rows(arrays, meta, exchange, instrument_type, series)
+    for i in range(0, len(rows), batch_size):
+        yield _records(_symbol_columns(arrays, meta, rows[i: i + batch_size], segment))
 
 
 if __name__ == "__main__":
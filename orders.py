@@ -1,25 +1,13 @@
 import streamlit as st
 from utils import integrate_post
-import requests
+import http_client
 import pandas as pd
+from symbol_index import get_index
 
 @st.cache_data
-def load_master_symbols():
-    df = pd.read_csv("master.csv", sep="\t", header=None)
-    # Handles both 14 and 15 column master files
-    if df.shape[1] == 15:
-        df.columns = [
-            "segment", "token", "symbol", "symbol_series", "series", "unknown1",
-            "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
-            "isin", "unknown7", "company"
-        ]
-        df = df[["symbol", "series", "segment"]]
-    else:
-        df.columns = [
-            "segment", "token", "symbol", "instrument", "series", "isin1",
-            "facevalue", "lot", "something", "zero1", "two1", "one1", "isin", "one2"
-        ]
-        df = df[["symbol", "series", "segment"]]
+def load_master_symbols(version=None):
+    # version is only part of the cache key, so a new master.csv gets a fresh entry
+    df = get_index().frame[["symbol", "series", "segment"]]
     # Only EQ & BE series, and only NSE/BSE stocks (not derivatives, indices)
     df = df[df["series"].isin(["EQ", "BE"])]
     df = df[df["segment"].isin(["NSE", "BSE"])]
@@ -29,9 +17,9 @@ def load_master_symbols():
 
 def get_ltp(tradingsymbol, exchange, api_session_key):
     try:
-        url = f"https://integrate.definedgesecurities.com/dart/v1/quotes/{exchange}/{tradingsymbol}"
+        url = f"{http_client.INTEGRATE_BASE_URL}/quotes/{exchange}/{tradingsymbol}"
         headers = {"Authorization": api_session_key}
-        resp = requests.get(url, headers=headers, timeout=3)
+        resp = http_client.get(url, headers=headers, timeout=3)
         if resp.status_code == 200:
             return float(resp.json().get("ltp", 0))
     except Exception:
@@ -63,7 +51,7 @@ def app():
     st.header("Order Place", divider="rainbow")
 
     # Load symbols for dropdown (EQ/BE)
-    master_df = load_master_symbols()
+    master_df = load_master_symbols(get_index().version)
     symbol_list = master_df["tradingsymbol"].unique().tolist()
     symbol_default = "RELIANCE-EQ" if "RELIANCE-EQ" in symbol_list else symbol_list[0] if symbol_list else ""
 
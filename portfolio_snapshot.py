@@ -0,0 +1,215 @@
+# portfolio_snapshot.py
+# One portfolio snapshot shared by every portfolio page.
+# /holdings and /positions are fetched concurrently, then quotes and previous
+# closes for every instrument in them, also concurrently. The responses are
+# normalised once into typed tables: the nested `tradingsymbol` list of a
+# holding is resolved to one exchange/token/ISIN (NSE preferred), quantities
+# and prices are floats (NaN when missing). The snapshot is cached per account
+# for REFRESH_INTERVAL seconds (and dropped when an order is posted), so
+# switching between Holdings, Holdings Details, Positions and Square Off reuses it.
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from candle_provider import get_records
+from debug_utils import debug_log
+from response_cache import get_cache
+from symbol_index import get_index
+from utils import drop_session_on_expiry, get_quotes_many, get_session_headers, integrate_get
+
+REFRESH_INTERVAL = 10  # seconds
+SNAPSHOT_PATH = "/portfolio_snapshot"
+PREV_CLOSE_WORKERS = 8
+PREV_CLOSE_LOOKBACK_DAYS = 10
+
+HOLDING_COLUMNS = {
+    "symbol": str, "exchange": str, "segment": str, "token": str, "isin": str, "product": str,
+    "dp_qty": float, "t1_qty": float, "qty": float, "avg_price": float, "ltp": float, "prev_close": float,
+    "dp_free_qty": float, "pledge_qty": float, "collateral_qty": float, "haircut": float,
+}
+POSITION_COLUMNS = {
+    "symbol": str, "exchange": str, "token": str, "product": str, "net_qty": float,
+    "avg_price": float, "buy_avg": float, "sell_avg": float, "ltp": float, "prev_close": float,
+    "realized_pnl": float, "unrealized_pnl": float,
+}
+
+
+@dataclass
+class PortfolioSnapshot:
+    """
+    holdings / positions: one row per instrument (HOLDING_COLUMNS /
+    POSITION_COLUMNS); row i of each table came from raw_holdings[i] /
+    raw_positions[i], for fields the tables do not carry.
+    """
+    holdings: pd.DataFrame
+    positions: pd.DataFrame
+    raw_holdings: List[Dict] = field(default_factory=list)
+    raw_positions: List[Dict] = field(default_factory=list)
+    quote_errors: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)  # endpoint -> error message
+    fetched_at: datetime = field(default_factory=datetime.now)
+    fetch_s: float = 0.0
+
+
+def _num(value) -> float:
+    try:
+        return float(value) if value not in (None, "", "null") else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _first(d: Dict, keys, default=""):
+    for k in keys:
+        v = d.get(k)
+        if v not in (None, "", [], {}, "null"):
+            return v
+    return default
+
+
+def resolve_symbol_info(h: Dict) -> Dict:
+    """
+    The instrument of a holding: its `tradingsymbol` is a list of per-exchange
+    dicts (NSE preferred, else the first), a single dict, or a plain string.
+    """
+    ts = h.get("tradingsymbol")
+    if isinstance(ts, list):
+        dicts = [s for s in ts if isinstance(s, dict)]
+        for s in dicts:
+            if str(s.get("exchange", "")).upper() == "NSE":
+                return s
+        if dicts:
+            return dicts[0]
+        return {"tradingsymbol": str(ts[0])} if ts else {}
+    if isinstance(ts, dict):
+        return ts
+    return {"tradingsymbol": str(ts)} if ts is not None else {}
+
+
+def _typed(rows: List[Dict], columns: Dict[str, type]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=list(columns))
+    for name, kind in columns.items():
+        df[name] = df[name].astype(np.float64) if kind is float else df[name].fillna("").astype(str)
+    return df
+
+
+def _holding_row(h: Dict, symbols) -> Dict:
+    info = resolve_symbol_info(h)
+    symbol = str(info.get("tradingsymbol", "N/A"))
+    exchange = str(info.get("exchange") or h.get("exchange") or "NSE").upper()
+    segment = str(info.get("segment") or exchange).upper()
+    token = str(info.get("token") or "") or (symbols.token_for(symbol, segment) or "")
+    dp_qty, t1_qty = _num(h.get("dp_qty")), _num(h.get("t1_qty"))
+    return {
+        "symbol": symbol, "exchange": exchange, "segment": segment, "token": token,
+        "isin": _first(info, ["isin"], h.get("isin", "")), "product": h.get("product", ""),
+        "dp_qty": dp_qty, "t1_qty": t1_qty, "qty": np.nansum([dp_qty, t1_qty]),
+        "avg_price": _num(h.get("avg_buy_price")),
+        "dp_free_qty": _num(h.get("dp_free_qty")), "pledge_qty": _num(h.get("pledge_qty")),
+        "collateral_qty": _num(h.get("collateral_qty")), "haircut": _num(_first(info, ["haircut"], h.get("haircut"))),
+    }
+
+
+def _net_qty(p: Dict) -> float:
+    for k in ("netqty", "net_quantity", "net_qty", "quantity", "Qty"):
+        v = _num(p.get(k))
+        if not np.isnan(v):
+            return v
+    return 0.0
+
+
+def _position_row(p: Dict) -> Dict:
+    return {
+        "symbol": str(_first(p, ["tradingsymbol", "symbol"], "")), "exchange": str(p.get("exchange", "")).upper(),
+        "token": str(p.get("token", "")), "product": _first(p, ["product_type", "productType", "Product"], ""),
+        "net_qty": _net_qty(p), "avg_price": _num(p.get("net_averageprice")),
+        "buy_avg": _num(_first(p, ["day_buy_avg", "total_buy_avg"], None)),
+        "sell_avg": _num(_first(p, ["day_sell_avg", "total_sell_avg"], None)),
+        "ltp": _num(p.get("lastPrice")),
+        "realized_pnl": _num(p.get("realized_pnl")),
+        "unrealized_pnl": _num(_first(p, ["unrealized_pnl", "pnl"], None)),
+    }
+
+
+def _prev_close(segment: str, token: str, api_key: Optional[str], today: datetime) -> float:
+    # close of the last daily bar before today, from the local candle store; the
+    # range ends before today's session so an open market does not fetch the live bar
+    yesterday_end = datetime.combine(today.date(), datetime.min.time()) - timedelta(minutes=1)
+    try:
+        records = get_records(segment, token, "day", today - timedelta(days=PREV_CLOSE_LOOKBACK_DAYS),
+                              yesterday_end, api_key)
+    except Exception as e:
+        debug_log(f"portfolio_snapshot: prev close for {segment}/{token} failed: {e}")
+        return np.nan
+    before = records[records["ts"] < pd.Timestamp(today.date()).value]
+    return float(before["close"][-1]) if len(before) else np.nan
+
+
+def _fill_prices(df: pd.DataFrame, quotes: Dict, prev_closes: Dict, keep_ltp: bool = False):
+    keys = list(zip(df["exchange"], df["token"]))
+    ltp = np.array([_num(quotes[k].get("ltp")) if k in quotes else np.nan for k in keys], dtype=np.float64)
+    if keep_ltp:
+        ltp = np.where(np.isnan(ltp), df["ltp"].to_numpy(), ltp)
+    df["ltp"] = np.where(ltp > 0, ltp, np.nan)
+    df["prev_close"] = np.array([prev_closes.get(k, np.nan) for k in keys], dtype=np.float64)
+
+
+def build_snapshot(headers: Dict[str, str], api_key: Optional[str] = None) -> PortfolioSnapshot:
+    """
+    Fetch and normalise holdings, positions, quotes and previous closes
+    (uncached; see get_snapshot). Safe to call off the Streamlit thread.
+    """
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        holdings_f = pool.submit(integrate_get, "/holdings", True, headers)
+        positions_f = pool.submit(integrate_get, "/positions", True, headers)
+        holdings_data, positions_data = holdings_f.result(), positions_f.result()
+    errors = {path: data.get("message", "ERROR") for path, data in
+              (("/holdings", holdings_data), ("/positions", positions_data))
+              if data.get("status") == "ERROR"}
+    raw_holdings = holdings_data.get("data") or holdings_data.get("holdings") or []
+    raw_positions = positions_data.get("positions") or positions_data.get("data") or []
+
+    symbols = get_index()
+    holdings = _typed([_holding_row(h, symbols) for h in raw_holdings], HOLDING_COLUMNS)
+    positions = _typed([_position_row(p) for p in raw_positions], POSITION_COLUMNS)
+
+    instruments = {}
+    for df in (holdings, positions):
+        for exch, seg, token in zip(df["exchange"], df.get("segment", df["exchange"]), df["token"]):
+            if token:
+                instruments.setdefault((exch, token), seg)
+    today = datetime.now()
+    with ThreadPoolExecutor(max_workers=PREV_CLOSE_WORKERS) as pool:
+        prev_f = {key: pool.submit(_prev_close, seg, key[1], api_key, today) for key, seg in instruments.items()}
+        quotes, quote_errors = get_quotes_many(instruments, headers=headers)
+        prev_closes = {key: f.result() for key, f in prev_f.items()}
+    _fill_prices(holdings, quotes, prev_closes)
+    _fill_prices(positions, quotes, prev_closes, keep_ltp=True)
+
+    elapsed = time.monotonic() - t0
+    debug_log(f"portfolio_snapshot: {len(holdings)} holdings, {len(positions)} positions, "
+              f"{len(instruments)} quotes in {elapsed:.2f}s")
+    return PortfolioSnapshot(holdings, positions, raw_holdings, raw_positions, quote_errors, errors,
+                             fetch_s=elapsed)
+
+
+def get_snapshot(api_key: Optional[str] = None, refresh: bool = False,
+                 max_age: float = REFRESH_INTERVAL) -> PortfolioSnapshot:
+    """
+    The logged-in account's snapshot, rebuilt at most every max_age seconds
+    (or now with refresh=True). Concurrent pages share one rebuild.
+    """
+    headers = get_session_headers()
+    key = (headers.get("Authorization", ""), SNAPSHOT_PATH)
+    cache = get_cache()
+    if refresh:
+        cache.invalidate([SNAPSHOT_PATH, "/holdings", "/positions"], account=key[0])
+    snap = cache.get_or_fetch(key, max_age, lambda: build_snapshot(headers, api_key),
+                              should_cache=lambda s: not s.errors)
+    drop_session_on_expiry(list(snap.errors.values()) + list(snap.quote_errors.values()))
+    return snap
@@ -1,17 +1,19 @@
 import streamlit as st
 import pandas as pd
-from utils import integrate_get
+import numpy as np
+from portfolio_snapshot import get_snapshot
 
 def app():
     st.header("=========== Positions Dashboard Pro ===========")
 
-    # Fetch positions data
-    data = integrate_get("/positions")
-    raw = data.get('positions', [])
+    # Positions from the shared portfolio snapshot
+    snap = get_snapshot(st.secrets.get("integrate_api_session_key", ""))
+    raw = snap.raw_positions
 
     if not raw:
         st.info("No positions found.")
-        st.write("RAW RESPONSE:", data)
+        if snap.errors:
+            st.write("ERRORS:", snap.errors)
         return
 
     # Find all unique keys in the first row for dynamic columns (like Colab)
@@ -32,8 +34,6 @@ def app():
 
     # Build DataFrame rows
     table = []
-    total_unrealized = 0.0
-    total_realized = 0.0
     for p in raw:
         # Calculate % Change if not present
         try:
@@ -58,15 +58,9 @@ def app():
         row += [p.get(k, "") for k in rest_keys]
         table.append(row)
 
-        # Summary totals
-        try:
-            total_unrealized += float(p.get("unrealized_pnl", 0) or 0)
-        except Exception:
-            pass
-        try:
-            total_realized += float(p.get("realized_pnl", 0) or 0)
-        except Exception:
-            pass
+    # Summary totals
+    total_unrealized = float(np.nansum(snap.positions["unrealized_pnl"]))
+    total_realized = float(np.nansum(snap.positions["realized_pnl"]))
 
     # Summary
     summary_table = [
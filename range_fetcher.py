@@ -0,0 +1,110 @@
+# range_fetcher.py
+# Split long history requests into calendar windows aligned with the
+# historical_store partitions (a year of day bars, a month of minute bars, a
+# day of ticks), fetch them in parallel behind the shared rate limiter, retry
+# only the windows that failed, and write finished windows to the store in
+# order so the stored series never has a hole in the middle.
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import historical_catalog
+import historical_store
+from debug_utils import debug_log
+from history_stream import fetch_history_records
+
+DEFAULT_WORKERS = 4
+DEFAULT_ROUNDS = 3
+API_DT_FORMAT = "%d%m%Y%H%M"
+
+Window = Tuple[datetime, datetime]
+
+
+def _next_boundary(dt: datetime, timeframe: str) -> datetime:
+    if timeframe == "day":
+        return datetime(dt.year + 1, 1, 1)
+    if timeframe == "tick":
+        return datetime(dt.year, dt.month, dt.day) + timedelta(days=1)
+    if dt.month == 12:
+        return datetime(dt.year + 1, 1, 1)
+    return datetime(dt.year, dt.month + 1, 1)
+
+
+def plan_windows(start: datetime, end: datetime, timeframe: str) -> List[Window]:
+    """
+    Inclusive (from, to) windows covering start..end, cut at year (day), month
+    (minute) or day (tick) boundaries so each window fills one store partition.
+    """
+    windows = []
+    cur = start
+    while cur <= end:
+        nxt = _next_boundary(cur, timeframe)
+        windows.append((cur, min(end, nxt - timedelta(minutes=1))))
+        cur = nxt
+    return windows
+
+
+def fetch_window(session_key: Optional[str], segment: str, token: str, timeframe: str,
+                 window: Window) -> np.ndarray:
+    return fetch_history_records(session_key, segment, token, timeframe,
+                                 window[0].strftime(API_DT_FORMAT), window[1].strftime(API_DT_FORMAT))
+
+
+def fetch_range(session_key: Optional[str], segment: str, token: str, timeframe: str,
+                start: datetime, end: datetime, workers: int = DEFAULT_WORKERS,
+                rounds: int = DEFAULT_ROUNDS, retry_delay: float = 0.5,
+                now: Optional[datetime] = None) -> Dict:
+    """
+    Fetch start..end window by window and append each to historical_store as
+    soon as every earlier window is stored. Only bars completed at `now` are
+    written (see historical_catalog.completed), never a session's forming bar.
+    Failed windows are re-fetched for up to `rounds` rounds; if one still fails,
+    nothing after it is written.
+    Returns {"windows", "rows", "written": windows stored, "failed": [(window, error)]}.
+    """
+    windows = plan_windows(start, end, timeframe)
+    pending = list(range(len(windows)))
+    done: Dict[int, np.ndarray] = {}
+    errors: Dict[int, str] = {}
+    state = {"next": 0, "rows": 0}
+    now = now or datetime.now()
+
+    def flush():
+        # write the contiguous prefix of finished windows
+        while state["next"] in done:
+            records = done.pop(state["next"])
+            records = records[historical_catalog.completed(records, timeframe, now)]
+            state["rows"] += historical_store.append_records(segment, token, timeframe, records)
+            state["next"] += 1
+
+    for attempt in range(max(1, rounds)):
+        if not pending:
+            break
+        if attempt:
+            time.sleep(retry_delay * attempt)
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as pool:
+            futures = {pool.submit(fetch_window, session_key, segment, token, timeframe, windows[i]): i
+                       for i in pending}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    done[i] = fut.result()
+                    errors.pop(i, None)
+                except Exception as e:
+                    errors[i] = str(e)
+                    failed.append(i)
+                    debug_log(f"fetch_range token={token} window {windows[i][0]:%Y-%m-%d} attempt {attempt + 1}: {e}")
+                flush()
+        pending = sorted(failed)
+
+    done.clear()  # windows after a permanent failure are not written
+    return {
+        "windows": len(windows),
+        "rows": state["rows"],
+        "written": state["next"],
+        "failed": [(windows[i], errors[i]) for i in sorted(errors)],
+    }
@@ -0,0 +1,176 @@
+# rate_limiter.py
+# Token-bucket rate limiting for all broker-bound traffic.
+# One bucket per endpoint family (quotes, history, orders, default); http_client
+# acquires a token before every request, so concurrent scans, backfills and pages
+# share the broker allowance instead of each sleeping blindly.
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import fcntl  # POSIX only; cross-process buckets need it
+    FILE_LOCK_AVAILABLE = True
+except ImportError:
+    FILE_LOCK_AVAILABLE = False
+
+# family -> (tokens per second, burst capacity)
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "quotes": (10.0, 10),
+    "history": (5.0, 5),
+    "orders": (5.0, 5),
+    "default": (10.0, 10),
+}
+
+STATE_DIR = os.path.join("data", "rate_limits")
+
+ORDER_PATHS = (
+    "/placeorder", "/modify", "/cancel", "/gttplaceorder", "/gttmodify", "/gttcancel",
+    "/ocoplaceorder", "/ocomodify", "/ococancel", "/positions/convert",
+)
+
+
+def family_for(url: str) -> str:
+    """
+    Map a request URL to its rate-limit family.
+    """
+    path = urlsplit(url).path
+    if "/sds/history/" in path:
+        return "history"
+    if "/quotes/" in path or "/securityinfo/" in path:
+        return "quotes"
+    tail = path.split("/dart/v1", 1)[-1]
+    if tail.startswith(ORDER_PATHS):
+        return "orders"
+    return "default"
+
+
+class TokenBucket:
+    """
+    Thread-safe in-process token bucket.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, n: float) -> float:
+        # returns 0 if taken, else seconds to wait before retrying
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def try_acquire(self, n: float = 1) -> bool:
+        return self._take(n) == 0.0
+
+    def acquire(self, n: float = 1, timeout: Optional[float] = None) -> float:
+        """
+        Block until n tokens are available. Returns seconds waited.
+        Raises TimeoutError if that would take longer than timeout.
+        """
+        start = time.monotonic()
+        while True:
+            wait = self._take(n)
+            if wait == 0.0:
+                return time.monotonic() - start
+            if timeout is not None and (time.monotonic() - start) + wait > timeout:
+                raise TimeoutError(f"rate limit: no token within {timeout}s")
+            time.sleep(wait)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in a small file guarded by flock, so that
+    several processes (e.g. two Streamlit servers, a cron backfill) share it.
+    """
+    def __init__(self, name: str, rate: float, capacity: int, state_dir: str = STATE_DIR):
+        super().__init__(rate, capacity)
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, f"{name}.bucket")
+
+    def _take(self, n: float) -> float:
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}
+                now = time.time()  # wall clock: monotonic clocks differ per process
+                tokens = float(state.get("tokens", self.capacity))
+                last = float(state.get("ts", now))
+                tokens = min(self.capacity, tokens + max(0.0, now - last) * self.rate)
+                wait = 0.0
+                if tokens >= n:
+                    tokens -= n
+                else:
+                    wait = (n - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "ts": now}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_limits: Dict[str, Tuple[float, int]] = dict(DEFAULT_LIMITS)
+_cross_process = False
+_state_dir = STATE_DIR
+_lock = threading.Lock()
+
+
+def _make_bucket(family: str) -> TokenBucket:
+    rate, burst = _limits.get(family, _limits["default"])
+    if _cross_process:
+        return FileTokenBucket(family, rate, burst, _state_dir)
+    return TokenBucket(rate, burst)
+
+
+def get_bucket(family: str) -> TokenBucket:
+    bucket = _buckets.get(family)
+    if bucket is not None:
+        return bucket
+    with _lock:
+        bucket = _buckets.get(family)
+        if bucket is None:
+            bucket = _make_bucket(family)
+            _buckets[family] = bucket
+    return bucket
+
+
+def acquire(family: str, n: float = 1, timeout: Optional[float] = None) -> float:
+    return get_bucket(family).acquire(n, timeout)
+
+
+def configure(family: str, rate: float, burst: Optional[int] = None):
+    """
+    Set the allowed rate (requests/sec) and burst for a family.
+    """
+    with _lock:
+        _limits[family] = (float(rate), int(burst if burst is not None else max(1, round(rate))))
+        _buckets.pop(family, None)
+
+
+def use_file_locks(enabled: bool = True, state_dir: str = STATE_DIR):
+    """
+    Share buckets across processes through flock'd state files in state_dir.
+    Falls back to in-process buckets where fcntl is unavailable (Windows).
+    """
+    global _cross_process, _state_dir
+    with _lock:
+        _cross_process = bool(enabled) and FILE_LOCK_AVAILABLE
+        _state_dir = state_dir
+        _buckets.clear()
+    return _cross_process
@@ -0,0 +1,111 @@
+# response_cache.py
+# In-process TTL + LRU cache for read-only broker responses, with single-flight
+# de-duplication: concurrent callers asking for the same key share one network call.
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+    Keys are tuples whose last element is the request path, e.g. (account, "/holdings").
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_fetch(self, key: Hashable, ttl: float, fetch: Callable[[], Any],
+                     should_cache: Callable[[Any], bool] = lambda v: True) -> Any:
+        """
+        Return the cached value for key if fresh, else call fetch() once no matter
+        how many threads ask concurrently. Exceptions from fetch propagate to every
+        waiting caller and are not cached.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                generation = self._generation
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # skip storing if an invalidation ran while we were fetching
+                if flight.error is None and generation == self._generation and should_cache(flight.value):
+                    self._data[key] = (time.monotonic() + ttl, flight.value)
+                    self._data.move_to_end(key)
+                    while len(self._data) > self.max_entries:
+                        self._data.popitem(last=False)
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, prefixes: Optional[Iterable[str]] = None, account: Optional[Hashable] = None):
+        """
+        Drop entries whose path starts with any of prefixes (all paths if None),
+        optionally only for one account (first key element).
+        """
+        prefixes = tuple(prefixes) if prefixes is not None else None
+        with self._lock:
+            self._generation += 1
+            for key in list(self._data):
+                if account is not None and key[0] != account:
+                    continue
+                if prefixes is None or str(key[-1]).startswith(prefixes):
+                    del self._data[key]
+
+    def clear(self):
+        self.invalidate()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """
+    Process-wide cache shared by every page and worker thread.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,146 @@
+# rs_engine.py
+# Relative strength against a benchmark index (Nifty 500) for a whole universe.
+# Symbols and the index are aligned on one date axis (indicator_panel), so RS
+# ratios for several lookbacks are a handful of array divisions instead of one
+# merge per symbol. rank_universe() adds IBD-style percentile ranks (1-99 on a
+# weighted 3/6/9/12-month performance score) and caches them per trading day.
+import glob
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import historical_catalog
+import historical_store
+from debug_utils import debug_log
+from indicator_panel import Panel, align, load_panel
+
+# trading-day lookbacks: 1, 3, 6 and 12 months
+LOOKBACKS = (21, 63, 126, 252)
+# IBD RS rating: the latest quarter counts double
+IBD_WEIGHTS = ((63, 0.4), (126, 0.2), (189, 0.2), (252, 0.2))
+# calendar days of history loaded for the longest lookback
+HISTORY_DAYS = 400
+CACHE_DIR = os.path.join("data", "rs")
+
+_memo: Dict[Tuple, pd.DataFrame] = {}
+_memo_lock = threading.Lock()
+
+
+def _change(values: np.ndarray, n: int) -> np.ndarray:
+    # values[t] / values[t - n] along the last axis (NaN for the first n)
+    out = np.full(values.shape, np.nan)
+    if n < values.shape[-1]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[..., n:] = values[..., n:] / values[..., :-n]
+    return out
+
+
+def rs_ratios(close: np.ndarray, bench: np.ndarray, lookbacks: Iterable[int] = LOOKBACKS) -> Dict[int, np.ndarray]:
+    """
+    lookback -> (symbol return over n bars) / (benchmark return over n bars),
+    for every symbol and date. close is symbols x dates, bench the aligned index.
+    """
+    return {n: _change(close, n) / _change(bench, n)[None, :] for n in lookbacks}
+
+
+def window_rs(panel: Panel, bench: np.ndarray) -> np.ndarray:
+    """
+    Per symbol: return from the first to the last date both it and the
+    benchmark have a bar, divided by the benchmark's return over the same
+    dates (NaN with fewer than two common dates). bench is aligned without
+    forward fill. This is the scanner's original merge-based RS, for all symbols at once.
+    """
+    both = panel.present & ~np.isnan(bench)[None, :]
+    rows = np.arange(len(panel))
+    first = np.argmax(both, axis=1)
+    last = both.shape[1] - 1 - np.argmax(both[:, ::-1], axis=1)
+    close = panel["close"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = (close[rows, last] / close[rows, first]) / (bench[last] / bench[first])
+    return np.where(both.sum(axis=1) >= 2, rs, np.nan)
+
+
+def ibd_score(close: np.ndarray) -> np.ndarray:
+    """
+    Weighted 3/6/9/12-month performance for every symbol and date.
+    """
+    return sum(w * _change(close, n) for n, w in IBD_WEIGHTS)
+
+
+def percentile_rank(scores: np.ndarray) -> np.ndarray:
+    """
+    1-99 rank of each score within the universe (NaN scores stay NaN).
+    """
+    pct = pd.Series(scores).rank(pct=True, method="average").to_numpy()
+    return np.where(np.isnan(pct), np.nan, np.clip(np.ceil(pct * 99), 1, 99))
+
+
+def rank_panel(panel: Panel, bench: np.ndarray, lookbacks: Iterable[int] = LOOKBACKS) -> pd.DataFrame:
+    """
+    One row per symbol on the panel's last date: close, RS ratio per lookback,
+    IBD score and its 1-99 rank. bench is the forward-filled aligned index.
+    """
+    close = panel["close"]
+    out = pd.DataFrame(panel.symbols)
+    out["Close"] = panel.last(close) if close.shape[1] else np.nan
+    for n, ratio in rs_ratios(close, bench, lookbacks).items():
+        out[f"RS_{n}"] = panel.last(ratio) if close.shape[1] else np.nan
+    score = panel.last(ibd_score(close)) if close.shape[1] else np.full(len(panel), np.nan)
+    out["RS_Score"] = score
+    out["RS_Rank"] = percentile_rank(score)
+    return out.sort_values("RS_Rank", ascending=False, na_position="last").reset_index(drop=True)
+
+
+def _universe_key(symbols: List[Dict], benchmark: Dict, lookbacks: Tuple[int, ...]) -> str:
+    tokens = sorted(f"{s.get('segment', '')}:{s.get('token')}" for s in symbols)
+    raw = "|".join(tokens + [f"{benchmark.get('segment')}:{benchmark.get('token')}", str(lookbacks)])
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _cache_path(session, key: str) -> str:
+    return os.path.join(CACHE_DIR, f"rs_{session:%Y%m%d}_{key}.csv")
+
+
+def rank_universe(symbols: Iterable[Dict], benchmark: Dict, segment: str = "NSE",
+                  now: Optional[datetime] = None, lookbacks: Iterable[int] = LOOKBACKS,
+                  refresh: bool = False) -> pd.DataFrame:
+    """
+    RS ratios and IBD-style ranks for symbol dicts against `benchmark`
+    ({"segment", "token"}) from local history, as of the last closed session.
+    Results are cached per trading day (in memory and under data/rs), so
+    every page asking for the same universe on the same day shares one computation.
+    """
+    symbols = list(symbols)
+    lookbacks = tuple(lookbacks)
+    session = historical_catalog.expected_session(now)
+    key = _universe_key(symbols, benchmark, lookbacks)
+    path = _cache_path(session, key)
+    with _memo_lock:
+        if not refresh and (session, key) in _memo:
+            return _memo[(session, key)]
+    if not refresh and os.path.exists(path):
+        df = pd.read_csv(path, dtype={"token": str, "segment": str})
+    else:
+        end = datetime.combine(session, datetime.max.time())
+        start = end - timedelta(days=HISTORY_DAYS)
+        panel = load_panel(symbols, segment, "day", start, end, fields=("close",))
+        records = historical_store.read_records(str(benchmark.get("segment", segment)).upper(),
+                                                str(benchmark.get("token")), "day", start, end)
+        bench = align(panel, records["ts"], records["close"]) if len(records) else np.full(len(panel.dates), np.nan)
+        df = rank_panel(panel, bench, lookbacks)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for old in glob.glob(os.path.join(CACHE_DIR, "rs_*.csv")):
+            if os.path.basename(old) < f"rs_{session:%Y%m%d}":
+                os.remove(old)
+        df.to_csv(path, index=False)
+        debug_log(f"rank_universe: {len(symbols)} symbols ranked for {session}")
+    with _memo_lock:
+        for stale in [k for k in _memo if k[0] != session]:
+            del _memo[stale]
+        _memo[(session, key)] = df
+    return df
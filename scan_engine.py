@@ -0,0 +1,107 @@
+# scan_engine.py
+# Concurrent symbol scans for the scanner pages.
+# Candles are fetched on a thread pool (every request still goes through the
+# shared rate limiter in http_client); the per-symbol evaluation runs inline
+# for small universes and on a process pool for large ones. Outcomes are
+# yielded as each symbol finishes, so a page can show matches while the scan
+# is still running, and every symbol reports its status, reason and timings.
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from debug_utils import debug_log
+
+DEFAULT_WORKERS = 8
+# universes at least this large evaluate symbols in worker processes
+PROCESS_THRESHOLD = 300
+
+MATCH = "match"
+NO_MATCH = "no match"
+ERROR = "error"
+
+# fetch(item) -> candles; evaluate(candles, item) -> (row or None, reason)
+Fetch = Callable[[Dict], pd.DataFrame]
+Evaluate = Callable[[pd.DataFrame, Dict], Tuple[Optional[Dict], str]]
+
+
+def _error_text(stage: str, e: Exception) -> str:
+    return f"{stage}: {type(e).__name__}: {e}"
+
+
+def _scan_one(item: Dict, fetch: Fetch, evaluate: Evaluate, procs: Optional[Executor]) -> Dict:
+    outcome = {"item": item, "status": ERROR, "reason": "", "row": None, "fetch_s": 0.0, "compute_s": 0.0}
+    t0 = time.monotonic()
+    try:
+        candles = fetch(item)
+    except Exception as e:
+        outcome["fetch_s"] = time.monotonic() - t0
+        outcome["reason"] = _error_text("fetch", e)
+        return outcome
+    t1 = time.monotonic()
+    outcome["fetch_s"] = t1 - t0
+    try:
+        if procs is not None:
+            row, reason = procs.submit(evaluate, candles, item).result()
+        else:
+            row, reason = evaluate(candles, item)
+        outcome["status"] = MATCH if row is not None else NO_MATCH
+        outcome["row"], outcome["reason"] = row, reason
+    except Exception as e:
+        outcome["reason"] = _error_text("compute", e)
+    outcome["compute_s"] = time.monotonic() - t1
+    return outcome
+
+
+def run_scan(items: Iterable[Dict], fetch: Fetch, evaluate: Evaluate, workers: int = DEFAULT_WORKERS,
+             processes: Optional[int] = None, process_threshold: int = PROCESS_THRESHOLD,
+             stop: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """
+    Scan `items` and yield one outcome per symbol, in completion order:
+    {"item", "status" (match / no match / error), "reason", "row", "fetch_s", "compute_s"}.
+
+    `evaluate` must be picklable (a module-level function or a partial of one)
+    when a process pool is used: len(items) >= process_threshold and
+    processes > 0 (default: spare cores, up to 4). Setting `stop` (or
+    closing the generator) cancels the symbols not started yet.
+    """
+    items = list(items)
+    if not items:
+        return
+    if processes is None:
+        # leave a core for the fetch threads; on a single core, processes only add IPC
+        processes = min(4, (os.cpu_count() or 1) - 1)
+    procs = None
+    if processes > 0 and len(items) >= process_threshold:
+        procs = ProcessPoolExecutor(max_workers=processes)
+    threads = ThreadPoolExecutor(max_workers=max(1, min(workers, len(items))))
+    debug_log(f"run_scan: {len(items)} symbols, {workers} fetch threads, "
+              f"{'process pool' if procs else 'inline'} evaluation")
+    try:
+        pending = {threads.submit(_scan_one, item, fetch, evaluate, procs) for item in items}
+        while pending:
+            if stop is not None and stop.is_set():
+                break
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+    finally:
+        threads.shutdown(wait=True, cancel_futures=True)
+        if procs is not None:
+            procs.shutdown(wait=True, cancel_futures=True)
+
+
+def summarize(outcomes: List[Dict]) -> pd.DataFrame:
+    """
+    Per-symbol report of a finished scan: symbol, status, reason and timings.
+    """
+    return pd.DataFrame([{
+        "Symbol": o["item"].get("symbol", ""),
+        "Status": o["status"],
+        "Reason": o["reason"],
+        "Fetch (s)": round(o["fetch_s"], 3),
+        "Compute (s)": round(o["compute_s"], 3),
+    } for o in outcomes], columns=["Symbol", "Status", "Reason", "Fetch (s)", "Compute (s)"])
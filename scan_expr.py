@@ -0,0 +1,327 @@
+# scan_expr.py
+# Scan expressions over an indicator panel, e.g.
+#   close > ema(20) and ema(20) > ema(50) and rsi(14) > 60 and rs(nifty500, 60) > 1
+# An expression is parsed once into a tree of tuples; evaluating it runs one
+# vectorized numpy op per node over the whole symbols x dates panel. Equal
+# subtrees are the same tuple, so within one run every subexpression (ema(20)
+# above, or a whole clause shared by several scans) is computed only once.
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indicator_panel import Panel
+
+FIELDS = ("open", "high", "low", "close", "volume")
+
+# function -> (panel indicator, number of numeric arguments)
+FUNCTIONS = {
+    "ema": ("ema", 1),
+    "sma": ("sma", 1),
+    "rsi": ("rsi", 1),
+    "rsi_sma": ("rsi_sma", 1),
+    "atr": ("atr", 1),
+    "high": ("high", 1),
+    "low": ("low", 1),
+    "updays": ("updays", 1),
+    "downdays": ("downdays", 1),
+    "macd": ("macd", 0),
+    "macd_signal": ("macd", 0),
+}
+
+_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_][A-Za-z0-9_]*)|(>=|<=|==|!=|[<>()+\-*/,]))")
+_COMPARE = {">": np.greater, "<": np.less, ">=": np.greater_equal, "<=": np.less_equal,
+            "==": np.equal, "!=": np.not_equal}
+_ARITH = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+
+Node = Tuple
+_CONDITIONS = ("cmp", "and", "or", "not")
+
+
+class ScanSyntaxError(ValueError):
+    pass
+
+
+def _tokenize(text: str) -> List[Tuple[str, str, int]]:
+    out, pos = [], 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise ScanSyntaxError(f"unexpected {text[pos:].strip()[:10]!r} at column {pos + 1}")
+        kind = "num" if m.group(1) else "name" if m.group(2) else "op"
+        out.append((kind, m.group(m.lastindex), m.start(m.lastindex)))
+        pos = m.end()
+    return out
+
+
+class _Parser:
+    # precedence: or < and < not < comparison < + - < * / < unary minus
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.i = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.i][1].lower() if self.i < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> Tuple[str, str, int]:
+        if self.i >= len(self.tokens):
+            raise ScanSyntaxError(f"unexpected end of expression{f', expected {expected!r}' if expected else ''}")
+        tok = self.tokens[self.i]
+        if expected is not None and tok[1].lower() != expected:
+            raise ScanSyntaxError(f"expected {expected!r} at column {tok[2] + 1}, got {tok[1]!r}")
+        self.i += 1
+        return tok
+
+    def parse(self) -> Node:
+        node = self.or_expr()
+        if self.i < len(self.tokens):
+            tok = self.tokens[self.i]
+            raise ScanSyntaxError(f"unexpected {tok[1]!r} at column {tok[2] + 1}")
+        return node
+
+    def column(self) -> int:
+        return self.tokens[self.i][2] if self.i < len(self.tokens) else len(self.text)
+
+    def require_condition(self, node: Node, word: str, start: int):
+        # and/or/not only combine conditions: "close and ema(20)" is a mistake, not a mask
+        if node[0] not in _CONDITIONS:
+            raise ScanSyntaxError(f"{word!r} needs a condition such as close > ema(20), "
+                                  f"got {self.text[start:self.column()].strip()!r} at column {start + 1}")
+
+    def operand(self, parse_operand, word: str) -> Node:
+        start = self.column()
+        node = parse_operand()
+        self.require_condition(node, word, start)
+        return node
+
+    def or_expr(self) -> Node:
+        start = self.column()
+        node = self.and_expr()
+        while self.peek() == "or":
+            self.require_condition(node, "or", start)
+            self.take()
+            node = ("or", node, self.operand(self.and_expr, "or"))
+        return node
+
+    def and_expr(self) -> Node:
+        start = self.column()
+        node = self.not_expr()
+        while self.peek() == "and":
+            self.require_condition(node, "and", start)
+            self.take()
+            node = ("and", node, self.operand(self.not_expr, "and"))
+        return node
+
+    def not_expr(self) -> Node:
+        if self.peek() == "not":
+            self.take()
+            return ("not", self.operand(self.not_expr, "not"))
+        return self.comparison()
+
+    def comparison(self) -> Node:
+        node = self.sum()
+        if self.peek() in _COMPARE:
+            op = self.take()[1]
+            node = ("cmp", op, node, self.sum())
+        return node
+
+    def sum(self) -> Node:
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            op = self.take()[1]
+            node = ("arith", op, node, self.term())
+        return node
+
+    def term(self) -> Node:
+        node = self.unary()
+        while self.peek() in ("*", "/"):
+            op = self.take()[1]
+            node = ("arith", op, node, self.unary())
+        return node
+
+    def unary(self) -> Node:
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.unary())
+        return self.atom()
+
+    def atom(self) -> Node:
+        kind, value, pos = self.take()
+        if kind == "num":
+            return ("num", float(value))
+        if value == "(":
+            node = self.or_expr()
+            self.take(")")
+            return node
+        if kind != "name":
+            raise ScanSyntaxError(f"unexpected {value!r} at column {pos + 1}")
+        name = value.lower()
+        if self.peek() != "(":
+            if name in FIELDS:
+                return ("field", name)
+            raise ScanSyntaxError(f"unknown name {value!r} at column {pos + 1}")
+        self.take("(")
+        args = []
+        while self.peek() != ")":
+            if args:
+                self.take(",")
+            kind, arg, apos = self.take()
+            if kind == "num":
+                args.append(int(float(arg)) if float(arg).is_integer() else float(arg))
+            elif kind == "name":
+                args.append(arg.lower())
+            else:
+                raise ScanSyntaxError(f"unexpected {arg!r} at column {apos + 1}")
+        self.take(")")
+        if name == "rs":
+            if len(args) != 2 or not isinstance(args[0], str) or not isinstance(args[1], int):
+                raise ScanSyntaxError("rs() takes a benchmark name and a lookback, e.g. rs(nifty500, 60)")
+        elif name in FUNCTIONS:
+            if len(args) != FUNCTIONS[name][1] or any(isinstance(a, str) for a in args):
+                raise ScanSyntaxError(f"{name}() takes {FUNCTIONS[name][1]} numeric argument(s)")
+        else:
+            raise ScanSyntaxError(f"unknown function {value!r} at column {pos + 1}")
+        # every numeric argument is a period (bars), checked here rather than failing in numpy
+        bad = [a for a in args if not isinstance(a, str) and (not isinstance(a, int) or a < 1)]
+        if bad:
+            raise ScanSyntaxError(f"{name}() period must be a whole number >= 1, got {bad[0]} at column {pos + 1}")
+        return ("call", name, tuple(args))
+
+
+@lru_cache(maxsize=256)
+def parse(text: str) -> Node:
+    """
+    Expression text -> tree of tuples (cached, so each distinct scan is parsed once).
+    """
+    if not text or not text.strip():
+        raise ScanSyntaxError("empty scan expression")
+    return _Parser(text).parse()
+
+
+def _shift(values: np.ndarray, n: int) -> np.ndarray:
+    out = np.full_like(values, np.nan)
+    if n < values.shape[-1]:
+        out[..., n:] = values[..., :-n] if n else values
+    return out
+
+
+class Evaluator:
+    """
+    Evaluates scan trees over one panel. Results are memoised per node, so
+    subexpressions shared within or between scans are computed once.
+    benchmarks: name -> 1-D closes aligned to panel.dates (for rs()).
+    """
+    def __init__(self, panel: Panel, benchmarks: Optional[Dict[str, np.ndarray]] = None):
+        self.panel = panel
+        self.benchmarks = {k.lower(): np.asarray(v, dtype=np.float64) for k, v in (benchmarks or {}).items()}
+        self._memo: Dict[Node, np.ndarray] = {}
+
+    def value(self, node: Node) -> np.ndarray:
+        if node not in self._memo:
+            self._memo[node] = self._compute(node)
+        return self._memo[node]
+
+    def _compute(self, node: Node) -> np.ndarray:
+        kind = node[0]
+        if kind == "num":
+            return np.float64(node[1])
+        if kind == "field":
+            return self.panel[node[1]]
+        if kind == "call":
+            return self._call(node[1], node[2])
+        if kind == "neg":
+            return -self.value(node[1])
+        if kind == "not":
+            return ~self.value(node[1])
+        if kind == "and":
+            return self.value(node[1]) & self.value(node[2])
+        if kind == "or":
+            return self.value(node[1]) | self.value(node[2])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if kind == "arith":
+                return _ARITH[node[1]](self.value(node[2]), self.value(node[3]))
+            if kind == "cmp":
+                # comparisons with NaN (no data yet) are False
+                return _COMPARE[node[1]](self.value(node[2]), self.value(node[3]))
+        raise ScanSyntaxError(f"bad node {node!r}")
+
+    def _call(self, name: str, args: Tuple) -> np.ndarray:
+        if name == "rs":
+            bench_name, n = args
+            if bench_name not in self.benchmarks:
+                raise ScanSyntaxError(f"no benchmark {bench_name!r} loaded for rs()")
+            close = self.panel["close"]
+            bench = self.benchmarks[bench_name]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return (close / _shift(close, n)) / (bench / _shift(bench, n))[None, :]
+        indicator, _ = FUNCTIONS[name]
+        result = self.panel.indicator(indicator, *args)
+        if indicator == "macd":
+            return result[1] if name == "macd_signal" else result[0]
+        return result
+
+
+def run_scans(scans: Dict[str, str], panel: Panel,
+              benchmarks: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, np.ndarray]:
+    """
+    name -> boolean mask over panel.symbols (evaluated on the last date) for
+    every scan, all in one pass over the panel.
+    """
+    ev = Evaluator(panel, benchmarks)
+    out = {}
+    for name, text in scans.items():
+        mask = np.asarray(ev.value(parse(text)))
+        if mask.dtype != bool:
+            raise ScanSyntaxError(f"scan {name!r} is not a condition: {text}")
+        out[name] = mask[:, -1] if mask.ndim == 2 else np.broadcast_to(mask, (len(panel),))
+    return out
+
+
+def scan_frame(scans: Dict[str, str], panel: Panel, benchmarks: Optional[Dict[str, np.ndarray]] = None,
+               only_matches: bool = True) -> pd.DataFrame:
+    """
+    Symbols (with their last close) and one boolean column per scan.
+    """
+    masks = run_scans(scans, panel, benchmarks)
+    out = pd.DataFrame(panel.symbols)
+    out["close"] = panel.last(panel["close"]) if len(panel.dates) else np.nan
+    for name, mask in masks.items():
+        out[name] = mask
+    if only_matches and masks:
+        out = out[np.logical_or.reduce(list(masks.values()))]
+    return out.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import time
+    n, t = 2400, 250
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, (n, t)), axis=1))
+    spread = np.abs(rng.normal(0, 0.01, (n, t)))
+    panel = Panel([{"symbol": f"SYM{i}"} for i in range(n)], pd.bdate_range("2025-01-01", periods=t).values,
+                  {"close": close, "high": close * (1 + spread), "low": close * (1 - spread)},
+                  np.ones((n, t), dtype=bool))
+    nifty = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.01, t)))
+    scans = {
+        "trend": "close > ema(20) and ema(20) > ema(50) and rsi(14) > 60 and rs(nifty500, 60) > 1",
+        "pullback": "ema(20) > ema(50) and close < ema(20) and rsi(14) > 40",
+        "breakout": "close >= high(50) and updays(15) > downdays(15) and macd() > macd_signal()",
+    }
+    t0 = time.perf_counter()
+    df = scan_frame(scans, panel, {"nifty500": nifty})
+    print(f"{len(scans)} scans over {n} x {t}: {len(df)} symbols matched in {time.perf_counter() - t0:.3f}s")
+    print(df[list(scans)].sum())
+
+    # mistakes are ScanSyntaxError at parse time, never a numpy error mid-scan
+    for bad in ("ema(0)", "high(0) < close", "sma(20.5) > 1", "high(20.5) < close", "ema(-5) > 1",
+                "rs(nifty500, 0) > 1", "close and ema(20)", "not close", "close > 1 or rsi(14)"):
+        try:
+            parse(bad)
+        except ScanSyntaxError as e:
+            print(f"rejected {bad!r}: {e}")
+        else:
+            raise AssertionError(f"{bad!r} was accepted")
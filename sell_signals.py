@@ -0,0 +1,202 @@
+# sell_signals.py
+# Minervini sell signals for a whole portfolio at once.
+# Every holding's last `lookback` bars are packed into symbols x lookback
+# arrays (each symbol's own bars, so a halted or newly listed stock is not
+# padded with forward-filled days) and each signal is one numpy expression
+# over all of them: up-day %, largest up day and spread, exhaustion gaps,
+# high-volume reversals, churning and heavy-volume down days.
+# holdings_details.minervini_sell_signals() is the one-symbol view of the same table.
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from indicator_panel import Panel
+
+DEFAULT_LOOKBACK = 15
+
+# signal column -> heatmap label, in display order
+SIGNALS = {
+    "up_day_warning": "Up Days ≥70%",
+    "climax_day": "Up Day >5%",
+    "exhaustion_gap": "Exhaustion Gap",
+    "high_volume_reversal": "HV Reversal",
+    "churning": "Churning",
+    "heavy_volume_down": "HV Down Day",
+}
+
+
+def _tail_window(panel: Panel, lookback: int) -> Dict[str, np.ndarray]:
+    """
+    field -> symbols x lookback array of each symbol's last `lookback` own bars
+    (right-aligned, NaN on the left where a symbol has fewer), plus "bars": how many it has.
+    """
+    present = panel.present
+    # bars from each date to the end of the panel, counted per symbol
+    remaining = np.cumsum(present[:, ::-1], axis=1)[:, ::-1]
+    rows, cols = np.nonzero(present & (remaining <= lookback))
+    slots = lookback - remaining[rows, cols]
+    out = {}
+    for name in ("open", "high", "low", "close", "volume"):
+        values = np.full((len(panel), lookback), np.nan)
+        values[rows, slots] = panel[name][rows, cols]
+        out[name] = values
+    out["bars"] = present.sum(axis=1)
+    return out
+
+
+def signal_arrays(open_, high, low, close, volume, lookback: int = DEFAULT_LOOKBACK) -> Dict[str, np.ndarray]:
+    """
+    Signals for symbols x lookback arrays (oldest bar first, the last column
+    the latest bar); one value per symbol for each key of the per-symbol dict.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.full(close.shape, np.nan)
+        change[:, 1:] = (close[:, 1:] / close[:, :-1] - 1) * 100
+        spread = high - low
+        up = (close[:, 1:] > close[:, :-1]).sum(axis=1)
+        down = (close[:, 1:] < close[:, :-1]).sum(axis=1)
+
+        prev_high = high[:, :-1]
+        exhaustion_gap = ((open_[:, 1:] > prev_high) & (low[:, 1:] <= prev_high)).any(axis=1)
+
+        # mean volume over the window, skipping missing bars as pandas does
+        has_volume = ~np.isnan(volume)
+        avg_volume = np.nansum(volume, axis=1) / has_volume.sum(axis=1)
+        loud = volume[:, 1:] > avg_volume[:, None] * 1.5
+        weak_close = (close[:, 1:] - low[:, 1:]) < spread[:, 1:] * 0.25
+        high_volume_reversal = (loud & (high[:, 1:] > prev_high) & weak_close).any(axis=1)
+
+        last_volume = volume[:, -1]
+        churning = ((last_volume > avg_volume * 1.8)
+                    & (np.abs(close[:, -1] - open_[:, -1]) < spread[:, -1] * 0.15))
+        heavy_volume_down = (last_volume > avg_volume * 1.5) & (change[:, -1] < -3)
+
+    return {
+        "up_days": up,
+        "down_days": down,
+        "up_day_percent": up / lookback * 100,
+        "largest_up_day": np.fmax.reduce(change, axis=1),
+        "largest_spread": np.fmax.reduce(spread, axis=1),
+        "exhaustion_gap": exhaustion_gap,
+        "high_volume_reversal": high_volume_reversal,
+        "churning": churning,
+        "heavy_volume_down": heavy_volume_down,
+    }
+
+
+def warnings_for(signals: Dict, lookback: int) -> List[str]:
+    """
+    The warning lines shown for one symbol's signals.
+    """
+    warnings = []
+    if signals["up_day_percent"] >= 70:
+        warnings.append(
+            f"⚠️ {signals['up_day_percent']:.0f}% up days ({signals['up_days']}/{lookback}) - "
+            "Consider selling into strength"
+        )
+    if signals["largest_up_day"] > 5:
+        warnings.append(f"⚠️ Largest up day: {signals['largest_up_day']:.2f}% - Potential climax run")
+    if signals["exhaustion_gap"]:
+        warnings.append("⚠️ Exhaustion gap detected - Potential reversal signal")
+    if signals["high_volume_reversal"]:
+        warnings.append("⚠️ High-volume reversal - Institutional selling")
+    if signals["churning"]:
+        warnings.append("⚠️ Churning detected (high volume, low progress) - Distribution likely")
+    if signals["heavy_volume_down"]:
+        warnings.append("⚠️ Heavy volume down day - Consider exiting position")
+    return warnings
+
+
+def sell_signals(panel: Panel, lookback: int = DEFAULT_LOOKBACK) -> pd.DataFrame:
+    """
+    One row per symbol of the panel: its symbol fields, every signal, the
+    boolean SIGNALS columns and "signal_count". Symbols with fewer than
+    `lookback` bars have enough_data == False and no signals.
+    """
+    window = _tail_window(panel, lookback)
+    values = signal_arrays(window["open"], window["high"], window["low"], window["close"],
+                           window["volume"], lookback)
+    out = pd.DataFrame(panel.symbols)
+    out["enough_data"] = window["bars"] >= lookback
+    for name, column in values.items():
+        out[name] = column
+    out["up_day_warning"] = out["up_day_percent"] >= 70
+    out["climax_day"] = out["largest_up_day"] > 5
+    flags = out[list(SIGNALS)].to_numpy() & out["enough_data"].to_numpy()[:, None]
+    out[list(SIGNALS)] = flags
+    out["signal_count"] = flags.sum(axis=1)
+    return out
+
+
+if __name__ == "__main__":
+    # the per-symbol loop this replaces (holdings_details before), checked on random portfolios
+    import time
+
+    def legacy(df, lookback_days=15):
+        recent = df.tail(lookback_days).copy()
+        recent['change'] = recent['Close'].pct_change() * 100
+        recent['spread'] = recent['High'] - recent['Low']
+        s = {'up_days': 0, 'down_days': 0, 'exhaustion_gap': False, 'high_volume_reversal': False,
+             'churning': False, 'heavy_volume_down': False}
+        for i in range(1, len(recent)):
+            if recent['Close'].iloc[i] > recent['Close'].iloc[i-1]:
+                s['up_days'] += 1
+            elif recent['Close'].iloc[i] < recent['Close'].iloc[i-1]:
+                s['down_days'] += 1
+        s['up_day_percent'] = (s['up_days'] / lookback_days) * 100
+        s['largest_up_day'] = recent['change'].max()
+        s['largest_spread'] = recent['spread'].max()
+        gap_up = recent['Open'] > recent['High'].shift(1)
+        for i in range(1, len(recent)):
+            if gap_up.iloc[i] and recent['Low'].iloc[i] <= recent['High'].shift(1).iloc[i]:
+                s['exhaustion_gap'] = True
+        avg_volume = recent['Volume'].mean()
+        for i in range(1, len(recent)):
+            if recent['Volume'].iloc[i] > avg_volume * 1.5:
+                range_ = recent['High'].iloc[i] - recent['Low'].iloc[i]
+                if (recent['High'].iloc[i] > recent['High'].iloc[i-1] and
+                        (recent['Close'].iloc[i] - recent['Low'].iloc[i]) < range_ * 0.25):
+                    s['high_volume_reversal'] = True
+                    break
+        if recent['Volume'].iloc[-1] > avg_volume * 1.8:
+            if abs(recent['Close'].iloc[-1] - recent['Open'].iloc[-1]) < recent['spread'].iloc[-1] * 0.15:
+                s['churning'] = True
+        if recent['Volume'].iloc[-1] > avg_volume * 1.5 and recent['change'].iloc[-1] < -3:
+            s['heavy_volume_down'] = True
+        return s
+
+    rng = np.random.default_rng(3)
+    n, t, lookback = 300, 60, 15
+    dates = pd.bdate_range("2025-01-01", periods=t)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.002, 0.03, (n, t)), axis=1))
+    open_ = close * (1 + rng.normal(0, 0.02, (n, t)))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, (n, t))))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, (n, t))))
+    volume = rng.lognormal(12, 0.6, (n, t)).round()
+    present = np.ones((n, t), dtype=bool)
+    present[:20, :50] = False           # recent listings, some shorter than the lookback
+    present[20:40, rng.integers(0, t, 10)] = False   # missing sessions
+    series = [{"ts": dates.values.astype("datetime64[ns]")[present[i]].view(np.int64), "open": open_[i, present[i]],
+               "high": high[i, present[i]], "low": low[i, present[i]], "close": close[i, present[i]],
+               "volume": volume[i, present[i]]} for i in range(n)]
+    from indicator_panel import build_panel
+    panel = build_panel([{"symbol": f"SYM{i}"} for i in range(n)], series)
+
+    t0 = time.perf_counter()
+    table = sell_signals(panel, lookback)
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    frames = [pd.DataFrame({"Open": b["open"], "High": b["high"], "Low": b["low"], "Close": b["close"],
+                            "Volume": b["volume"]}) for b in series]
+    reference = [legacy(df, lookback) if len(df) >= lookback else None for df in frames]
+    legacy_s = time.perf_counter() - t0
+    for i, ref in enumerate(reference):
+        row = table.iloc[i]
+        assert bool(row["enough_data"]) == (ref is not None), i
+        if ref is None:
+            continue
+        for key, expected in ref.items():
+            assert np.isclose(row[key], expected, rtol=1e-12, equal_nan=True), (i, key, row[key], expected)
+    print(f"{n} symbols: vectorized {elapsed:.4f}s, per-symbol loop {legacy_s:.2f}s, all signals identical")
+    print(table[list(SIGNALS) + ["signal_count"]].sum())
@@ -1,49 +1,14 @@
 import streamlit as st
 import pandas as pd
-import requests
-import io
+from candle_provider import get_candles
+import indicator_cache
 from datetime import datetime, timedelta
 import plotly.graph_objs as go
 import numpy as np
-
-@st.cache_data
-def load_master():
-    df = pd.read_csv("master.csv", sep="\t", header=None)
-    df.columns = [
-        "segment", "token", "symbol", "symbol_series", "series", "unknown1",
-        "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
-        "isin", "unknown7", "company"
-    ]
-    return df[["segment", "token", "symbol", "symbol_series", "series", "company"]]
-
-def get_token(symbol, segment, series, master_df):
-    candidates = master_df[
-        (master_df['segment'].str.upper() == segment.upper()) &
-        ((master_df['symbol'].str.upper() == symbol.upper()) | (master_df['symbol_series'].str.upper() == symbol.upper()))
-    ]
-    if not candidates.empty:
-        row = candidates[candidates['series'].str.upper() == series.upper()]
-        if not row.empty:
-            return row.iloc[0]['token']
-        return candidates.iloc[0]['token']
-    return None
+from symbol_index import get_index
 
 def fetch_candles_definedge(segment, token, from_dt, to_dt, api_key):
-    url = f"https://data.definedgesecurities.com/sds/history/{segment}/{token}/day/{from_dt}/{to_dt}"
-    headers = {"Authorization": api_key}
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        raise Exception(f"API error: {resp.status_code} {resp.text}")
-    cols = ["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI"]
-    df = pd.read_csv(io.StringIO(resp.text), header=None, names=cols)
-    df = df[df["Dateandtime"].notnull()]
-    df = df[df["Dateandtime"].astype(str).str.strip() != ""]
-    df["Date"] = pd.to_datetime(df["Dateandtime"], format="%d%m%Y%H%M", errors="coerce")
-    df = df.dropna(subset=["Date"])
-    df = df[df["Date"] <= pd.Timestamp.now()]
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df
+    return get_candles(segment, token, "day", from_dt, to_dt, api_key, until=pd.Timestamp.now())
 
 def get_time_range(days, endtime="1530"):
     now = datetime.now()
@@ -72,7 +37,8 @@ def show():
     st.header("Definedge Simple Candlestick Chart Demo (Daily, Live)")
 
     api_key = st.secrets.get("integrate_api_session_key", "")
-    master_df = load_master()
+    symbols = get_index()
+    master_df = symbols.frame
 
     segment_options = sorted(master_df["segment"].str.upper().unique())
     segment = st.selectbox("Segment", segment_options, index=0)
@@ -110,20 +76,9 @@ def show():
     )
 
     # Identify index symbol and series
-    index_row = None
-    index_symbol = None
-    index_series = "IDX"
-    for idx, row in master_df.iterrows():
-        sym = row["symbol"].strip().lower()
-        if (rs_index_option == "Nifty 500" and sym == "nifty 500") or \
-           (rs_index_option == "Nifty 50" and sym == "nifty 50"):
-            index_row = row
-            index_symbol = row["symbol"]
-            if "series" in row and pd.notnull(row["series"]):
-                index_series = row["series"]
-            break
-
-    token = get_token(symbol, segment, series, master_df)
+    index_row = symbols.lookup_symbol(rs_index_option)
+
+    token = symbols.token_for(symbol, segment, series)
     if not token:
         st.error("Symbol-token mapping not found in master file. Try another symbol/series.")
         return
@@ -156,9 +111,9 @@ def show():
     chart_df = df.tail(60).copy()
 
     if show_ema20:
-        chart_df['EMA20'] = chart_df['Close'].ewm(span=20, adjust=False).mean()
+        chart_df['EMA20'] = indicator_cache.compute(chart_df, segment, token, "day", "ema", 20)
     if show_ema50:
-        chart_df['EMA50'] = chart_df['Close'].ewm(span=50, adjust=False).mean()
+        chart_df['EMA50'] = indicator_cache.compute(chart_df, segment, token, "day", "ema", 50)
 
     fig = go.Figure()
     fig.add_trace(go.Candlestick(
@@ -1,5 +1,7 @@
 import streamlit as st
-from utils import integrate_get, integrate_post
+import numpy as np
+from portfolio_snapshot import get_snapshot, resolve_symbol_info
+from utils import integrate_post
 
 def extract_first_valid(d, keys, default=""):
     for k in keys:
@@ -118,8 +120,7 @@ def show():
     st.markdown("---")
     # --- Holdings Table ---
     st.header("📦 Holdings")
-    data = integrate_get("/holdings")
-    holdings = data.get("data", [])
+    snap = get_snapshot(st.secrets.get("integrate_api_session_key", ""))
 
     hold_cols = ["tradingsymbol", "exchange", "isin", "dp_qty", "t1_qty", "avg_buy_price", "haircut"]
     col_labels = ["Symbol", "Exch", "ISIN", "DP Qty", "T1 Qty", "Avg Price", "Haircut"]
@@ -130,17 +131,17 @@ def show():
     columns[-1].markdown("**Square Off**")
 
     user_holdings = []
-    for h in holdings:
-        qty = int(float(h.get("dp_qty", 0) or 0))
-        tradingsymbols = h.get("tradingsymbol", [])
-        if qty > 0 and tradingsymbols and isinstance(tradingsymbols, list):
-            user_holdings.append((h, qty, tradingsymbols))
+    for h, hold in zip(snap.raw_holdings, snap.holdings.itertuples(index=False)):
+        qty = 0 if np.isnan(hold.dp_qty) else int(hold.dp_qty)
+        if qty > 0 and hold.symbol != "N/A":
+            ts_info = dict(resolve_symbol_info(h))
+            ts_info.setdefault("exchange", hold.exchange)
+            user_holdings.append((h, qty, ts_info))
     if not user_holdings:
         st.info("No holdings to square off.")
     else:
         sq_id = st.session_state.get("sq_id", None)
-        for idx, (holding, qty, tradingsymbols) in enumerate(user_holdings):
-            ts_info = tradingsymbols[0]
+        for idx, (holding, qty, ts_info) in enumerate(user_holdings):
             columns = st.columns([1.5, 1.2, 1.5, 1.1, 1.1, 1.2, 1.1, 1.2])
             for i, key in enumerate(hold_cols):
                 val = ts_info.get(key) if key in ts_info else holding.get(key)
@@ -154,8 +155,6 @@ def show():
 
     # --- Positions Table ---
     st.header("📝 Positions")
-    pdata = integrate_get("/positions")
-    positions = pdata.get("positions") or pdata.get("data") or []
 
     col_labels = ["Symbol", "Exch", "Product", "Qty", "Buy Avg", "Sell Avg", "Net Qty", "PnL"]
     st.markdown("#### Positions List")
@@ -164,11 +163,7 @@ def show():
         columns[i].markdown(f"**{label}**")
     columns[-1].markdown("**Square Off**")
 
-    user_positions = []
-    for p in positions:
-        qty = extract_qty(p)
-        if qty != 0:
-            user_positions.append(p)
+    user_positions = [p for p, q in zip(snap.raw_positions, snap.positions["net_qty"]) if int(q) != 0]
     sqp_id = st.session_state.get("sqp_id", None)
     if not user_positions:
         st.info("No open positions to square off.")
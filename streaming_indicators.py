@@ -0,0 +1,244 @@
+# streaming_indicators.py
+# Tick-driven indicators for the trade bot, O(1) (amortised) per tick.
+# TickIndicators keeps, per subscribed key: an EMA of the LTP, the session
+# VWAP (from the feed's cumulative volume), rolling high/low over a time
+# window (monotonic deques) and 1-minute bars built from the ticks, with a
+# Wilder ATR over the completed bars. Nothing here touches history or the
+# network, so PortfolioEngine.on_tick can update them inline.
+import math
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Dict, Optional
+
+EMA_PERIOD = 20          # ticks
+EXTREME_WINDOW_SEC = 15 * 60
+BAR_SECONDS = 60
+ATR_PERIOD = 14          # 1-minute bars
+
+
+class StreamingEMA:
+    """
+    EMA over successive values, alpha = 2 / (period + 1), seeded with the first one
+    (the same recursion as indicators.ema).
+    """
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, period: int = EMA_PERIOD):
+        self.alpha = 2.0 / (period + 1)
+        self.value = math.nan
+
+    def update(self, x: float) -> float:
+        v = self.value
+        self.value = x if v != v else v + self.alpha * (x - v)
+        return self.value
+
+
+class SessionVWAP:
+    """
+    Volume-weighted average LTP for the current session. The feed reports
+    cumulative day volume, so each tick's volume is the increase since the
+    previous one; a new date (or a drop in cumulative volume) starts a new session.
+    """
+    __slots__ = ("session", "last_volume", "pv", "volume")
+
+    def __init__(self):
+        self.session: Optional[date] = None
+        self.last_volume = 0.0
+        self.pv = 0.0
+        self.volume = 0.0
+
+    def update(self, price: float, cum_volume: float, session: date) -> float:
+        if session != self.session or cum_volume < self.last_volume:
+            self.session, self.last_volume, self.pv, self.volume = session, 0.0, 0.0, 0.0
+        traded = cum_volume - self.last_volume
+        self.last_volume = cum_volume
+        if traded > 0:
+            self.pv += price * traded
+            self.volume += traded
+        return self.value
+
+    @property
+    def value(self) -> float:
+        return self.pv / self.volume if self.volume else math.nan
+
+
+class RollingExtreme:
+    """
+    Highest (or lowest) value seen in the last `window` seconds. The deque
+    holds (ts, value) with values strictly decreasing (increasing for lows),
+    so each tick is pushed and popped at most once.
+    """
+    __slots__ = ("window", "highs", "items")
+
+    def __init__(self, window: float = EXTREME_WINDOW_SEC, highs: bool = True):
+        self.window = window
+        self.highs = highs
+        self.items = deque()
+
+    def update(self, ts: float, x: float) -> float:
+        items = self.items
+        if self.highs:
+            while items and items[-1][1] <= x:
+                items.pop()
+        else:
+            while items and items[-1][1] >= x:
+                items.pop()
+        items.append((ts, x))
+        cutoff = ts - self.window
+        while items[0][0] <= cutoff:
+            items.popleft()
+        return items[0][1]
+
+    @property
+    def value(self) -> float:
+        return self.items[0][1] if self.items else math.nan
+
+
+class MinuteBars:
+    """
+    OHLC bars of `seconds` length built from ticks, and a Wilder ATR over the
+    completed bars (seeded with the mean true range of the first `period`).
+    """
+    __slots__ = ("seconds", "period", "bucket", "open", "high", "low", "close",
+                 "prev_close", "bars", "tr_sum", "atr", "last_bar")
+
+    def __init__(self, seconds: int = BAR_SECONDS, period: int = ATR_PERIOD):
+        self.seconds = seconds
+        self.period = period
+        self.bucket = None
+        self.open = self.high = self.low = self.close = math.nan
+        self.prev_close = math.nan
+        self.bars = 0
+        self.tr_sum = 0.0
+        self.atr = math.nan
+        self.last_bar: Optional[tuple] = None   # (bucket start ts, open, high, low, close)
+
+    def _close_bar(self):
+        h, l, pc = self.high, self.low, self.prev_close
+        tr = h - l if pc != pc else max(h - l, abs(h - pc), abs(l - pc))
+        self.bars += 1
+        if self.bars < self.period:
+            self.tr_sum += tr
+        elif self.bars == self.period:
+            self.atr = (self.tr_sum + tr) / self.period
+        else:
+            self.atr = (self.atr * (self.period - 1) + tr) / self.period
+        self.prev_close = self.close
+        self.last_bar = (self.bucket * self.seconds, self.open, h, l, self.close)
+
+    def update(self, ts: float, x: float):
+        bucket = int(ts // self.seconds)
+        if bucket != self.bucket:
+            if self.bucket is not None:
+                self._close_bar()
+            self.bucket = bucket
+            self.open = self.high = self.low = self.close = x
+            return
+        if x > self.high:
+            self.high = x
+        elif x < self.low:
+            self.low = x
+        self.close = x
+
+
+class TickIndicators:
+    """
+    Every streaming indicator for one subscribed key.
+    """
+    __slots__ = ("ema", "vwap", "high", "low", "bars", "ltp", "ticks", "_day", "_day_end")
+
+    def __init__(self, ema_period: int = EMA_PERIOD, window: float = EXTREME_WINDOW_SEC,
+                 bar_seconds: int = BAR_SECONDS, atr_period: int = ATR_PERIOD):
+        self.ema = StreamingEMA(ema_period)
+        self.vwap = SessionVWAP()
+        self.high = RollingExtreme(window, highs=True)
+        self.low = RollingExtreme(window, highs=False)
+        self.bars = MinuteBars(bar_seconds, atr_period)
+        self.ltp = math.nan
+        self.ticks = 0
+        self._day: Optional[date] = None
+        self._day_end = -math.inf
+
+    def update(self, ltp: float, ts: Optional[float] = None, cum_volume: Optional[float] = None):
+        """
+        One tick: ts in epoch seconds (now if None); cum_volume is the feed's
+        cumulative session volume, when the tick carries one.
+        """
+        if ts is None:
+            ts = time.time()
+        self.ltp = ltp
+        self.ticks += 1
+        self.ema.update(ltp)
+        self.high.update(ts, ltp)
+        self.low.update(ts, ltp)
+        self.bars.update(ts, ltp)
+        if cum_volume is not None:
+            if ts >= self._day_end:
+                # resolve the session date once per day rather than on every tick
+                day = datetime.fromtimestamp(ts).date()
+                self._day = day
+                self._day_end = datetime.combine(day, datetime.max.time()).timestamp()
+            self.vwap.update(ltp, cum_volume, self._day)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "ltp": self.ltp,
+            "ema": self.ema.value,
+            "vwap": self.vwap.value,
+            "high": self.high.value,
+            "low": self.low.value,
+            "atr": self.bars.atr,
+            "ticks": self.ticks,
+        }
+
+
+if __name__ == "__main__":
+    # micro-benchmark: cost of one on_tick update against the old 20-element LTP list
+    import random
+
+    import numpy as np
+
+    import indicators
+
+    n = 200_000
+    rng = random.Random(1)
+    t0 = 1_760_000_000.0
+    stamps = [t0 + i * 0.25 for i in range(n)]          # 4 ticks a second
+    prices, p, vol = [], 1000.0, 0.0
+    volumes = []
+    for _ in range(n):
+        p *= 1 + rng.gauss(0, 0.0005)
+        vol += rng.randint(0, 500)
+        prices.append(round(p, 2))
+        volumes.append(vol)
+
+    last_ltps = []
+    start = time.perf_counter()
+    for x in prices:
+        last_ltps.append(x)
+        if len(last_ltps) > 20:
+            last_ltps = last_ltps[-20:]
+    old = (time.perf_counter() - start) / n
+
+    ind = TickIndicators()
+    start = time.perf_counter()
+    for ts, x, v in zip(stamps, prices, volumes):
+        ind.update(x, ts, v)
+    new = (time.perf_counter() - start) / n
+    print(f"per tick: old LTP list {old * 1e6:.2f} us, streaming indicators {new * 1e6:.2f} us")
+
+    # the streaming values agree with batch computations over the same ticks
+    arr = np.array(prices)
+    assert math.isclose(ind.ema.value, indicators.ema(arr, EMA_PERIOD)[-1], rel_tol=1e-9)
+    traded = np.diff(np.concatenate([[0.0], volumes]))
+    assert math.isclose(ind.vwap.value, float((arr * traded).sum() / traded.sum()), rel_tol=1e-9)
+    recent = arr[np.array(stamps) > stamps[-1] - EXTREME_WINDOW_SEC]
+    assert ind.high.value == recent.max() and ind.low.value == recent.min()
+    buckets = (np.array(stamps) // BAR_SECONDS).astype(np.int64)
+    edges = np.flatnonzero(np.diff(buckets)) + 1
+    starts, ends = np.concatenate([[0], edges])[:-1], edges - 1   # completed bars only
+    highs = np.maximum.reduceat(arr[:edges[-1]], starts)
+    lows = np.minimum.reduceat(arr[:edges[-1]], starts)
+    assert math.isclose(ind.bars.atr, indicators.atr(highs, lows, arr[ends], ATR_PERIOD)[-1], rel_tol=1e-9)
+    print(f"{n} ticks, {len(ends)} one-minute bars: EMA, VWAP, rolling high/low and ATR match batch results")
@@ -0,0 +1,153 @@
+# symbol_index.py
+# One cached symbol index over master.csv shared by every page.
+# The file is parsed once per version (path, mtime, size); lookups by
+# (segment, symbol), (segment, tradingsymbol), token and ISIN are dict hits.
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from debug_utils import debug_log
+
+MASTER_PATH = "master.csv"
+
+# master.csv is tab separated with 15 columns; older files have 14 (no company)
+COLUMNS_15 = [
+    "segment", "token", "symbol", "tradingsymbol", "series", "unknown1",
+    "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
+    "isin", "unknown7", "company"
+]
+COLUMNS_14 = [
+    "segment", "token", "symbol", "tradingsymbol", "series", "isin1",
+    "facevalue", "lot", "something", "zero1", "two1", "one1", "isin", "one2"
+]
+INDEX_COLUMNS = ["segment", "token", "symbol", "tradingsymbol", "series", "isin", "company"]
+
+
+def _key(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value).strip().upper()
+
+
+class SymbolIndex:
+    """
+    Read-only view of the master file plus hash maps for O(1) lookups.
+    `frame` is shared between pages: filter/copy it, never modify it in place.
+    """
+    def __init__(self, frame: pd.DataFrame, version: Tuple = ()):
+        self.frame = frame
+        self.version = version
+        self._by_symbol: Dict[Tuple[str, str], int] = {}
+        self._by_symbol_any: Dict[str, int] = {}
+        self._by_tradingsymbol: Dict[Tuple[str, str], int] = {}
+        self._by_symbol_series: Dict[Tuple[str, str, str], int] = {}
+        self._by_tradingsymbol_series: Dict[Tuple[str, str, str], int] = {}
+        self._by_token: Dict[Tuple[str, str], int] = {}
+        self._by_token_any: Dict[str, int] = {}
+        self._by_isin: Dict[str, List[int]] = {}
+        self._build()
+
+    def _build(self):
+        cols = {c: self.frame[c].tolist() for c in INDEX_COLUMNS}
+        for i in range(len(self.frame)):
+            seg = _key(cols["segment"][i])
+            sym = _key(cols["symbol"][i])
+            tsym = _key(cols["tradingsymbol"][i])
+            series = _key(cols["series"][i])
+            token = _key(cols["token"][i])
+            isin = _key(cols["isin"][i])
+            # setdefault keeps the first row, matching the old `.iloc[0]` lookups
+            self._by_symbol.setdefault((seg, sym), i)
+            self._by_symbol_any.setdefault(sym, i)
+            self._by_tradingsymbol.setdefault((seg, tsym), i)
+            self._by_symbol_series.setdefault((seg, sym, series), i)
+            self._by_tradingsymbol_series.setdefault((seg, tsym, series), i)
+            self._by_token.setdefault((seg, token), i)
+            self._by_token_any.setdefault(token, i)
+            if isin.strip("-"):  # indices carry "----"
+                self._by_isin.setdefault(isin, []).append(i)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def row(self, i: Optional[int]) -> Optional[Dict]:
+        if i is None:
+            return None
+        return {c: self.frame.iat[i, self.frame.columns.get_loc(c)] for c in INDEX_COLUMNS}
+
+    def lookup_symbol(self, symbol, segment=None) -> Optional[Dict]:
+        if segment is None:
+            return self.row(self._by_symbol_any.get(_key(symbol)))
+        return self.row(self._by_symbol.get((_key(segment), _key(symbol))))
+
+    def lookup_tradingsymbol(self, tradingsymbol, segment) -> Optional[Dict]:
+        return self.row(self._by_tradingsymbol.get((_key(segment), _key(tradingsymbol))))
+
+    def lookup_token(self, token, segment=None) -> Optional[Dict]:
+        if segment is None:
+            return self.row(self._by_token_any.get(_key(token)))
+        return self.row(self._by_token.get((_key(segment), _key(token))))
+
+    def lookup_isin(self, isin, segment=None) -> List[Dict]:
+        rows = [self.row(i) for i in self._by_isin.get(_key(isin), [])]
+        if segment is not None:
+            rows = [r for r in rows if _key(r["segment"]) == _key(segment)]
+        return rows
+
+    def token_for(self, symbol, segment, series=None) -> Optional[str]:
+        """
+        Resolve a token from a symbol or tradingsymbol within a segment.
+        Without series: symbol match first, then tradingsymbol.
+        With series: prefer a row of that series, else the first symbol/tradingsymbol match.
+        """
+        seg, sym = _key(segment), _key(symbol)
+        if series is None:
+            i = self._by_symbol.get((seg, sym))
+            if i is None:
+                i = self._by_tradingsymbol.get((seg, sym))
+        else:
+            ser = _key(series)
+            hits = [self._by_symbol_series.get((seg, sym, ser)), self._by_tradingsymbol_series.get((seg, sym, ser))]
+            hits = [h for h in hits if h is not None]
+            if not hits:
+                hits = [self._by_symbol.get((seg, sym)), self._by_tradingsymbol.get((seg, sym))]
+                hits = [h for h in hits if h is not None]
+            i = min(hits) if hits else None
+        if i is None:
+            return None
+        return str(self.frame.iat[i, self.frame.columns.get_loc("token")])
+
+
+def read_master(path: str = MASTER_PATH) -> pd.DataFrame:
+    df = pd.read_csv(path, sep="\t", header=None, dtype=str, keep_default_na=False, na_values=[""])
+    df.columns = COLUMNS_15 if df.shape[1] == 15 else COLUMNS_14
+    if "company" not in df.columns:
+        df["company"] = ""
+    df = df[INDEX_COLUMNS]
+    for c in ["segment", "token", "symbol", "tradingsymbol"]:
+        df[c] = df[c].fillna("").str.strip()
+    return df.reset_index(drop=True)
+
+
+_indexes: Dict[str, SymbolIndex] = {}
+_lock = threading.Lock()
+
+
+def get_index(path: str = MASTER_PATH) -> SymbolIndex:
+    """
+    Shared SymbolIndex for `path`, rebuilt only when the file changes on disk.
+    """
+    st_ = os.stat(path)
+    version = (os.path.abspath(path), st_.st_mtime_ns, st_.st_size)
+    idx = _indexes.get(path)
+    if idx is not None and idx.version == version:
+        return idx
+    with _lock:
+        idx = _indexes.get(path)
+        if idx is None or idx.version != version:
+            idx = SymbolIndex(read_master(path), version)
+            _indexes[path] = idx
+            debug_log(f"Built symbol index for {path}: {len(idx)} rows")
+    return idx
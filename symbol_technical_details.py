@@ -1,80 +1,20 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
-import io
+from candle_provider import get_candles
+import indicator_cache
+import indicators
 from datetime import datetime, timedelta
-
-@st.cache_data
-def load_master():
-    df = pd.read_csv("master.csv", sep="\t", header=None)
-    df.columns = [
-        "segment", "token", "symbol", "symbol_series", "series", "unknown1",
-        "unknown2", "unknown3", "series2", "unknown4", "unknown5", "unknown6",
-        "isin", "unknown7", "company"
-    ]
-    return df[["segment", "token", "symbol", "symbol_series", "series", "company"]]
-
-def get_token(symbol, segment, series, master_df):
-    candidates = master_df[
-        (master_df['segment'].str.upper() == segment.upper()) &
-        ((master_df['symbol'].str.upper() == symbol.upper()) | (master_df['symbol_series'].str.upper() == symbol.upper()))
-    ]
-    if not candidates.empty:
-        row = candidates[candidates['series'].str.upper() == series.upper()]
-        if not row.empty:
-            return row.iloc[0]['token']
-        return candidates.iloc[0]['token']
-    return None
+from symbol_index import get_index
 
 def fetch_candles_definedge(segment, token, timeframe, from_dt, to_dt, api_key):
-    url = f"https://data.definedgesecurities.com/sds/history/{segment}/{token}/{timeframe}/{from_dt}/{to_dt}"
-    headers = {"Authorization": api_key}
-    resp = requests.get(url, headers=headers)
-    if resp.status_code != 200:
-        raise Exception(f"API error: {resp.status_code} {resp.text}")
-    cols = ["Dateandtime", "Open", "High", "Low", "Close", "Volume", "OI"]
-    df = pd.read_csv(io.StringIO(resp.text), header=None, names=cols)
-    df = df[df["Dateandtime"].notnull()]
-    df = df[df["Dateandtime"].astype(str).str.strip() != ""]
-    df["Date"] = pd.to_datetime(df["Dateandtime"], format="%d%m%Y%H%M", errors="coerce")
-    df = df.dropna(subset=["Date"])
-    for col in ["Open", "High", "Low", "Close", "Volume"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    return df
-
-def compute_ema(series, period):
-    return series.ewm(span=period, adjust=False).mean()
-
-def compute_rsi(series, period=14):
-    delta = series.diff()
-    gain = np.where(delta > 0, delta, 0)
-    loss = np.where(delta < 0, -delta, 0)
-    avg_gain = pd.Series(gain).rolling(window=period, min_periods=period).mean()
-    avg_loss = pd.Series(loss).rolling(window=period, min_periods=period).mean()
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return pd.Series(rsi, index=series.index)
+    return get_candles(segment, token, timeframe, from_dt, to_dt, api_key)
 
 def count_updays(df, window=15):
-    highs = df["High"].values
-    count = 0
-    for i in range(-window, 0):
-        if i - 1 < -len(highs):
-            continue
-        if highs[i] > highs[i-1]:
-            count += 1
-    return count
+    return int(indicators.up_days(df["High"], window)[-1]) if len(df) else 0
 
 def count_downdays(df, window=15):
-    lows = df["Low"].values
-    count = 0
-    for i in range(-window, 0):
-        if i - 1 < -len(lows):
-            continue
-        if lows[i] < lows[i-1]:
-            count += 1
-    return count
+    return int(indicators.down_days(df["Low"], window)[-1]) if len(df) else 0
 
 def get_time_range(days, endtime="1530"):
     to = datetime.now()
@@ -89,7 +29,8 @@ def show():
     st.header("Symbol Technical Details")
 
     api_key = st.secrets.get("integrate_api_session_key", "")
-    master_df = load_master()
+    symbols = get_index()
+    master_df = symbols.frame
 
     # Auto select: Segment, then Symbol, then Series
     col1, col2, col3 = st.columns(3)
@@ -114,7 +55,7 @@ def show():
             series = st.selectbox("Series", possible_series, index=0)
         st.caption("EMAs/RSI are for daily timeframe.")
 
-    token = get_token(symbol, segment, series, master_df)
+    token = symbols.token_for(symbol, segment, series)
     if not token:
         st.warning("Symbol-token mapping not found in master file. Try exact symbol or instrument code.")
         return
@@ -128,12 +69,12 @@ def show():
         st.error(f"Error fetching candles: {e}")
         return
 
-    daily["EMA20"] = compute_ema(daily["Close"], 20)
-    daily["EMA50"] = compute_ema(daily["Close"], 50)
-    daily["EMA200"] = compute_ema(daily["Close"], 200)
-    daily["RSI"] = compute_rsi(daily["Close"], 14)
-    week_df["RSI"] = compute_rsi(week_df["Close"], 14)
-    month_df["RSI"] = compute_rsi(month_df["Close"], 14)
+    daily["EMA20"] = indicator_cache.compute(daily, segment, token, "day", "ema", 20)
+    daily["EMA50"] = indicator_cache.compute(daily, segment, token, "day", "ema", 50)
+    daily["EMA200"] = indicator_cache.compute(daily, segment, token, "day", "ema", 200)
+    daily["RSI"] = indicator_cache.compute(daily, segment, token, "day", "rsi_sma", 14)
+    week_df["RSI"] = indicator_cache.compute(week_df, segment, token, "week", "rsi_sma", 14)
+    month_df["RSI"] = indicator_cache.compute(month_df, segment, token, "month", "rsi_sma", 14)
 
     ltp = daily["Close"].iloc[-1]
     ema20 = daily["EMA20"].iloc[-1]
@@ -14,10 +14,10 @@ from queue import Queue, Empty
 import streamlit as st
 import pandas as pd
 import numpy as np
-import requests
 
 import session_utils
-from utils import integrate_post
+from streaming_indicators import TickIndicators
+from utils import integrate_post, get_quotes_many
 
 # ========= CONFIG =========
 WS_TICK_EVENT_QUEUE_KEY = "tradebot_tick_queue"
@@ -72,19 +72,20 @@ def _parse_ws_key_to_quote_parts(ws_key: str) -> Tuple[str, str, bool]:
     is_token = code.isdigit()
     return exch, code, is_token
 
-def _get_ltp_via_rest(api_key: str, ws_key: str) -> float:
-    exch, code, is_token = _parse_ws_key_to_quote_parts(ws_key)
+def _get_ltps_via_rest(api_key: str, ws_keys: List[str]) -> Dict[str, float]:
+    """
+    Fetch LTPs for all ws_keys in one concurrent batch.
+    Keys whose quote failed are left out (never reported as LTP 0, which would trip the SL).
+    """
     # Definedge quotes endpoint accepts either token OR tradingsymbol (both variants exist in your codebase)
-    url = f"https://integrate.definedgesecurities.com/dart/v1/quotes/{exch}/{code}"
-    headers = {"Authorization": api_key}
-    try:
-        resp = requests.get(url, headers=headers, timeout=4)
-        if resp.status_code == 200:
-            data = resp.json()
-            return _safe_float(data.get("ltp", 0))
-    except Exception:
-        pass
-    return 0.0
+    parts = {k: _parse_ws_key_to_quote_parts(k)[:2] for k in ws_keys}
+    # SL/target checks need the price now: a cached quote could be up to a whole TTL old
+    quotes, _ = get_quotes_many(parts.values(), headers={"Authorization": api_key}, timeout=4, use_cache=False)
+    ltps = {}
+    for k, key in parts.items():
+        if key in quotes:
+            ltps[k] = _safe_float(quotes[key].get("ltp", 0))
+    return ltps
 
 
 # ========= Strategy / State Machine =========
@@ -109,7 +110,6 @@ class PositionState:
     achieved: int = 0
     remaining_qty: int = 0
     realized_pnl: float = 0.0
-    last_ltps: List[float] = field(default_factory=list)  # short history
     last_order_ids: List[str] = field(default_factory=list)
     closed: bool = False
 
@@ -119,7 +119,6 @@ class PositionState:
         self.remaining_qty = int(self.cfg.qty)
         self.achieved = 0
         self.realized_pnl = 0.0
-        self.last_ltps.clear()
         self.last_order_ids.clear()
         self.closed = False
 
@@ -193,6 +192,7 @@ class PortfolioEngine:
         self.dry_run = dry_run
         self.positions: Dict[str, PositionState] = {}  # keyed by ws_key
         self.ltps: Dict[str, float] = {}  # latest LTP per ws_key
+        self.indicators: Dict[str, TickIndicators] = {}  # streaming EMA/VWAP/high/low/ATR per ws_key
         self.order_book: List[Dict] = []  # simple audit trail
 
     def add_position(self, cfg: PositionConfig):
@@ -204,17 +204,22 @@ class PortfolioEngine:
     def get_state(self, ws_key: str) -> Optional[PositionState]:
         return self.positions.get(ws_key)
 
-    def on_tick(self, ws_key: str, ltp: float):
+    def get_indicators(self, ws_key: str) -> Optional[TickIndicators]:
+        return self.indicators.get(ws_key)
+
+    def on_tick(self, ws_key: str, ltp: float, volume: Optional[float] = None, ts: Optional[float] = None):
+        # volume: cumulative session volume from the feed, if the tick has one (for VWAP)
+        # ts: when the tick happened (epoch seconds); ticks are drained from the queue
+        # on a later rerun, so it must be taken on arrival, not here (now if None)
         self.ltps[ws_key] = ltp
+        ind = self.indicators.get(ws_key)
+        if ind is None:
+            ind = self.indicators[ws_key] = TickIndicators()
+        ind.update(ltp, ts=ts, cum_volume=volume)
         ps = self.positions.get(ws_key)
         if not ps or ps.closed or ps.remaining_qty <= 0:
             return
 
-        # Save a short history
-        ps.last_ltps.append(ltp)
-        if len(ps.last_ltps) > 20:
-            ps.last_ltps = ps.last_ltps[-20:]
-
         # 1) Stoploss check first
         if ltp <= ps.sl_price and ps.remaining_qty > 0:
             self._sell(ps, ps.remaining_qty, ltp, reason="STOPLOSS")
@@ -304,14 +309,20 @@ class PortfolioEngine:
         rows = []
         for ws_key, ps in self.positions.items():
             ltp = self.ltps.get(ws_key, 0.0)
-            rows.append(ps.to_row(ltp, self.total_capital))
+            row = ps.to_row(ltp, self.total_capital)
+            ind = self.indicators.get(ws_key)
+            snap = ind.snapshot() if ind else {}
+            row["EMA (ticks)"] = snap.get("ema", np.nan)
+            row["VWAP"] = snap.get("vwap", np.nan)
+            row["1m ATR"] = snap.get("atr", np.nan)
+            rows.append(row)
         if not rows:
             return pd.DataFrame()
         df = pd.DataFrame(rows)
         # Useful ordering
         cols = ["Name", "Exchange", "WS Key", "Tradingsymbol", "Entry", "Qty (rem)",
-                "SL%", "SL Price", "Targets", "LTP", "Next Trigger", "Planned Sell Qty",
-                "Open Risk (₹)", "Open Risk (%Cap)", "Locked-in @Stop (₹)",
+                "SL%", "SL Price", "Targets", "LTP", "EMA (ticks)", "VWAP", "1m ATR",
+                "Next Trigger", "Planned Sell Qty", "Open Risk (₹)", "Open Risk (%Cap)", "Locked-in @Stop (₹)",
                 "Realized P&L (₹)", "Achieved", "Closed"]
         return df[cols]
 
@@ -345,7 +356,12 @@ def _start_ws_if_needed(engine: PortfolioEngine, subscribe_keys: List[str]):
 
     def on_touchline(key, ltp, raw):
         try:
-            st.session_state[WS_TICK_EVENT_QUEUE_KEY].put((key, _safe_float(ltp)))
+            volume = raw.get("v") if isinstance(raw, dict) else None
+            # feed time of the tick when it carries one, else its arrival time
+            ts = _safe_float(raw.get("ft"), None) if isinstance(raw, dict) else None
+            st.session_state[WS_TICK_EVENT_QUEUE_KEY].put(
+                (key, _safe_float(ltp), _safe_float(volume, None) if volume is not None else None,
+                 ts or time.time()))
         except Exception:
             pass
 
@@ -363,8 +379,7 @@ def _run_polling_loop(engine: PortfolioEngine, ws_keys: List[str], stop_event: t
     """
     api_key = engine.api_session_key
     while not stop_event.is_set():
-        for k in ws_keys:
-            ltp = _get_ltp_via_rest(api_key, k)
+        for k, ltp in _get_ltps_via_rest(api_key, ws_keys).items():
             engine.on_tick(k, ltp)
         time.sleep(POLL_INTERVAL_SEC)
 
@@ -524,8 +539,8 @@ def app():
     processed = 0
     while True:
         try:
-            k, l = q.get_nowait()
-            engine.on_tick(k, l)
+            k, l, v, ts = q.get_nowait()
+            engine.on_tick(k, l, v, ts)
             processed += 1
         except Empty:
             break
@@ -559,7 +574,7 @@ def app():
         show_cols = [
             "Name","Exchange","WS Key","Tradingsymbol",
             "Entry","Qty (rem)","SL%","SL Price","Targets",
-            "LTP","Next Trigger","Planned Sell Qty",
+            "LTP","EMA (ticks)","VWAP","1m ATR","Next Trigger","Planned Sell Qty",
             "Open Risk (₹)","Open Risk (%Cap)","Locked-in @Stop (₹)",
             "Realized P&L (₹)","Achieved","Closed"
         ]
@@ -568,6 +583,7 @@ def app():
               .style.applymap(_pnl_style, subset=["Open Risk (₹)","Locked-in @Stop (₹)","Realized P&L (₹)"])
               .format({
                   "Entry":"{:.2f}","SL Price":"{:.2f}","LTP":"{:.2f}",
+                  "EMA (ticks)":"{:.2f}","VWAP":"{:.2f}","1m ATR":"{:.2f}",
                   "Open Risk (₹)":"{:.2f}","Open Risk (%Cap)":"{:.2f}",
                   "Locked-in @Stop (₹)":"{:.2f}","Realized P&L (₹)":"{:.2f}"
               }),
@@ -579,6 +595,7 @@ def app():
         st.markdown("""
 - **Remaining-qty rule**: each target sells `rem / remaining_targets`. Last leg sells all remaining (no fractional qty).
 - **Trailing SL**: start with initial SL%; after T1 → SL = Entry; after T2+ → SL = previous target price.
+- **Live indicators**: every tick also updates a tick EMA, session VWAP (when the feed sends volume), 15-min rolling high/low and a 1-minute-bar ATR per key (`engine.get_indicators(ws_key)`), without any history fetch.
 - **Gaps**: If price jumps across multiple targets, engine sells sequential legs in one tick loop (T1 then T2 ...).
 - **Partial fills**: This page assumes instant fill at LTP (dry-run). For live fills, subscribe to *order update WS* in `ws_utils` and adjust `record_fill()` with actual `avgprc/flqty`.
 - **REST fields**: SELL / MARKET / DAY / product=`CNC` by default. Adjust per your holdings (e.g., `NORMAL`/`INTRADAY`).
@@ -1,7 +1,22 @@
 import streamlit as st
-import requests
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Optional, Tuple
+import http_client
 from debug_utils import debug_log
+from response_cache import get_cache
+
+QUOTES_MAX_WORKERS = 8
+
+# Read endpoints served from the shared response cache: path prefix -> TTL seconds
+CACHE_TTLS = (
+    ("/holdings", 30),
+    ("/positions", 5),
+    ("/quotes/", 2),
+    ("/securityinfo/", 3600),
+)
+# Cached reads that change when an order is placed/modified/cancelled
+INVALIDATE_ON_POST = ("/holdings", "/positions", "/portfolio_snapshot")
 
 def get_session_headers():
     session = st.session_state.get("integrate_session")
@@ -13,24 +28,65 @@ def get_session_headers():
         "uid": session["uid"]
     }
 
-def integrate_get(path):
-    base_url = "https://integrate.definedgesecurities.com/dart/v1"
-    headers = get_session_headers()
-    url = base_url + path
+def _is_session_error(message):
+    return "session" in str(message or "").lower()
+
+def _drop_expired_session():
+    debug_log("Session expired error detected in API response.")
+    st.session_state.pop("integrate_session", None)
+    try:
+        os.remove("session.json")
+    except Exception:
+        pass
+
+def drop_session_on_expiry(messages):
+    """
+    Drop the stored session if any error message says it expired. Call from
+    the Streamlit thread after fetching with explicit headers.
+    """
+    if any(_is_session_error(m) for m in messages):
+        _drop_expired_session()
+
+def cache_ttl_for(path):
+    for prefix, ttl in CACHE_TTLS:
+        if path.startswith(prefix):
+            return ttl
+    return None
+
+def invalidate_cache(prefixes=None):
+    """
+    Drop cached read responses (all of them if prefixes is None).
+    """
+    get_cache().invalidate(prefixes)
+
+def integrate_get(path, use_cache=True, headers=None):
+    """
+    GET an Integrate endpoint, cached per CACHE_TTLS. headers default to the
+    logged-in session; pass them explicitly from a background thread.
+    """
+    from_session = headers is None
+    if from_session:
+        headers = get_session_headers()
+    ttl = cache_ttl_for(path) if use_cache else None
+    if ttl is None:
+        return _integrate_get(path, headers, from_session)
+    key = (headers.get("Authorization", ""), path)
+    return get_cache().get_or_fetch(
+        key, ttl, lambda: _integrate_get(path, headers, from_session),
+        should_cache=lambda d: isinstance(d, dict) and d.get("status") != "ERROR",
+    )
+
+def _integrate_get(path, headers, drop_expired=True):
+    url = http_client.INTEGRATE_BASE_URL + path
     debug_log(f"GET {url} with headers {headers}")
     try:
-        resp = requests.get(url, headers=headers, timeout=15)
+        resp = http_client.get(url, headers=headers, timeout=15)
         debug_log(f"GET response: {resp.status_code} - {resp.text}")
         resp.raise_for_status()
         try:
             data = resp.json()
-            if data.get("status") == "ERROR" and "session" in data.get("message", "").lower():
-                debug_log("Session expired error detected in API response.")
-                st.session_state.pop("integrate_session", None)
-                try:
-                    os.remove("session.json")
-                except Exception:
-                    pass
+            if drop_expired and data.get("status") == "ERROR" and _is_session_error(data.get("message", "")):
+                _drop_expired_session()
             return data
         except Exception:
             return {"status": "ERROR", "message": f"Non-JSON response: {resp.text}"}
@@ -39,26 +95,76 @@ def integrate_get(path):
         return {"status": "ERROR", "message": str(e)}
 
 def integrate_post(path, payload):
-    base_url = "https://integrate.definedgesecurities.com/dart/v1"
     headers = get_session_headers()
-    url = base_url + path
+    url = http_client.INTEGRATE_BASE_URL + path
     debug_log(f"POST {url} payload {payload} headers {headers}")
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=15)
+        resp = http_client.post(url, json=payload, headers=headers, timeout=15)
         debug_log(f"POST response: {resp.status_code} - {resp.text}")
         resp.raise_for_status()
         try:
             data = resp.json()
-            if data.get("status") == "ERROR" and "session" in data.get("message", "").lower():
-                debug_log("Session expired error detected in API response.")
-                st.session_state.pop("integrate_session", None)
-                try:
-                    os.remove("session.json")
-                except Exception:
-                    pass
+            if data.get("status") == "ERROR" and _is_session_error(data.get("message", "")):
+                _drop_expired_session()
             return data
         except Exception:
             return {"status": "ERROR", "message": f"Non-JSON response: {resp.text}"}
     except Exception as e:
         debug_log(f"POST error: {e}")
         return {"status": "ERROR", "message": str(e)}
+    finally:
+        # also after an error: a timed-out order may still have been accepted
+        get_cache().invalidate(INVALIDATE_ON_POST, account=headers.get("Authorization", ""))
+
+def _fetch_quote(exchange, token, headers, timeout, use_cache=True):
+    path = f"/quotes/{exchange}/{token}"
+    if not use_cache:
+        return _fetch_quote_uncached(path, headers, timeout)
+    key = (headers.get("Authorization", ""), path)
+    return get_cache().get_or_fetch(
+        key, cache_ttl_for(path), lambda: _fetch_quote_uncached(path, headers, timeout)
+    )
+
+def _fetch_quote_uncached(path, headers, timeout):
+    url = http_client.INTEGRATE_BASE_URL + path
+    resp = http_client.get(url, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("status") == "ERROR":
+        raise RuntimeError(data.get("message", "ERROR"))
+    return data
+
+def get_quotes_many(keys: Iterable[Tuple[str, str]], max_workers: int = QUOTES_MAX_WORKERS,
+                    headers: Optional[Dict[str, str]] = None,
+                    timeout: float = 5,
+                    use_cache: bool = True) -> Tuple[Dict[Tuple[str, str], dict], Dict[Tuple[str, str], str]]:
+    """
+    Fetch /quotes/{exchange}/{token} for many (exchange, token) keys concurrently,
+    with at most max_workers requests in flight.
+    Returns (results, errors): quote dict per key, and an error message per failed key.
+    headers default to the logged-in session; pass them explicitly when calling
+    from a background thread (no Streamlit session there). use_cache=False
+    always asks the broker, for callers that poll faster than the quote TTL.
+    """
+    unique = list(dict.fromkeys((str(e), str(t)) for e, t in keys if e and t))
+    results: Dict[Tuple[str, str], dict] = {}
+    errors: Dict[Tuple[str, str], str] = {}
+    if not unique:
+        return results, errors
+    from_session = headers is None
+    if from_session:
+        headers = get_session_headers()
+    debug_log(f"get_quotes_many: {len(unique)} keys, max_workers={max_workers}")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+        futures = {pool.submit(_fetch_quote, e, t, headers, timeout, use_cache): (e, t) for e, t in unique}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                results[key] = fut.result()
+            except Exception as e:
+                errors[key] = str(e)
+    if errors:
+        debug_log(f"get_quotes_many errors: {errors}")
+        if from_session and any(_is_session_error(m) for m in errors.values()):
+            _drop_expired_session()
+    return results, errors